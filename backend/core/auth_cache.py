@@ -0,0 +1,185 @@
+"""
+🪪 Auth + tenant caches for core/deps
+- Verified Supabase JWTs are checked locally (project JWKS, or the legacy
+  HS256 secret) and cached until min(exp, TTL); Supabase Auth is only
+  called when no local key is available.
+- user_id -> profile/tenant mappings live in a TTL LRU. Membership and
+  role changes are made outside this app (no endpoint writes tenant_users
+  for existing users), so a change applies within AUTH_IDENTITY_TTL_S.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import time
+
+from jose import jwt
+from jose.exceptions import JOSEError
+
+from core.config import settings
+from core.http import http_clients
+
+JWKS_PATH = "/auth/v1/.well-known/jwks.json"
+JWT_AUDIENCE = "authenticated"
+# Unknown `kid` forces a JWKS refetch at most this often (key rotation)
+JWKS_MIN_REFRESH_S = 60.0
+# Algorithm for JWKs that do not declare `alg`, by key type
+KTY_ALGORITHMS = {"RSA": "RS256", "EC": "ES256"}
+
+
+class InvalidToken(Exception):
+    """Token failed local verification (bad signature, expired, wrong audience)."""
+
+
+class TTLCache:
+    """Small LRU where every entry carries its own expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._entries.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: str, value: Any, ttl_s: float) -> None:
+        if ttl_s <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def items(self):
+        now = time.monotonic()
+        return [(key, value) for key, (expires, value) in self._entries.items() if expires > now]
+
+    def snapshot(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class JWKSVerifier:
+    """Local signature verification against the project's JWKS."""
+
+    def __init__(self):
+        self._keys: Dict[str, Dict] = {}
+        self._fetched_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _url(self) -> str:
+        return settings.supabase_url.rstrip("/") + JWKS_PATH
+
+    async def _refresh(self, force: bool = False) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if age < (JWKS_MIN_REFRESH_S if force else settings.auth_jwks_ttl_s):
+                return
+            self._fetched_at = time.monotonic()
+            try:
+                response = await http_clients.get("supabase").get(
+                    self._url(), headers={"apikey": settings.supabase_anon_key or settings.supabase_service_role_key}
+                )
+                response.raise_for_status()
+                keys = response.json().get("keys") or []
+                self._keys = {key["kid"]: key for key in keys if key.get("kid")}
+            except Exception as e:
+                print(f"[Auth] JWKS fetch failed: {e}")
+
+    async def _key_for(self, header: Dict) -> Optional[Tuple[Any, str]]:
+        """(key, algorithm pinned by the key), or None if no key is available.
+
+        The algorithm comes from our side (HS256 for the secret, the JWK's
+        `alg`/`kty`), never from the unverified header.
+        """
+        if header.get("alg") == "HS256":
+            return (settings.supabase_jwt_secret, "HS256") if settings.supabase_jwt_secret else None
+        if not settings.supabase_url:
+            return None
+        kid = header.get("kid")
+        await self._refresh()
+        if kid not in self._keys:
+            await self._refresh(force=True)
+        key = self._keys.get(kid)
+        if key is None:
+            return None
+        algorithm = key.get("alg") or KTY_ALGORITHMS.get(key.get("kty", ""))
+        if not algorithm:
+            raise InvalidToken(f"unsupported key type {key.get('kty')!r}")
+        return key, algorithm
+
+    async def verify(self, token: str) -> Optional[Dict]:
+        """Claims of a locally verified token, or None if no key is available."""
+        try:
+            header = jwt.get_unverified_header(token)
+        except JOSEError as e:
+            raise InvalidToken(str(e)) from e
+        found = await self._key_for(header)
+        if found is None:
+            return None
+        key, algorithm = found
+        if header.get("alg") != algorithm:
+            raise InvalidToken(f"token alg {header.get('alg')!r} does not match key ({algorithm})")
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=JWT_AUDIENCE,
+                options={"verify_at_hash": False},
+            )
+        except JOSEError as e:
+            raise InvalidToken(str(e)) from e
+
+
+def token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def token_ttl_s(claims: Optional[Dict]) -> float:
+    """Cache a verified token until it expires, capped by AUTH_TOKEN_CACHE_TTL_S."""
+    ttl = settings.auth_token_cache_ttl_s
+    exp = (claims or {}).get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = min(ttl, exp - time.time())
+    return ttl
+
+
+class IdentityCache:
+    """user_id -> {"profile": ..., "tenant": ...}; entries go stale for at most AUTH_IDENTITY_TTL_S."""
+
+    def __init__(self, max_entries: int):
+        self._cache = TTLCache(max_entries)
+
+    def get(self, user_id: str, field: str) -> Optional[Dict]:
+        entry = self._cache.get(str(user_id))
+        return entry.get(field) if entry else None
+
+    def set(self, user_id: str, field: str, value: Dict) -> None:
+        entry = self._cache.get(str(user_id)) or {}
+        entry[field] = value
+        self._cache.set(str(user_id), entry, settings.auth_identity_ttl_s)
+
+    def snapshot(self) -> Dict:
+        return self._cache.snapshot()
+
+
+# Singletons
+jwks_verifier = JWKSVerifier()
+token_cache = TTLCache(max_entries=settings.auth_cache_max_entries)
+identity_cache = IdentityCache(max_entries=settings.auth_cache_max_entries)
@@ -33,6 +33,24 @@ class Settings(BaseSettings):
     supabase_service_role_key: str = ""
     supabase_anon_key: str = ""
     supabase_storage_bucket: str = "knowledge"
+    # Pool de threads + conexiones HTTP compartidas para supabase-py (cliente síncrono)
+    supabase_max_workers: int = 16
+    supabase_max_connections: int = 32
+    supabase_timeout_s: float = 20.0
+    # JWT legacy (HS256); con claves asimétricas se usa el JWKS del proyecto
+    supabase_jwt_secret: str = ""
+    auth_token_cache_ttl_s: float = 300.0
+    auth_jwks_ttl_s: float = 3600.0
+    auth_identity_ttl_s: float = 60.0  # tope de lo que tarda en aplicarse un cambio de membresía/rol
+    auth_cache_max_entries: int = 10000
+    # Caché de remitentes de webhooks (phone / telegram_id -> perfil)
+    identity_cache_ttl_s: float = 300.0
+    identity_negative_ttl_s: float = 60.0
+    identity_cache_max_entries: int = 10000
+
+    # Caché de contexto reciente por usuario (invalidada en add_message)
+    recent_context_cache_ttl_s: float = 60.0
+    recent_context_cache_max_entries: int = 5000
     
     # --- AI Providers (Pool Founder: GROQ + Gemini + Mistral) ---
     gemini_api_key: str = ""
@@ -40,6 +58,15 @@ class Settings(BaseSettings):
     groq_api_key: str = ""
     deepseek_api_key: str = ""
 
+    # --- Routing (failover, circuit breakers, hedging) ---
+    llm_max_attempts: int = 3
+    llm_breaker_failures: int = 5
+    llm_breaker_cooldown_s: float = 30.0
+    llm_hedge_enabled: bool = False
+
+    # --- Prompt budget (contexto del orquestador, tokens estimados) ---
+    prompt_budget_tokens: int = 6000
+
     # --- Research ---
     tavily_api_key: str = ""
     
@@ -102,6 +129,103 @@ class Settings(BaseSettings):
 
     # --- Upload Limits ---
     max_upload_mb: int = 25
+
+    # --- Extracción de documentos (process pool; PDF por rangos de páginas) ---
+    ingestion_workers: int = 2
+    ingestion_pages_per_task: int = 8
+    ingestion_max_pages: int = 500
+    ingestion_timeout_s: float = 120.0
+
+    # --- Chunking (fixed | token | sentence | paragraph | structure) ---
+    chunking_strategy: str = "structure"
+    chunking_max_tokens: int = 240
+    chunking_overlap_tokens: int = 30
+    # JSON {"<tenant_id>": {"strategy": ..., "max_tokens": ..., "overlap_tokens": ...}}
+    chunking_tenant_config_raw: str = Field("", validation_alias="CHUNKING_TENANT_CONFIG")
+
+    @property
+    def chunking_tenant_config(self) -> dict[str, dict]:
+        try:
+            return json.loads(self.chunking_tenant_config_raw) if self.chunking_tenant_config_raw else {}
+        except:
+            return {}
+
+    # --- Knowledge search (vector | hybrid = full-text + vector con RRF) ---
+    knowledge_search_mode: Literal["vector", "hybrid"] = "hybrid"
+    knowledge_rerank: bool = True
+    knowledge_vector_weight: float = 1.0
+    knowledge_grounding_enabled: bool = True  # el orquestador consulta la base del tenant
+    knowledge_context_chunks: int = 4
+
+    # --- Embedding Cache (LRU en proceso + tabla embedding_cache) ---
+    embedding_cache_mb: int = 64
+    embedding_cache_persist: bool = True
+
+    # --- Completion Cache (opt-in; por tenant) ---
+    completion_cache_enabled: bool = False
+    completion_cache_semantic: bool = True
+    completion_cache_similarity: float = 0.95
+    completion_cache_ttl_s: float = 3600.0
+    completion_cache_max_entries: int = 500  # por tenant
+    completion_cache_max_temperature: float = 0.8
+    # JSON {"<tenant_id>": ttl_s}; 0 desactiva la caché para ese tenant
+    completion_cache_tenant_ttls_raw: str = Field("", validation_alias="COMPLETION_CACHE_TENANT_TTLS")
+
+    @property
+    def completion_cache_tenant_ttls(self) -> dict[str, float]:
+        try:
+            return json.loads(self.completion_cache_tenant_ttls_raw) if self.completion_cache_tenant_ttls_raw else {}
+        except:
+            return {}
+
+    # --- Outbound HTTP (pools compartidos por proveedor) ---
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry_s: float = 30.0
+
+    # --- Background Jobs ---
+    jobs_concurrency: int = 4
+    jobs_poll_interval_s: float = 2.0
+    jobs_max_attempts: int = 5
+    jobs_backoff_base_s: float = 5.0
+    jobs_heartbeat_s: float = 60.0
+    jobs_stale_after_s: int = 600  # sin heartbeat durante este tiempo, otro worker la reclama
+    jobs_retention_days: float = 7.0  # jobs terminados (succeeded/failed) se borran después
+    jobs_purge_interval_s: float = 3600.0
+    jobs_shutdown_grace_s: float = 10.0
+    summarizer_interval_hours: float = 1.0
+
+    # --- Chat task state (SSE) ---
+    # auto: postgres si Supabase está configurado (varios workers/réplicas), si no memory
+    task_store: Literal["auto", "memory", "postgres"] = "auto"
+    task_ttl_s: float = 600.0
+    # Ring buffer por stream para reconexión con Last-Event-ID
+    stream_buffer_events: int = 2000
+    stream_retention_s: float = 120.0
+
+    # --- Webhooks (ACK inmediato + workers por remitente) ---
+    webhook_workers: int = 8
+    webhook_dedupe_cache_size: int = 10000
+    # Eventos sin heartbeat de su worker durante este tiempo los reclama otra réplica
+    webhook_lock_stale_s: int = 120
+    webhook_recovery_interval_s: float = 30.0  # heartbeat + barrido de eventos abandonados
+    webhook_max_attempts: int = 3
+    # Ráfagas de WhatsApp del mismo remitente -> un solo turno
+    whatsapp_coalesce_window_s: float = 1.5
+    whatsapp_coalesce_max_wait_s: float = 4.0
+    whatsapp_coalesce_max_messages: int = 10
+
+    # --- Outbound (token buckets: global por canal + por chat) ---
+    # Cloud API: ~80 msg/s por número; pair rate ~1 msg/6s con ráfagas
+    outbound_whatsapp_rps: float = 80.0
+    outbound_whatsapp_chat_rps: float = 0.17
+    outbound_whatsapp_chat_burst: int = 10
+    # Bot API: ~30 msg/s global, ~1 msg/s por chat
+    outbound_telegram_rps: float = 30.0
+    outbound_telegram_chat_rps: float = 1.0
+    outbound_telegram_chat_burst: int = 3
+    outbound_max_retries: int = 3
+    outbound_backoff_base_s: float = 2.0
     
     # --- Google Workspace ---
     google_client_id: str = ""
@@ -9,7 +9,15 @@ from typing import Dict, Optional
 from fastapi import Header, HTTPException, Request, Depends
 
 from core.config import settings
-from core.supabase import get_supabase_admin
+from core.supabase import get_supabase_admin, db_execute, run_blocking
+from core.auth_cache import (
+    InvalidToken,
+    identity_cache,
+    jwks_verifier,
+    token_cache,
+    token_cache_key,
+    token_ttl_s,
+)
 from services.identity import identity_service
 
 
@@ -27,17 +35,32 @@ async def get_current_user(
         return request.state.current_user
 
     token = _extract_token(authorization)
-    admin = get_supabase_admin()
+    cache_key = token_cache_key(token)
+    cached = token_cache.get(cache_key)
+    if cached is not None:
+        request.state.current_user = cached
+        return cached
+
     try:
-        user_resp = admin.auth.get_user(token)
-    except Exception:
+        claims = await jwks_verifier.verify(token)
+    except InvalidToken:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user_obj = getattr(user_resp, "user", None) or getattr(user_resp, "data", None) or user_resp
-    user = getattr(user_obj, "user", None) or user_obj
+    if claims is not None:
+        user_id, email = claims.get("sub"), claims.get("email")
+    else:
+        # No local key (e.g. JWKS unreachable): ask Supabase Auth
+        admin = get_supabase_admin()
+        try:
+            user_resp = await run_blocking(admin.auth.get_user, token)
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        user_obj = getattr(user_resp, "user", None) or getattr(user_resp, "data", None) or user_resp
+        user = getattr(user_obj, "user", None) or user_obj
 
-    user_id = getattr(user, "id", None) or user.get("id") if isinstance(user, dict) else None
-    email = getattr(user, "email", None) or user.get("email") if isinstance(user, dict) else None
+        user_id = getattr(user, "id", None) or user.get("id") if isinstance(user, dict) else None
+        email = getattr(user, "email", None) or user.get("email") if isinstance(user, dict) else None
 
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token payload")
@@ -59,8 +82,11 @@ async def get_current_user(
             )
 
     # Ensure profile exists for auth user
-    await identity_service.ensure_profile_from_auth(current_user)
+    if identity_cache.get(user_id, "profile") is None:
+        profile = await identity_service.ensure_profile_from_auth(current_user)
+        identity_cache.set(user_id, "profile", profile)
 
+    token_cache.set(cache_key, current_user, token_ttl_s(claims))
     request.state.current_user = current_user
     return current_user
 
@@ -72,33 +98,37 @@ async def get_current_tenant(
     if hasattr(request.state, "current_tenant"):
         return request.state.current_tenant
 
-    admin = get_supabase_admin()
     user_id = current_user["id"]
+    cached = identity_cache.get(user_id, "tenant")
+    if cached is not None:
+        request.state.current_tenant = cached
+        return cached
 
+    admin = get_supabase_admin()
     try:
-        existing = admin.table("tenant_users").select("tenant_id,role").eq("user_id", user_id).limit(1).execute()
+        existing = await db_execute(admin.table("tenant_users").select("tenant_id,role").eq("user_id", user_id).limit(1))
     except Exception as exc:
         raise HTTPException(status_code=500, detail="Tenant lookup failed") from exc
 
     if existing and getattr(existing, "data", None):
         tenant_id = existing.data[0]["tenant_id"]
         role = existing.data[0].get("role", "owner")
-        tenant_resp = admin.table("tenants").select("id,name,owner_user_id").eq("id", tenant_id).limit(1).execute()
+        tenant_resp = await db_execute(admin.table("tenants").select("id,name,owner_user_id").eq("id", tenant_id).limit(1))
         tenant = tenant_resp.data[0] if tenant_resp and tenant_resp.data else {"id": tenant_id, "name": "Tenant"}
     else:
         tenant_name = (current_user.get("email") or "Aureon").split("@")[0]
-        tenant_insert = admin.table("tenants").insert({
+        tenant_insert = await db_execute(admin.table("tenants").insert({
             "name": tenant_name,
             "owner_user_id": user_id,
-        }).execute()
+        }))
         tenant = tenant_insert.data[0]
         tenant_id = tenant["id"]
         role = "owner"
-        admin.table("tenant_users").insert({
+        await db_execute(admin.table("tenant_users").insert({
             "tenant_id": tenant_id,
             "user_id": user_id,
             "role": role,
-        }).execute()
+        }))
 
     current_tenant = {
         "id": tenant_id,
@@ -106,5 +136,6 @@ async def get_current_tenant(
         "role": role,
     }
 
+    identity_cache.set(user_id, "tenant", current_tenant)
     request.state.current_tenant = current_tenant
     return current_tenant
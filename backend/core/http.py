@@ -0,0 +1,69 @@
+"""
+🌐 Shared outbound HTTP clients
+One long-lived httpx.AsyncClient per provider host: keep-alive pools,
+HTTP/2 when `h2` is installed, opened/closed by the FastAPI lifespan.
+"""
+from __future__ import annotations
+
+from typing import Dict
+
+import httpx
+
+from core.config import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# name -> default timeout (seconds); requests may still override per call
+CLIENT_PROFILES: Dict[str, float] = {
+    "groq": 60,
+    "mistral": 60,
+    "deepseek": 60,
+    "gemini": 60,
+    "tavily": 30,
+    "whatsapp": 30,
+    "telegram": 30,
+    "supabase": 10,
+}
+
+
+class HTTPClientRegistry:
+    """Named, pooled AsyncClients shared by every service."""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=CLIENT_PROFILES.get(name, 30),
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive,
+                keepalive_expiry=settings.http_keepalive_expiry_s,
+            ),
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build(name)
+            self._clients[name] = client
+        return client
+
+    async def start(self) -> None:
+        """Open every profile up front so the first request skips setup."""
+        for name in CLIENT_PROFILES:
+            self.get(name)
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+# Singleton
+http_clients = HTTPClientRegistry()
@@ -1,29 +1,75 @@
 """
 🧩 Supabase Client Factory
 Admin + user-scoped clients with caching.
+
+supabase-py's client is synchronous: every `.execute()` is a blocking HTTP
+round-trip. Use `db_execute` / `run_blocking` from async code so the call runs
+on a bounded thread pool instead of stalling the event loop. All clients share
+one pooled, keep-alive httpx transport.
 """
 from __future__ import annotations
 
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import Optional
+from typing import Any, Callable, Optional, TypeVar
 
+import httpx
 from supabase import Client, create_client
 
 from core.config import settings
 
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.supabase_max_workers,
+            thread_name_prefix="supabase",
+        )
+    return _executor
+
+
+@lru_cache()
+def get_http_client() -> httpx.Client:
+    """Shared sync transport for PostgREST, Auth and Storage (thread-safe)."""
+    return httpx.Client(
+        timeout=settings.supabase_timeout_s,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=settings.supabase_max_connections,
+            max_keepalive_connections=settings.supabase_max_workers,
+        ),
+    )
+
+
+def _create_client(url: str, key: str) -> Client:
+    try:
+        from supabase.lib.client_options import SyncClientOptions
+        options = SyncClientOptions(httpx_client=get_http_client())
+    except (ImportError, TypeError):
+        # Older supabase-py: no injectable transport, each client keeps its own session
+        return create_client(url, key)
+    return create_client(url, key, options=options)
+
 
 @lru_cache()
 def get_supabase_admin() -> Client:
     if not settings.supabase_url or not settings.supabase_service_role_key:
         raise RuntimeError("Supabase admin credentials not configured")
-    return create_client(settings.supabase_url, settings.supabase_service_role_key)
+    return _create_client(settings.supabase_url, settings.supabase_service_role_key)
 
 
 @lru_cache()
 def get_supabase_anon() -> Client:
     if not settings.supabase_url or not settings.supabase_anon_key:
         raise RuntimeError("Supabase anon credentials not configured")
-    return create_client(settings.supabase_url, settings.supabase_anon_key)
+    return _create_client(settings.supabase_url, settings.supabase_anon_key)
 
 
 def get_supabase_user(access_token: str) -> Client:
@@ -38,3 +84,31 @@ def get_supabase_user(access_token: str) -> Client:
         except Exception:
             pass
     return client
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking supabase-py call (auth, storage, ...) on the DB pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def db_execute(query: Any) -> Any:
+    """Await a PostgREST table/RPC builder without blocking the event loop.
+
+    Builders are lazy, so compose them on the loop and only `.execute()` runs
+    in the pool: `res = await db_execute(admin.table("x").select("*"))`.
+    """
+    return await run_blocking(query.execute)
+
+
+def shutdown() -> None:
+    """Release the DB pool and pooled connections (FastAPI lifespan)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if get_http_client.cache_info().currsize:
+        get_http_client().close()
+        get_http_client.cache_clear()
+    get_supabase_admin.cache_clear()
+    get_supabase_anon.cache_clear()
@@ -1,7 +1,7 @@
 # 🌌 Auréon Quantum - Nucleo de Orquestación y Multi-tenencia
 from contextlib import asynccontextmanager
-from typing import Optional, List, Dict
-from fastapi import FastAPI, Request, HTTPException, Depends, UploadFile, File, Query
+from typing import Literal, Optional, List, Dict
+from fastapi import FastAPI, Request, HTTPException, Depends, Header, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
@@ -17,8 +17,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import Cortex services
 from core.config import settings
-from core.supabase import get_supabase_admin
+from core.supabase import get_supabase_admin, db_execute, shutdown as shutdown_supabase
 from core.security import encrypt_secret
+from core.http import http_clients
 from core.deps import get_current_user, get_current_tenant
 from services.orchestrator import orchestrator
 from services.nanoaureon import nano_fleet, NanoType
@@ -27,8 +28,17 @@ from services.telegram import telegram_service
 from services.identity import identity_service
 from services.memory import memory_service
 from services.research import research_service
-from services.ingestion import ingestion_service
-from services.embeddings import generate_embedding
+from services.knowledge import knowledge_service
+from services.ingestion import ingestion_service, spool_upload, UploadTooLarge
+from services.extraction import ExtractionTimeout, shutdown as shutdown_extraction
+from services.embedding_cache import embedding_cache
+from services.completion_cache import completion_cache
+from services.routing import provider_router
+from services.jobs import job_queue
+from services.webhooks import inbound_dispatcher
+from services.task_store import task_manager
+from services.streams import TaskStream, stream_hub, format_event_id, parse_event_id
+from services.summarizer import summarizer_service
 
 
 @asynccontextmanager
@@ -47,8 +57,20 @@ async def lifespan(app: FastAPI):
     print(f"   NanoAureons: {len(nano_fleet.list_all())}")
     print(f"   WhatsApp: {'✓' if settings.whatsapp_api_token else '✗'}")
     print(f"   Telegram: {'✓' if settings.telegram_bot_token else '✗'}")
+    await http_clients.start()
+    if settings.supabase_url and settings.supabase_service_role_key:
+        await job_queue.start()
+        await summarizer_service.start(interval_hours=settings.summarizer_interval_hours)
+        await inbound_dispatcher.start()
+        print(f"   Jobs: {settings.jobs_concurrency} workers ({job_queue.worker_id})")
     yield
     print("🌀 Aureon Cortex cerrando...")
+    await inbound_dispatcher.stop()
+    await summarizer_service.stop()
+    await job_queue.stop()
+    await http_clients.aclose()
+    shutdown_supabase()
+    shutdown_extraction()
 
 
 app = FastAPI(
@@ -132,11 +154,7 @@ class IntegrationRequest(BaseModel):
 
 
 async def resolve_tenant_for_user(user_id: str) -> Optional[str]:
-    admin = get_supabase_admin()
-    res = admin.table("tenant_users").select("tenant_id").eq("user_id", user_id).limit(1).execute()
-    if res and res.data:
-        return res.data[0]["tenant_id"]
-    return None
+    return await identity_service.resolve_tenant(user_id)
 
 
 # ============================================================================
@@ -216,64 +234,6 @@ async def update_consciousness(update: SystemUpdate):
 # CHAT & ORCHESTRATOR (with SSE Streaming)
 # ============================================================================
 
-# Task Manager for SSE streaming
-class TaskManager:
-    """Manages in-flight tasks for SSE streaming."""
-    
-    def __init__(self):
-        self.tasks: Dict[str, Dict] = {}
-    
-    def create_task(self, task_id: str, message: str) -> Dict:
-        """Create a new task with initial steps."""
-        self.tasks[task_id] = {
-            "id": task_id,
-            "message": message,
-            "status": "active",
-            "steps": [
-                {"number": 1, "description": "Analizando mensaje", "status": "active", "result": None},
-                {"number": 2, "description": "Procesando contexto", "status": "pending", "result": None},
-                {"number": 3, "description": "Generando respuesta", "status": "pending", "result": None},
-            ],
-            "current_step": 0,
-            "created_at": datetime.now().isoformat(),
-            "response": None
-        }
-        return self.tasks[task_id]
-    
-    def update_step(self, task_id: str, step_number: int, status: str, result: str = None):
-        """Update a specific step's status."""
-        if task_id in self.tasks:
-            for step in self.tasks[task_id]["steps"]:
-                if step["number"] == step_number:
-                    step["status"] = status
-                    if result:
-                        step["result"] = result
-                    break
-            self.tasks[task_id]["current_step"] = step_number
-    
-    def complete_task(self, task_id: str, response: str, card: Dict = None):
-        """Mark task as complete with response."""
-        if task_id in self.tasks:
-            self.tasks[task_id]["status"] = "complete"
-            self.tasks[task_id]["response"] = response
-            self.tasks[task_id]["card"] = card
-            for step in self.tasks[task_id]["steps"]:
-                if step["status"] != "complete":
-                    step["status"] = "complete"
-    
-    def get_task(self, task_id: str) -> Dict:
-        """Get task by ID."""
-        return self.tasks.get(task_id)
-    
-    def cleanup(self, task_id: str):
-        """Remove completed task."""
-        if task_id in self.tasks:
-            del self.tasks[task_id]
-
-
-task_manager = TaskManager()
-
-
 class ChatStreamRequest(BaseModel):
     message: str
     channel: str = "pwa"
@@ -281,78 +241,143 @@ class ChatStreamRequest(BaseModel):
     conversation_id: Optional[str] = None
 
 
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+
+async def produce_chat_stream(stream: TaskStream, message) -> None:
+    """Run one chat turn, publishing progress/deltas into `stream` (no connection attached)."""
+    task_id = stream.task_id
+    try:
+        # Step 1: Analyzing
+        task_manager.update_step(task_id, 1, "active")
+        await stream.publish({'type': 'step', 'step': 1, 'status': 'active', 'description': 'Analizando mensaje'})
+        task_manager.update_step(task_id, 1, "complete", "Mensaje parseado")
+        await stream.publish({'type': 'step', 'step': 1, 'status': 'complete', 'result': 'Mensaje parseado'})
+
+        # Step 2: Context
+        task_manager.update_step(task_id, 2, "active")
+        await stream.publish({'type': 'step', 'step': 2, 'status': 'active', 'description': 'Procesando contexto'})
+
+        async for event in orchestrator.process_stream(message):
+            if event["type"] == "context":
+                task_manager.update_step(task_id, 2, "complete", "Contexto cargado")
+                await stream.publish({'type': 'step', 'step': 2, 'status': 'complete', 'result': 'Contexto cargado', 'stage_timings_ms': event['stage_timings_ms'], 'prompt_tokens': event['prompt_tokens']})
+
+                # Step 3: Generating response (token deltas)
+                task_manager.update_step(task_id, 3, "active")
+                await stream.publish({'type': 'step', 'step': 3, 'status': 'active', 'description': 'Generando respuesta'})
+            elif event["type"] == "delta":
+                await stream.publish({'type': 'delta', 'content': event['content']})
+            elif event["type"] == "done":
+                response = event["response"]
+                task_manager.update_step(task_id, 3, "complete", "Respuesta lista")
+                await stream.publish({'type': 'step', 'step': 3, 'status': 'complete', 'result': 'Respuesta lista'})
+
+                # Final response
+                task_manager.complete_task(task_id, response.content, response.card)
+                await stream.publish({'type': 'complete', 'response': response.content, 'card': response.card, 'citations': response.citations, 'user_id': response.user_id, 'user_name': response.user_name, 'conversation_id': response.conversation_id, 'processing_time_ms': response.processing_time_ms, 'stage_timings_ms': response.stage_timings_ms, 'prompt_tokens': response.prompt_tokens})
+
+    except Exception as e:
+        task_manager.fail_task(task_id, str(e))
+        await stream.publish({'type': 'error', 'message': str(e)})
+    finally:
+        # State stays readable from any worker until it expires (TASK_TTL_S)
+        task_manager.release(task_id)
+
+
+async def sse_follow(stream: TaskStream, after_seq: int = 0):
+    async for seq, event in stream.follow(after_seq):
+        yield f"id: {format_event_id(stream.task_id, seq)}\ndata: {json.dumps(event)}\n\n"
+
+
+async def resume_chat_stream(task_id: str, after_seq: int, current_user: Dict) -> StreamingResponse:
+    """Attach to an in-flight (or recently finished) task instead of starting a new turn."""
+    stream = stream_hub.get(task_id)
+    if stream is not None:
+        if str(stream.user_id) != str(current_user["id"]):
+            raise HTTPException(status_code=404, detail="Task not found")
+        return StreamingResponse(
+            sse_follow(stream, after_seq),
+            media_type="text/event-stream",
+            headers={**SSE_HEADERS, "X-Task-Id": task_id},
+        )
+
+    # Not on this worker: answer from the shared task store
+    task = await task_manager.get_task(task_id)
+    if not task or (task.get("user_id") and str(task["user_id"]) != str(current_user["id"])):
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task["status"] == "active":
+        raise HTTPException(status_code=409, detail="Task is running on another worker; poll /api/v1/task/{task_id}")
+    if task["status"] == "complete":
+        final = {'type': 'complete', 'response': task.get("response"), 'card': task.get("card")}
+    else:
+        final = {'type': 'error', 'message': task.get("error") or f"Task {task['status']}"}
+
+    async def replay():
+        yield f"id: {format_event_id(task_id, after_seq + 1)}\ndata: {json.dumps(final)}\n\n"
+
+    return StreamingResponse(replay(), media_type="text/event-stream", headers={**SSE_HEADERS, "X-Task-Id": task_id})
+
+
 @app.post("/api/v1/chat/stream")
 async def chat_stream(
     request: ChatStreamRequest,
     current_user: Dict = Depends(get_current_user),
     tenant: Dict = Depends(get_current_tenant),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
 ):
-    """Chat endpoint with SSE streaming for real-time progress."""
+    """
+    Chat endpoint with SSE streaming for real-time progress.
+    Events carry `id: <task_id>:<seq>`; resending with `Last-Event-ID`
+    resumes that task instead of starting a new turn.
+    """
     from services.orchestrator import Message
-    
+
+    resume = parse_event_id(last_event_id)
+    if resume:
+        return await resume_chat_stream(resume[0], resume[1], current_user)
+
     task_id = str(uuid_lib.uuid4())
-    task = task_manager.create_task(task_id, request.message)
-    
-    async def event_generator():
-        try:
-            # Step 1: Analyzing
-            task_manager.update_step(task_id, 1, "active")
-            yield f"data: {json.dumps({'type': 'step', 'step': 1, 'status': 'active', 'description': 'Analizando mensaje'})}\n\n"
-            await asyncio.sleep(0.3)
-            task_manager.update_step(task_id, 1, "complete", "Mensaje parseado")
-            yield f"data: {json.dumps({'type': 'step', 'step': 1, 'status': 'complete', 'result': 'Mensaje parseado'})}\n\n"
-            
-            # Step 2: Context
-            task_manager.update_step(task_id, 2, "active")
-            yield f"data: {json.dumps({'type': 'step', 'step': 2, 'status': 'active', 'description': 'Procesando contexto'})}\n\n"
-            
-            sender_id = current_user["id"] if request.channel == "pwa" else request.sender_id
-            message = Message(
-                id=task_id,
-                channel=request.channel,
-                sender_id=sender_id,
-                content=request.message,
-                timestamp=datetime.now(),
-                tenant_id=tenant["id"],
-                user_id=current_user["id"],
-                metadata={"conversation_id": request.conversation_id} if request.conversation_id else {},
-            )
-            
-            await asyncio.sleep(0.2)
-            task_manager.update_step(task_id, 2, "complete", "Contexto cargado")
-            yield f"data: {json.dumps({'type': 'step', 'step': 2, 'status': 'complete', 'result': 'Contexto cargado'})}\n\n"
-            
-            # Step 3: Generating response
-            task_manager.update_step(task_id, 3, "active")
-            yield f"data: {json.dumps({'type': 'step', 'step': 3, 'status': 'active', 'description': 'Generando respuesta'})}\n\n"
-            
-            response = await orchestrator.process(message)
-            
-            task_manager.update_step(task_id, 3, "complete", "Respuesta lista")
-            yield f"data: {json.dumps({'type': 'step', 'step': 3, 'status': 'complete', 'result': 'Respuesta lista'})}\n\n"
-            
-            # Final response
-            task_manager.complete_task(task_id, response.content, response.card)
-            yield f"data: {json.dumps({'type': 'complete', 'response': response.content, 'card': response.card, 'citations': response.citations, 'user_id': response.user_id, 'user_name': response.user_name, 'conversation_id': response.conversation_id, 'processing_time_ms': response.processing_time_ms})}\n\n"
-            
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-        finally:
-            # Cleanup after brief delay
-            await asyncio.sleep(5)
-            task_manager.cleanup(task_id)
-    
+    task_manager.create_task(task_id, request.message, user_id=current_user["id"], tenant_id=tenant["id"])
+
+    sender_id = current_user["id"] if request.channel == "pwa" else request.sender_id
+    message = Message(
+        id=task_id,
+        channel=request.channel,
+        sender_id=sender_id,
+        content=request.message,
+        timestamp=datetime.now(),
+        tenant_id=tenant["id"],
+        user_id=current_user["id"],
+        metadata={"conversation_id": request.conversation_id} if request.conversation_id else {},
+    )
+
+    # Generation outlives the connection; the response is just a reader
+    stream = stream_hub.start(task_id, current_user["id"], lambda s: produce_chat_stream(s, message))
     return StreamingResponse(
-        event_generator(),
+        sse_follow(stream),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+        headers={**SSE_HEADERS, "X-Task-Id": task_id},
     )
 
 
+@app.get("/api/v1/chat/stream/{task_id}")
+async def chat_stream_resume(
+    task_id: str,
+    after: int = 0,
+    current_user: Dict = Depends(get_current_user),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """Reconnect to a chat stream (EventSource-style `Last-Event-ID`, or `?after=<seq>`)."""
+    resume = parse_event_id(last_event_id)
+    after_seq = resume[1] if resume and resume[0] == task_id else after
+    return await resume_chat_stream(task_id, after_seq, current_user)
+
+
 @app.get("/api/v1/task/{task_id}")
 async def get_task_status(
     task_id: str,
@@ -360,8 +385,8 @@ async def get_task_status(
     tenant: Dict = Depends(get_current_tenant),
 ):
     """Get current task status and steps."""
-    task = task_manager.get_task(task_id)
-    if not task:
+    task = await task_manager.get_task(task_id)
+    if not task or (task.get("user_id") and str(task["user_id"]) != str(current_user["id"])):
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
@@ -400,6 +425,8 @@ async def chat(
             "user_name": response.user_name,
             "conversation_id": response.conversation_id,
             "processing_time_ms": response.processing_time_ms,
+            "stage_timings_ms": response.stage_timings_ms,
+            "prompt_tokens": response.prompt_tokens,
             "nanoaureon": response.nanoaureon_used,
             "card": response.card,
             "citations": response.citations
@@ -486,54 +513,74 @@ async def receive_whatsapp(request: Request):
     """Recibe y procesa mensajes de WhatsApp."""
     data = await request.json()
     
-    # Parse incoming message
-    parsed = whatsapp_service.parse_incoming(data)
-    if not parsed or not parsed.get("text"):
+    # Meta batches several entries/messages per POST under load
+    by_sender = whatsapp_service.group_by_sender(data)
+    if not by_sender:
         return {"status": "ignored"}
-    
-    sender = parsed["from"]
-    text = parsed["text"]
-    
-    # Check whitelist + verification
-    if not whatsapp_service.is_allowed(sender):
-        print(f"📱 WhatsApp blocked (not whitelisted): {sender}")
-        return {"status": "blocked"}
 
-    profile = await identity_service.get_by_whatsapp(sender)
-    if not profile or not profile.get("whatsapp_verified_at"):
-        print(f"📱 WhatsApp blocked (not verified): {sender}")
-        return {"status": "blocked"}
-    
-    print(f"📱 WhatsApp from {sender}: {text[:50]}...")
-    
-    # Process with orchestrator
-    try:
-        tenant_id = await resolve_tenant_for_user(profile["id"])
-        if not tenant_id:
-            return {"status": "blocked"}
+    counts = {"accepted": 0, "duplicate": 0, "blocked": 0}
+    for sender, messages in by_sender.items():
+        # Check whitelist + verification
+        if not whatsapp_service.is_allowed(sender):
+            print(f"📱 WhatsApp blocked (not whitelisted): {sender}")
+            counts["blocked"] += len(messages)
+            continue
+
+        sender_identity = await identity_service.resolve_channel("whatsapp", sender)
+        profile = sender_identity["profile"]
+        if not sender_identity["verified"] or not sender_identity["tenant_id"]:
+            print(f"📱 WhatsApp blocked (not verified): {sender}")
+            counts["blocked"] += len(messages)
+            continue
+
+        for parsed in messages:
+            print(f"📱 WhatsApp from {sender}: {parsed['text'][:50]}...")
+            # ACK now; Meta redelivers anything slower than its timeout
+            event = await inbound_dispatcher.accept(
+                channel="whatsapp",
+                provider_message_id=parsed.get("msg_id"),
+                sender_id=sender,
+                payload={"text": parsed["text"], "timestamp": parsed.get("timestamp")},
+                tenant_id=sender_identity["tenant_id"],
+                user_id=profile["id"],
+            )
+            counts["duplicate" if event is None else "accepted"] += 1
+
+    if not counts["accepted"]:
+        return {"status": "duplicate" if counts["duplicate"] else "blocked", **counts}
+    return {"status": "accepted", **counts}
+
+
+async def process_whatsapp_event(events: List[Dict]) -> None:
+    """Worker side of /webhook/whatsapp: one turn per (coalesced) sender burst."""
+    from services.orchestrator import Message
+    first = events[0]
+    sender = first["sender_id"]
+    message = Message(
+        id=str(first.get("id") or uuid_lib.uuid4()),
+        channel="whatsapp",
+        sender_id=sender,
+        content="\n".join(event["payload"]["text"] for event in events),
+        timestamp=datetime.now(),
+        tenant_id=first["tenant_id"],
+        user_id=first["user_id"],
+        metadata={"provider_message_ids": [event["provider_message_id"] for event in events]},
+    )
+    response_obj = await orchestrator.process(message)
+    response = response_obj.content
+
+    # Send response back
+    await whatsapp_service.send_message(sender, response)
+    print(f"📱 WhatsApp sent to {sender}: {response[:50]}...")
 
-        from services.orchestrator import Message
-        message = Message(
-            id=str(uuid_lib.uuid4()),
-            channel="whatsapp",
-            sender_id=sender,
-            content=text,
-            timestamp=datetime.now(),
-            tenant_id=tenant_id,
-            user_id=profile["id"],
-            metadata={},
-        )
-        response_obj = await orchestrator.process(message)
-        response = response_obj.content
-        
-        # Send response back
-        result = await whatsapp_service.send_message(sender, response)
-        print(f"📱 WhatsApp sent to {sender}: {response[:50]}...")
-        
-        return {"status": "processed", "sent": result}
-    except Exception as e:
-        print(f"❌ WhatsApp error: {e}")
-        return {"status": "error", "detail": str(e)}
+
+inbound_dispatcher.register(
+    "whatsapp",
+    process_whatsapp_event,
+    coalesce_window_s=settings.whatsapp_coalesce_window_s,
+    coalesce_max_wait_s=settings.whatsapp_coalesce_max_wait_s,
+    max_batch=settings.whatsapp_coalesce_max_messages,
+)
 
 
 # ============================================================================
@@ -559,47 +606,65 @@ async def receive_telegram(request: Request):
         print(f"💬 Telegram blocked (not whitelisted): {user_id}")
         return {"status": "blocked"}
 
-    profile = await identity_service.get_by_telegram(user_id)
-    if not profile or not profile.get("telegram_verified_at"):
+    sender_identity = await identity_service.resolve_channel("telegram", user_id)
+    profile = sender_identity["profile"]
+    if not sender_identity["verified"]:
         print(f"💬 Telegram blocked (not verified): {user_id}")
         return {"status": "blocked"}
     
+    tenant_id = sender_identity["tenant_id"]
+    if not tenant_id:
+        return {"status": "blocked"}
+
     print(f"💬 Telegram from {user_id}: {text[:50]}...")
-    
+
+    # ACK now; message_id is only unique within a chat
+    event = await inbound_dispatcher.accept(
+        channel="telegram",
+        provider_message_id=f"{chat_id}:{parsed.get('msg_id')}" if parsed.get("msg_id") else None,
+        sender_id=str(user_id),
+        payload={"text": text, "chat_id": chat_id},
+        tenant_id=tenant_id,
+        user_id=profile["id"],
+    )
+    return {"status": "duplicate" if event is None else "accepted"}
+
+
+async def process_telegram_event(events: List[Dict]) -> None:
+    """Worker side of /webhook/telegram (runs in sender order)."""
+    event = events[0]
+    chat_id = event["payload"]["chat_id"]
+    text = event["payload"]["text"]
+
     # Handle /start command
     if text.startswith("/start"):
         await telegram_service.send_message(chat_id, "🌀 <b>Auréon activado.</b>\n\n¿En qué puedo ayudarte?")
-        return {"status": "start_sent"}
-    
-    # Process with orchestrator
-    try:
-        tenant_id = await resolve_tenant_for_user(profile["id"])
-        if not tenant_id:
-            return {"status": "blocked"}
+        return
 
-        from services.orchestrator import Message
-        message = Message(
-            id=str(uuid_lib.uuid4()),
-            channel="telegram",
-            sender_id=str(user_id),
-            content=text,
-            timestamp=datetime.now(),
-            tenant_id=tenant_id,
-            user_id=profile["id"],
-            metadata={},
-        )
+    from services.orchestrator import Message
+    message = Message(
+        id=str(event.get("id") or uuid_lib.uuid4()),
+        channel="telegram",
+        sender_id=event["sender_id"],
+        content=text,
+        timestamp=datetime.now(),
+        tenant_id=event["tenant_id"],
+        user_id=event["user_id"],
+        metadata={"provider_message_id": event["provider_message_id"]},
+    )
+    try:
         response_obj = await orchestrator.process(message)
-        response = response_obj.content
-        
-        # Send response back
-        result = await telegram_service.send_message(chat_id, response)
-        print(f"💬 Telegram sent to {chat_id}: {response[:50]}...")
-        
-        return {"status": "processed", "sent": result}
     except Exception as e:
-        print(f"❌ Telegram error: {e}")
         await telegram_service.send_message(chat_id, f"⚠️ Error: {str(e)[:100]}")
-        return {"status": "error", "detail": str(e)}
+        raise
+    response = response_obj.content
+
+    # Send response back
+    await telegram_service.send_message(chat_id, response)
+    print(f"💬 Telegram sent to {chat_id}: {response[:50]}...")
+
+
+inbound_dispatcher.register("telegram", process_telegram_event)
 
 
 @app.post("/api/v1/telegram/set-webhook")
@@ -733,14 +798,23 @@ async def search_memories(
 
 
 @app.get("/api/v1/memory/context")
-async def get_context(limit: int = 10, current_user: Dict = Depends(get_current_user)):
-    """Get recent context messages for a user."""
-    messages = await memory_service.get_context(current_user["id"], limit)
+async def get_context(
+    limit: int = Query(10, ge=1, le=100),
+    before: Optional[str] = None,
+    before_id: Optional[str] = None,
+    current_user: Dict = Depends(get_current_user),
+):
+    """Get recent context messages for a user (page backwards with `before` + `before_id`)."""
+    messages = await memory_service.get_context(current_user["id"], limit, before, before_id)
+    has_more = bool(messages) and len(messages) == limit
     return {
         "status": "success",
         "count": len(messages),
+        "next_before": messages[0].timestamp.isoformat() if has_more else None,
+        "next_before_id": messages[0].id if has_more else None,
         "messages": [
             {
+                "id": m.id,
                 "role": m.role,
                 "content": m.content,
                 "channel": m.channel,
@@ -809,24 +883,48 @@ async def run_research(
 # KNOWLEDGE (UPLOAD + SEARCH)
 # ============================================================================
 
+# Seconds between client-disconnect checks during ingestion
+DISCONNECT_POLL_S = 1.0
+
+
 @app.post("/api/v1/knowledge/upload")
 async def upload_knowledge(
+    request: Request,
     file: UploadFile = File(...),
     current_user: Dict = Depends(get_current_user),
     tenant: Dict = Depends(get_current_tenant),
 ):
-    content = await file.read()
     max_bytes = settings.max_upload_mb * 1024 * 1024
-    if len(content) > max_bytes:
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail="File too large")
+    try:
+        spooled = await spool_upload(file, max_bytes)
+    except UploadTooLarge:
         raise HTTPException(status_code=413, detail="File too large")
 
-    result = await ingestion_service.ingest_upload(
+    ingest = asyncio.create_task(ingestion_service.ingest_upload(
         tenant_id=tenant["id"],
         user_id=current_user["id"],
         filename=file.filename or "upload",
         content_type=file.content_type or "application/octet-stream",
-        file_bytes=content,
-    )
+        file_path=spooled.path,
+        file_hash=spooled.sha256,
+    ))
+    try:
+        # Extraction can take a while: stop it if the client goes away
+        while not ingest.done():
+            await asyncio.wait({ingest}, timeout=DISCONNECT_POLL_S)
+            if not ingest.done() and await request.is_disconnected():
+                ingest.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+        result = ingest.result()
+    except ExtractionTimeout:
+        raise HTTPException(status_code=422, detail="Document took too long to process")
+    finally:
+        if not ingest.done():
+            ingest.cancel()
+        await asyncio.gather(ingest, return_exceptions=True)
+        os.unlink(spooled.path)
     return {"status": "success", **result}
 
 
@@ -834,23 +932,72 @@ async def upload_knowledge(
 async def search_knowledge(
     query: str,
     k: int = 5,
+    mode: Optional[Literal["vector", "hybrid"]] = None,
+    rerank: Optional[bool] = None,
     current_user: Dict = Depends(get_current_user),
     tenant: Dict = Depends(get_current_tenant),
 ):
-    admin = get_supabase_admin()
-    embedding = await generate_embedding(query)
+    """Tenant knowledge search: `mode=vector` (cosine) or `mode=hybrid`
+    (full-text + vector, reciprocal rank fusion, optional local rerank)."""
     try:
-        results = admin.rpc(
-            "search_knowledge_chunks",
-            {
-                "p_tenant_id": tenant["id"],
-                "p_query_embedding": embedding,
-                "p_limit": k,
-            },
-        ).execute()
+        results = await knowledge_service.search(tenant["id"], query, k=min(k, 50), mode=mode, rerank_results=rerank)
     except Exception as exc:
         raise HTTPException(status_code=500, detail="Knowledge search failed") from exc
-    return {"status": "success", "results": results.data or []}
+    return {"status": "success", "mode": mode or settings.knowledge_search_mode, "results": results}
+
+
+@app.get("/api/v1/embeddings/cache")
+async def embedding_cache_stats(current_user: Dict = Depends(get_current_user)):
+    """Embedding cache hit/miss counters (provider quota savings)."""
+    return {"status": "success", "cache": embedding_cache.snapshot()}
+
+
+@app.get("/api/v1/completions/cache")
+async def completion_cache_stats(current_user: Dict = Depends(get_current_user)):
+    """Completion cache hits by tier (provider spend avoided)."""
+    return {"status": "success", "cache": completion_cache.snapshot()}
+
+
+@app.get("/api/v1/providers/health")
+async def providers_health(current_user: Dict = Depends(get_current_user)):
+    """Rolling latency, error rate and breaker state per AI provider."""
+    return {"status": "success", "providers": provider_router.snapshot()}
+
+
+@app.get("/api/v1/webhooks/stats")
+async def webhook_stats(current_user: Dict = Depends(get_current_user)):
+    """Inbound webhook queue: accepted / duplicate / processed counters and live lanes."""
+    return {"status": "success", "webhooks": inbound_dispatcher.snapshot()}
+
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job_status(
+    job_id: str,
+    current_user: Dict = Depends(get_current_user),
+    tenant: Dict = Depends(get_current_tenant),
+):
+    """Status of a queued background job (embedding, archiving...)."""
+    job = await job_queue.get(job_id)
+    if not job or (job.get("tenant_id") != tenant["id"] and job.get("user_id") != current_user["id"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "status": "success",
+        "job": {
+            "id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "attempts": job.get("attempts"),
+            "max_attempts": job.get("max_attempts"),
+            "last_error": job.get("last_error"),
+            "result": job.get("result"),
+            "created_at": job.get("created_at"),
+            "updated_at": job.get("updated_at"),
+        },
+    }
 
 
 # ============================================================================
@@ -863,10 +1010,10 @@ async def list_integrations(
     tenant: Dict = Depends(get_current_tenant),
 ):
     admin = get_supabase_admin()
-    res = admin.table("integrations") \
-        .select("key,created_at,updated_at") \
-        .eq("tenant_id", tenant["id"]) \
-        .order("created_at", desc=True).execute()
+    res = await db_execute(admin.table("integrations")
+        .select("key,created_at,updated_at")
+        .eq("tenant_id", tenant["id"])
+        .order("created_at", desc=True))
     return {"status": "success", "integrations": res.data or []}
 
 
@@ -889,5 +1036,5 @@ async def save_integration(
         "key": request.key,
         "value_encrypted": encrypted,
     }
-    admin.table("integrations").upsert(payload, on_conflict="tenant_id,key").execute()
+    await db_execute(admin.table("integrations").upsert(payload, on_conflict="tenant_id,key"))
     return {"status": "success", "key": request.key}
@@ -0,0 +1,433 @@
+"""
+✂️ Aureon Cortex - Chunking Engine
+Streaming chunkers for knowledge ingestion. Text arrives as segments
+(pages, paragraph groups, file blocks) and chunks come out as soon as they
+are complete, so memory stays bounded and the cost is linear in the text.
+
+Strategies:
+- fixed:     900-char windows with 120-char overlap (legacy behaviour)
+- token:     word-aligned windows of `max_tokens`
+- sentence:  whole sentences packed up to `max_tokens`
+- paragraph: whole paragraphs; oversized ones fall back to sentences
+- structure: paragraph packing that also starts a new chunk at every
+             heading, prefixes chunks with their heading and keeps table
+             rows intact
+
+Chunk ids are derived from the content (hash + occurrence), so re-ingesting
+an unchanged document yields the same ids.
+
+Benchmark against the legacy chunker: `python -m services.chunking [file]`.
+"""
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterator, List, Literal, Optional
+import hashlib
+import json
+import math
+import re
+import uuid
+
+from core.config import settings
+from services.prompt_builder import chars_per_token
+
+Strategy = Literal["fixed", "token", "sentence", "paragraph", "structure"]
+STRATEGIES = ("fixed", "token", "sentence", "paragraph", "structure")
+
+# Token estimate for the embedding model (Gemini tokenizer)
+EMBED_CHARS_PER_TOKEN = chars_per_token(["gemini"])
+# A line longer than this is cut at whitespace instead of waiting for "\n"
+MAX_CARRY_CHARS = 64 * 1024
+MAX_HEADING_CHARS = 120
+CHUNK_NAMESPACE = uuid.UUID("6f1c8a52-3d4e-4b7a-9e2f-0c5d8b1a7e93")
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?…])\s+")
+_WORD = re.compile(r"\S+\s*")
+_MD_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+\S")
+_NUMBERED_HEADING = re.compile(r"^\s*\d+(\.\d+)*\.?\s+[A-ZÁÉÍÓÚÑ]")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$|\t.*\t")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / EMBED_CHARS_PER_TOKEN) if text else 0
+
+
+def content_hash(text: str) -> str:
+    """Whitespace-insensitive hash of a chunk's text."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    tokens: int
+    content_hash: str
+    key: str            # "<hash>:<occurrence>", stable across re-ingestion
+    heading: str = ""
+
+    def row_id(self, scope: str) -> str:
+        """Deterministic UUID of this chunk within `scope` (e.g. the source)."""
+        return str(uuid.uuid5(CHUNK_NAMESPACE, f"{scope}:{self.key}"))
+
+
+@dataclass
+class ChunkerConfig:
+    strategy: Strategy = "structure"
+    max_tokens: int = 240
+    overlap_tokens: int = 30
+
+    @classmethod
+    def for_tenant(cls, tenant_id: Optional[str]) -> "ChunkerConfig":
+        overrides = settings.chunking_tenant_config.get(tenant_id or "", {})
+        config = cls(
+            strategy=overrides.get("strategy", settings.chunking_strategy),
+            max_tokens=int(overrides.get("max_tokens", settings.chunking_max_tokens)),
+            overlap_tokens=int(overrides.get("overlap_tokens", settings.chunking_overlap_tokens)),
+        )
+        if config.strategy not in STRATEGIES:
+            print(f"[Chunking] Unknown strategy {config.strategy!r} for {tenant_id}, using structure")
+            config.strategy = "structure"
+        config.max_tokens = max(16, config.max_tokens)
+        config.overlap_tokens = max(0, min(config.overlap_tokens, config.max_tokens // 2))
+        return config
+
+
+@dataclass
+class _Unit:
+    text: str
+    tokens: int
+    sep: str            # placed before this unit when it is not first in a chunk
+
+
+class _Packer:
+    """Greedy packing of units into chunks of at most `max_tokens`, carrying
+    trailing units up to `overlap_tokens` into the next chunk."""
+
+    def __init__(self, config: ChunkerConfig):
+        self.config = config
+        self.units: List[_Unit] = []
+        self.tokens = 0
+        self.fresh = 0          # units not yet emitted in a previous chunk
+        self.heading = ""
+        self.next_heading: Optional[str] = None
+        self.index = 0
+        self._seen: Dict[str, int] = {}
+
+    def add(self, unit: _Unit) -> List[Chunk]:
+        out: List[Chunk] = []
+        if self.units and self.tokens + unit.tokens > self.limit:
+            out.extend(self._emit(carry=True))
+            while self.units and self.tokens + unit.tokens > self.limit:
+                self.tokens -= self.units.pop(0).tokens
+        self.units.append(unit)
+        self.tokens += unit.tokens
+        self.fresh += 1
+        return out
+
+    @property
+    def limit(self) -> int:
+        """Token room for the body once the heading prefix is paid for."""
+        return max(1, self.config.max_tokens - (estimate_tokens(self.heading) + 1 if self.heading else 0))
+
+    def hard_break(self, heading: Optional[str] = None) -> List[Chunk]:
+        out = self._emit(carry=False)
+        if heading is not None:
+            self.heading, self.next_heading = heading, None
+        return out
+
+    def _emit(self, carry: bool) -> List[Chunk]:
+        if not self.fresh:
+            # Only overlap left over: nothing new to say
+            self.units, self.tokens = [], 0
+            return []
+        body = "".join((u.sep if i else "") + u.text for i, u in enumerate(self.units)).strip()
+        text = f"{self.heading}\n{body}" if self.heading else body
+        digest = content_hash(text)
+        occurrence = self._seen.get(digest, 0)
+        self._seen[digest] = occurrence + 1
+        chunk = Chunk(
+            index=self.index,
+            text=text,
+            tokens=estimate_tokens(text),
+            content_hash=digest,
+            key=f"{digest}:{occurrence}",
+            heading=self.heading,
+        )
+        self.index += 1
+        if self.next_heading is not None:
+            self.heading, self.next_heading = self.next_heading, None
+
+        kept: Deque[_Unit] = deque()
+        kept_tokens = 0
+        if carry and self.config.overlap_tokens:
+            for unit in reversed(self.units):
+                if kept_tokens + unit.tokens > self.config.overlap_tokens:
+                    break
+                kept.appendleft(unit)
+                kept_tokens += unit.tokens
+        self.units, self.tokens, self.fresh = list(kept), kept_tokens, 0
+        return [chunk]
+
+
+class _Window:
+    """Sliding character windows, scanned by index (linear in the text).
+
+    `fixed` uses the legacy exact 900/120 windows; `token` sizes windows
+    from the token budget and moves both cuts to word boundaries.
+    """
+
+    def __init__(self, size: int, overlap: int, word_aligned: bool):
+        self.size = size
+        self.overlap = overlap
+        self.word_aligned = word_aligned
+        self._buffer = ""
+
+    def feed(self, segment: str) -> List[str]:
+        if not self._buffer:
+            segment = segment.lstrip()
+        buffer = self._buffer + segment
+        chunks = []
+        pos = 0
+        while len(buffer) - pos > self.size:
+            end = pos + self.size
+            if self.word_aligned:
+                space = max(buffer.rfind(" ", pos + self.size // 2, end), buffer.rfind("\n", pos + self.size // 2, end))
+                end = space + 1 if space > 0 else end
+            chunk = buffer[pos:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            nxt = end - self.overlap
+            if self.word_aligned:
+                space = max(buffer.find(" ", nxt, end), buffer.find("\n", nxt, end))
+                nxt = space + 1 if space >= 0 else end
+            pos = max(nxt, pos + 1)
+        self._buffer = buffer[pos:]
+        return chunks
+
+    def flush(self) -> List[str]:
+        tail, self._buffer = self._buffer.strip(), ""
+        return [tail] if tail else []
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > MAX_HEADING_CHARS:
+        return False
+    if _MD_HEADING.match(stripped):
+        return True
+    if stripped[-1] in ".,;:":
+        return False
+    if _NUMBERED_HEADING.match(stripped) and len(stripped.split()) <= 12:
+        return True
+    letters = [c for c in stripped if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters)
+
+
+class Chunker:
+    """Streaming chunker: `feed(segment)` / `flush()` return finished chunks."""
+
+    def __init__(self, config: Optional[ChunkerConfig] = None):
+        self.config = config or ChunkerConfig()
+        self._packer = _Packer(self.config)
+        self._window: Optional[_Window] = None
+        if self.config.strategy == "fixed":
+            self._window = _Window(900, 120, word_aligned=False)
+        elif self.config.strategy == "token":
+            self._window = _Window(
+                int(self.config.max_tokens * EMBED_CHARS_PER_TOKEN),
+                int(self.config.overlap_tokens * EMBED_CHARS_PER_TOKEN),
+                word_aligned=True,
+            )
+        self._carry = ""
+        self._paragraph: List[str] = []
+        self._paragraph_tokens = 0
+        self._in_table = False
+
+    # --- Public API ---
+
+    def feed(self, segment: str) -> List[Chunk]:
+        if self._window is not None:
+            return [self._wrap(text) for text in self._window.feed(segment)]
+        text = self._carry + segment
+        cut = text.rfind("\n") + 1
+        if not cut and len(text) > MAX_CARRY_CHARS:
+            # No newline in sight (minified text): cut at the last whitespace
+            space = text.rfind(" ")
+            cut = space + 1 if space > 0 else len(text)
+        self._carry = text[cut:]
+        out: List[Chunk] = []
+        for line in text[:cut].splitlines():
+            out.extend(self._line(line))
+        return out
+
+    def flush(self) -> List[Chunk]:
+        if self._window is not None:
+            return [self._wrap(text) for text in self._window.flush()]
+        out: List[Chunk] = []
+        if self._carry:
+            out.extend(self._line(self._carry))
+            self._carry = ""
+        out.extend(self._close_paragraph())
+        out.extend(self._packer.hard_break())
+        return out
+
+    def chunk(self, text: str) -> List[Chunk]:
+        return self.feed(text) + self.flush()
+
+    # --- Line / paragraph handling ---
+
+    def _line(self, line: str) -> List[Chunk]:
+        strategy = self.config.strategy
+        out: List[Chunk] = []
+        if not line.strip():
+            return self._close_paragraph()
+        if strategy == "structure" and _is_heading(line):
+            out.extend(self._close_paragraph())
+            heading = line.strip().lstrip("#").strip()
+            if self._packer.fresh and self._packer.tokens < self.config.max_tokens // 4:
+                # Tiny section so far: keep packing rather than emit a stub;
+                # the heading stays inline and labels the following chunks
+                out.extend(self._unit(line.strip(), sep="\n\n"))
+                self._packer.next_heading = heading
+            else:
+                out.extend(self._packer.hard_break(heading=heading))
+            return out
+        is_row = strategy == "structure" and bool(_TABLE_ROW.search(line))
+        if is_row:
+            sep = "\n"
+            if not self._in_table:
+                out.extend(self._close_paragraph())
+                self._in_table = True
+                sep = "\n\n"
+            # Rows are atomic units, one per line
+            out.extend(self._unit(line.rstrip(), sep=sep))
+            return out
+        if self._in_table:
+            self._in_table = False
+        self._paragraph.append(line.rstrip())
+        self._paragraph_tokens += estimate_tokens(line)
+        if self._paragraph_tokens > self.config.max_tokens:
+            # Oversized paragraph: release it as sentences now
+            out.extend(self._close_paragraph())
+        return out
+
+    def _close_paragraph(self) -> List[Chunk]:
+        self._in_table = False
+        if not self._paragraph:
+            return []
+        paragraph = "\n".join(self._paragraph)
+        self._paragraph, self._paragraph_tokens = [], 0
+        if self.config.strategy == "sentence":
+            return self._sentences(paragraph, sep=" ")
+        return self._unit(paragraph, sep="\n\n")
+
+    # --- Units (recursive fallback: paragraph > sentence > word > chars) ---
+
+    def _unit(self, text: str, sep: str) -> List[Chunk]:
+        tokens = estimate_tokens(sep + text)
+        if tokens <= self._packer.limit:
+            return self._packer.add(_Unit(text, tokens, sep))
+        return self._sentences(text, sep=sep)
+
+    def _sentences(self, text: str, sep: str) -> List[Chunk]:
+        out: List[Chunk] = []
+        for i, sentence in enumerate(s for s in _SENTENCE_SPLIT.split(text) if s.strip()):
+            unit_sep = sep if i == 0 else " "
+            tokens = estimate_tokens(unit_sep + sentence)
+            if tokens <= self._packer.limit:
+                out.extend(self._packer.add(_Unit(sentence, tokens, unit_sep)))
+            else:
+                out.extend(self._words(sentence, sep=unit_sep))
+        return out
+
+    def _words(self, text: str, sep: str) -> List[Chunk]:
+        out: List[Chunk] = []
+        limit_chars = int(self._packer.limit * EMBED_CHARS_PER_TOKEN)
+        for i, match in enumerate(_WORD.finditer(text)):
+            word = match.group()
+            unit_sep = sep if i == 0 else ""
+            for start in range(0, len(word), limit_chars):
+                piece = word[start:start + limit_chars]
+                out.extend(self._packer.add(_Unit(piece, estimate_tokens(unit_sep + piece), unit_sep)))
+                unit_sep = ""
+        return out
+
+    def _wrap(self, text: str) -> Chunk:
+        """Fixed windows still get hashes and stable keys."""
+        packer = self._packer
+        digest = content_hash(text)
+        occurrence = packer._seen.get(digest, 0)
+        packer._seen[digest] = occurrence + 1
+        chunk = Chunk(packer.index, text, estimate_tokens(text), digest, f"{digest}:{occurrence}")
+        packer.index += 1
+        return chunk
+
+
+def iter_chunks(segments, config: Optional[ChunkerConfig] = None) -> Iterator[Chunk]:
+    chunker = Chunker(config)
+    for segment in segments:
+        yield from chunker.feed(segment)
+    yield from chunker.flush()
+
+
+def _benchmark(text: str) -> List[Dict]:
+    import time
+
+    def legacy(text: str, chunk_size: int = 900, overlap: int = 120) -> List[str]:
+        # The pre-engine _chunk_text (with its end-of-text loop fixed)
+        text = text.strip()
+        chunks, start = [], 0
+        while start < len(text):
+            end = min(len(text), start + chunk_size)
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end == len(text):
+                break
+            start = end - overlap
+        return chunks
+
+    rows = []
+    started = time.perf_counter()
+    chunks = legacy(text)
+    rows.append({"chunker": "legacy 900/120", "chunks": len(chunks),
+                 "ms": round((time.perf_counter() - started) * 1000, 1)})
+    for strategy in STRATEGIES:
+        config = ChunkerConfig(strategy=strategy)
+        started = time.perf_counter()
+        # Fed in 64 KB segments like the ingestion pipeline
+        chunks = list(iter_chunks((text[i:i + 65536] for i in range(0, len(text), 65536)), config))
+        elapsed = (time.perf_counter() - started) * 1000
+        tokens = [c.tokens for c in chunks] or [0]
+        rows.append({
+            "chunker": strategy,
+            "chunks": len(chunks),
+            "ms": round(elapsed, 1),
+            "avg_tokens": round(sum(tokens) / len(tokens)),
+            "max_tokens": max(tokens),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8", errors="replace") as handle:
+            sample = handle.read()
+    else:
+        paragraph = (
+            "Los reembolsos se procesan en 5 días hábiles desde la solicitud. El cliente debe "
+            "presentar el ticket original y el medio de pago usado. No se aceptan devoluciones de "
+            "productos personalizados ni de cursos con más del 20% del contenido visto.\n\n"
+        )
+        section = (
+            "## Política de reembolsos\n\n" + paragraph * 4
+            + "| Producto | Plazo | Condición |\n| Servicio | 30 días | Sin uso |\n| Curso | 7 días | <20% visto |\n\n"
+            + "HORARIOS DE ATENCIÓN\n\n" + paragraph * 3
+        )
+        sample = section * 3000  # ~5 MB
+    print(f"{len(sample) / 1e6:.1f} MB")
+    print(json.dumps(_benchmark(sample), indent=2, ensure_ascii=False))
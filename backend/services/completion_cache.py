@@ -0,0 +1,176 @@
+"""
+💬 Aureon Cortex - Completion Cache
+Opt-in cache for IntelligencePool completions, scoped per tenant.
+
+Two tiers share one LRU per scope:
+- exact: sha256(context, normalized prompt)
+- semantic: cosine similarity between prompt embeddings, restricted to
+  entries with the same context.
+
+The context digests system prompt, model, temperature bucket and the
+caller's `extra` (e.g. user id and grounding text), so answers never cross
+users or knowledge versions. Callers that assemble large prompts pass only
+the user's message as the prompt to key on.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import hashlib
+import re
+import time
+
+import numpy as np
+
+from core.config import settings
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return _WHITESPACE.sub(" ", (prompt or "").strip().lower())
+
+
+def temperature_bucket(temperature: float) -> str:
+    return f"{round(temperature, 1):.1f}"
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+@dataclass
+class _Entry:
+    context: str
+    text: str
+    provider: str
+    expires_at: float
+    embedding: Optional[np.ndarray] = None
+
+
+class CompletionCache:
+    """Per-scope LRU of completions with TTL, exact and semantic lookups."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._scopes: Dict[str, "OrderedDict[str, _Entry]"] = {}
+        self.stats: Dict[str, int] = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+    @staticmethod
+    def enabled_for(scope: Optional[str], temperature: float) -> bool:
+        if not settings.completion_cache_enabled or not scope:
+            return False
+        if temperature > settings.completion_cache_max_temperature:
+            return False
+        return CompletionCache.ttl_for(scope) > 0
+
+    @staticmethod
+    def ttl_for(scope: str) -> float:
+        return float(settings.completion_cache_tenant_ttls.get(scope, settings.completion_cache_ttl_s))
+
+    @staticmethod
+    def keys(
+        system_prompt: str, prompt: str, model: str, temperature: float, extra: str = ""
+    ) -> Tuple[str, str]:
+        """(context key, exact key) for a request."""
+        context = _digest(system_prompt or "", model, temperature_bucket(temperature), extra)
+        return context, _digest(context, normalize_prompt(prompt))
+
+    def _entries(self, scope: str) -> "OrderedDict[str, _Entry]":
+        entries = self._scopes.get(scope)
+        if entries is None:
+            entries = self._scopes[scope] = OrderedDict()
+        return entries
+
+    def _purge_expired(self, entries: "OrderedDict[str, _Entry]", now: float) -> None:
+        expired = [key for key, entry in entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del entries[key]
+        self.stats["expired"] += len(expired)
+
+    def get_exact(self, scope: str, key: str) -> Optional[_Entry]:
+        entries = self._entries(scope)
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del entries[key]
+            self.stats["expired"] += 1
+            return None
+        entries.move_to_end(key)
+        self.stats["exact_hits"] += 1
+        return entry
+
+    def get_similar(self, scope: str, context: str, embedding: np.ndarray) -> Optional[_Entry]:
+        """Closest entry in the same context above the similarity threshold."""
+        entries = self._entries(scope)
+        self._purge_expired(entries, time.monotonic())
+        candidates = [
+            (key, entry) for key, entry in entries.items()
+            if entry.context == context and entry.embedding is not None
+        ]
+        if not candidates:
+            return None
+        # Embeddings are L2-normalized, so the dot product is the cosine
+        scores = np.stack([entry.embedding for _, entry in candidates]) @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < settings.completion_cache_similarity:
+            return None
+        key, entry = candidates[best]
+        entries.move_to_end(key)
+        self.stats["semantic_hits"] += 1
+        return entry
+
+    def miss(self) -> None:
+        self.stats["misses"] += 1
+
+    def put(
+        self,
+        scope: str,
+        context: str,
+        key: str,
+        text: str,
+        provider: str,
+        embedding: Optional[np.ndarray] = None,
+    ) -> None:
+        entries = self._entries(scope)
+        entries[key] = _Entry(
+            context=context,
+            text=text,
+            provider=provider,
+            expires_at=time.monotonic() + self.ttl_for(scope),
+            embedding=embedding,
+        )
+        entries.move_to_end(key)
+        self.stats["stores"] += 1
+        if len(entries) > self.max_entries:
+            self._purge_expired(entries, time.monotonic())
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, scope: str) -> None:
+        self._scopes.pop(scope, None)
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": settings.completion_cache_enabled,
+            "scopes": len(self._scopes),
+            "entries": sum(len(entries) for entries in self._scopes.values()),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton
+completion_cache = CompletionCache(max_entries=settings.completion_cache_max_entries)
@@ -0,0 +1,126 @@
+"""
+🗃️ Aureon Cortex - Embedding Cache
+Two tiers keyed by sha256(model, task, dims, text):
+an in-process LRU with a byte budget, backed by the `embedding_cache` table.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
+from services.vectors import to_array, to_pgvector, from_pgvector
+
+# Keys per PostgREST `in.(...)` lookup (keeps the URL short)
+DB_LOOKUP_BATCH = 100
+
+
+def cache_key(text: str, model: str, task_type: str, dims: int) -> str:
+    return hashlib.sha256(f"{model}|{task_type}|{dims}|{text}".encode()).hexdigest()
+
+
+def _persist_enabled() -> bool:
+    return bool(settings.embedding_cache_persist and settings.supabase_url)
+
+
+class EmbeddingCache:
+    """LRU of read-only float32 arrays (bounded by bytes) in front of a Postgres tier."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def get_local(self, key: str) -> Optional[np.ndarray]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.stats["memory_hits"] += 1
+        return entry
+
+    def put_local(self, key: str, embedding: np.ndarray) -> None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        entry = to_array(embedding).copy()
+        entry.setflags(write=False)
+        size = entry.nbytes
+        if size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.stats["evictions"] += 1
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Resolve keys from the LRU, then the DB tier (promoting DB hits)."""
+        found: Dict[str, np.ndarray] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            embedding = self.get_local(key)
+            if embedding is not None:
+                found[key] = embedding
+            else:
+                missing.append(key)
+
+        if missing and _persist_enabled():
+            try:
+                admin = get_supabase_admin()
+                for i in range(0, len(missing), DB_LOOKUP_BATCH):
+                    res = await db_execute(admin.table("embedding_cache")
+                        .select("key,embedding")
+                        .in_("key", missing[i:i + DB_LOOKUP_BATCH]))
+                    for row in (res.data or []):
+                        embedding = from_pgvector(row.get("embedding"))
+                        if embedding is not None and embedding.size:
+                            found[row["key"]] = embedding
+                            self.put_local(row["key"], embedding)
+                            self.stats["db_hits"] += 1
+            except Exception as e:
+                print(f"[EmbeddingCache] DB lookup failed: {e}")
+
+        self.stats["misses"] += sum(1 for key in missing if key not in found)
+        return found
+
+    async def put_many(self, items: Dict[str, np.ndarray], model: str, dims: int) -> None:
+        for key, embedding in items.items():
+            self.put_local(key, embedding)
+        if not items or not _persist_enabled():
+            return
+        try:
+            admin = get_supabase_admin()
+            rows = [
+                {"key": key, "model": model, "dims": dims, "embedding": to_pgvector(embedding)}
+                for key, embedding in items.items()
+            ]
+            await db_execute(admin.table("embedding_cache").upsert(rows, on_conflict="key"))
+        except Exception as e:
+            print(f"[EmbeddingCache] DB write failed: {e}")
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats["memory_hits"] + self.stats["db_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton
+embedding_cache = EmbeddingCache(max_bytes=settings.embedding_cache_mb * 1024 * 1024)
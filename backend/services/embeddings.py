@@ -1,46 +1,156 @@
 """
 🧬 Embedding Generator with multi-provider fallback.
+Batched + async: texts are packed into provider batches that run
+concurrently under a semaphore, never blocking the event loop.
 """
 from __future__ import annotations
 
-from typing import List
-import hashlib
+from typing import Dict, List, Optional, Sequence
+import asyncio
+
+import numpy as np
 
 from core.config import settings
+from core.http import http_clients
+from services.embedding_cache import embedding_cache, cache_key
+from services.vectors import to_array, l2_normalize
+
+GEMINI_EMBED_URL = "https://generativelanguage.googleapis.com/v1beta/{model}:batchEmbedContents"
+EMBEDDING_MODEL = "models/embedding-001"
+PROVIDER_BATCH_LIMIT = 100  # batchEmbedContents max requests per call
+MAX_CONCURRENT_BATCHES = 4
+MAX_EMBED_CHARS = 8000
+
+_HASH_NGRAM_SIZES = (3, 4)
+_HASH_PRIME = np.uint64(1099511628211)
+_HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+_batch_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _batch_semaphore
+    if _batch_semaphore is None:
+        _batch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
+    return _batch_semaphore
+
+
+def _hash_embedding(text: str, dims: int = 1536) -> np.ndarray:
+    """Deterministic fallback: signed hashed character 3/4-grams, L2-normalized.
+
+    Unlike a repeated digest, texts sharing substrings land near each other,
+    so retrieval still works (lexically) while the provider is down.
+    """
+    data = np.frombuffer(f" {text.lower()} ".encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+    vector = np.zeros(dims, dtype=np.float64)
+    for n in _HASH_NGRAM_SIZES:
+        if len(data) < n:
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(data, n)
+        hashes = np.full(len(windows), n, dtype=np.uint64)
+        for j in range(n):
+            hashes = hashes * _HASH_PRIME + windows[:, j]
+        hashes *= _HASH_MIX
+        hashes ^= hashes >> np.uint64(29)
+        buckets = (hashes % np.uint64(dims)).astype(np.intp)
+        signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+        vector += np.bincount(buckets, weights=signs, minlength=dims)
+    return l2_normalize(vector.astype(np.float32))
+
+
+def _normalize_embedding(embedding: Sequence[float], dims: int = 1536) -> np.ndarray:
+    vector = to_array(embedding)
+    if len(vector) >= dims:
+        return l2_normalize(vector[:dims])
+    return l2_normalize(np.pad(vector, (0, dims - len(vector))))
+
+
+async def _embed_batch_gemini(texts: List[str], task_type: str) -> List[List[float]]:
+    payload = {
+        "requests": [
+            {
+                "model": EMBEDDING_MODEL,
+                "content": {"parts": [{"text": text[:MAX_EMBED_CHARS]}]},
+                "taskType": task_type.upper(),
+            }
+            for text in texts
+        ]
+    }
+    async with _get_semaphore():
+        response = await http_clients.get("gemini").post(
+            GEMINI_EMBED_URL.format(model=EMBEDDING_MODEL),
+            params={"key": settings.gemini_api_key},
+            json=payload,
+            timeout=30,
+        )
+        response.raise_for_status()
+        data = response.json()
+    embeddings = [item.get("values") or [] for item in data.get("embeddings", [])]
+    if len(embeddings) != len(texts):
+        raise ValueError("Embedding batch size mismatch")
+    return embeddings
+
+
+async def generate_embeddings(
+    texts: List[str],
+    dims: int = 1536,
+    task_type: str = "retrieval_document",
+) -> List[np.ndarray]:
+    """Embed many texts into float32 vectors, preserving order.
+
+    Non-empty texts are packed into PROVIDER_BATCH_LIMIT-sized requests that
+    run concurrently (at most MAX_CONCURRENT_BATCHES in flight). The
+    embedding cache is consulted first and duplicate texts are sent once.
+    A failed batch falls back to hash embeddings for just those texts.
+    """
+    cleaned = [(t or "").strip() for t in texts]
+    results: List[Optional[np.ndarray]] = [
+        None if text else np.zeros(dims, dtype=np.float32) for text in cleaned
+    ]
+    keys = {
+        i: cache_key(text, EMBEDDING_MODEL, task_type, dims)
+        for i, text in enumerate(cleaned) if text
+    }
+
+    cached = await embedding_cache.get_many(keys.values())
+    for i, key in keys.items():
+        if key in cached:
+            results[i] = cached[key]
+
+    # One provider slot per distinct uncached text
+    pending_by_key: Dict[str, int] = {}
+    for i, key in keys.items():
+        if results[i] is None:
+            pending_by_key.setdefault(key, i)
+    pending = list(pending_by_key.values())
+
+    if pending and settings.gemini_api_key:
+        batches = [
+            pending[i:i + PROVIDER_BATCH_LIMIT]
+            for i in range(0, len(pending), PROVIDER_BATCH_LIMIT)
+        ]
+        outcomes = await asyncio.gather(
+            *(_embed_batch_gemini([cleaned[i] for i in batch], task_type) for batch in batches),
+            return_exceptions=True,
+        )
+        fresh: Dict[str, np.ndarray] = {}
+        for batch, outcome in zip(batches, outcomes):
+            if isinstance(outcome, BaseException):
+                continue
+            for i, embedding in zip(batch, outcome):
+                if embedding:
+                    fresh[keys[i]] = _normalize_embedding(embedding, dims)
+        # Hash fallbacks are never cached so they get upgraded on the next call
+        await embedding_cache.put_many(fresh, EMBEDDING_MODEL, dims)
+        for i, key in keys.items():
+            if results[i] is None and key in fresh:
+                results[i] = fresh[key]
+
+    return [
+        embedding if embedding is not None else _hash_embedding(cleaned[i], dims)
+        for i, embedding in enumerate(results)
+    ]
 
 
-def _hash_embedding(text: str, dims: int = 1536) -> List[float]:
-    hash_bytes = hashlib.sha256(text.encode()).digest()
-    embedding = []
-    for i in range(dims):
-        byte_idx = i % len(hash_bytes)
-        embedding.append((hash_bytes[byte_idx] - 128) / 128.0)
-    return embedding
-
-
-def _normalize_embedding(embedding: List[float], dims: int = 1536) -> List[float]:
-    if len(embedding) >= dims:
-        return embedding[:dims]
-    return embedding + [0.0] * (dims - len(embedding))
-
-
-async def generate_embedding(text: str, dims: int = 1536) -> List[float]:
-    text = text.strip()
-    if not text:
-        return [0.0] * dims
-
-    try:
-        if settings.gemini_api_key:
-            import google.generativeai as genai
-            genai.configure(api_key=settings.gemini_api_key)
-            result = genai.embed_content(
-                model="models/embedding-001",
-                content=text[:8000],
-                task_type="retrieval_document"
-            )
-            embedding = result.get("embedding") if isinstance(result, dict) else result
-            return _normalize_embedding(embedding, dims)
-    except Exception:
-        pass
-
-    return _hash_embedding(text, dims)
+async def generate_embedding(text: str, dims: int = 1536) -> np.ndarray:
+    return (await generate_embeddings([text], dims))[0]
@@ -0,0 +1,262 @@
+"""
+📄 Aureon Cortex - Document Extraction
+PDF/DOCX parsing is CPU-bound, so it runs in a bounded process pool
+instead of on the event loop. Large PDFs are split into page ranges that
+extract in parallel and are yielded back in page order.
+
+Worker functions take a file path (the spooled upload) and return plain
+strings, so nothing large crosses the process boundary twice.
+
+A timed-out upload whose work is still running (a pathological page, a
+huge DOCX) gets its pool killed and replaced, so the timeout bounds CPU
+and not just the wait. Work from other uploads that shared the killed
+pool is resubmitted once to the new pool.
+"""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Deque, List, Optional, Tuple
+import asyncio
+import codecs
+import multiprocessing
+import time
+import zipfile
+from xml.etree import ElementTree
+
+from core.config import settings
+
+TEXT_BLOCK_BYTES = 64 * 1024
+DOCX_PARAGRAPHS_PER_SEGMENT = 200
+# DOCX has no pages; ingestion_max_pages is applied as this many paragraphs per page
+DOCX_PARAGRAPHS_PER_PAGE = 25
+# Workers are replaced after this many tasks (pypdf caches grow)
+MAX_TASKS_PER_WORKER = 50
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class ExtractionTimeout(Exception):
+    """Extraction ran past `ingestion_timeout_s`."""
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and thread pools is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.ingestion_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=MAX_TASKS_PER_WORKER,
+        )
+    return _pool
+
+
+def shutdown() -> None:
+    """Stop the extraction workers (FastAPI lifespan)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _recycle(pool: ProcessPoolExecutor) -> None:
+    """Kill `pool`'s workers (stuck on timed-out work); the next submit gets a fresh pool."""
+    global _pool
+    if _pool is not pool:
+        return  # already replaced
+    _pool = None
+    print("[Extraction] Timed-out work still running, recycling the worker pool")
+    # ProcessPoolExecutor has no public way to stop running work; `_processes`
+    # (pid -> Process) is a CPython implementation detail. Without it the
+    # stuck worker exits on its own once its task finishes.
+    try:
+        processes = list(getattr(pool, "_processes", None).values())
+    except Exception as e:
+        print(f"[Extraction] Cannot reach pool workers ({e}); letting them finish")
+        processes = []
+    for process in processes:
+        try:
+            process.kill()
+        except Exception as e:
+            print(f"[Extraction] Could not kill worker {getattr(process, 'pid', '?')}: {e}")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Worker side (runs in the pool) ---
+
+def _pdf_page_count(path: str) -> int:
+    try:
+        from pypdf import PdfReader
+    except Exception:
+        return 0
+    return len(PdfReader(path).pages)
+
+
+def _pdf_pages(path: str, start: int, end: int) -> List[str]:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _docx_paragraph_text(paragraph: ElementTree.Element) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == f"{_W}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{_W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{_W}br", f"{_W}cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _docx_segments(path: str, max_paragraphs: int) -> List[str]:
+    """Paragraph text (body and tables) streamed from word/document.xml, capped."""
+    segments: List[str] = []
+    current: List[str] = []
+    count = 0
+    try:
+        archive = zipfile.ZipFile(path)
+        handle = archive.open("word/document.xml")
+    except (zipfile.BadZipFile, KeyError):
+        return []
+    with archive, handle:
+        for _, node in ElementTree.iterparse(handle, events=("end",)):
+            if node.tag != f"{_W}p":
+                continue
+            current.append(_docx_paragraph_text(node) + "\n")
+            node.clear()
+            count += 1
+            if len(current) >= DOCX_PARAGRAPHS_PER_SEGMENT:
+                segments.append("".join(current))
+                current = []
+            if count >= max_paragraphs:
+                print(f"[Extraction] {path}: keeping the first {max_paragraphs} paragraphs")
+                break
+    if current:
+        segments.append("".join(current))
+    return segments
+
+
+# --- Event loop side ---
+
+@dataclass
+class _Work:
+    """One pool submission, resubmittable if another upload's timeout killed its pool."""
+    fn: Callable[..., Any]
+    args: Tuple
+    pool: ProcessPoolExecutor
+    future: Future
+
+    @classmethod
+    def submit(cls, fn: Callable[..., Any], *args) -> "_Work":
+        pool = _get_pool()
+        return cls(fn, args, pool, pool.submit(fn, *args))
+
+    def abandon(self) -> None:
+        """Drop queued work; recycle the pool if it is already running."""
+        if not self.future.cancel() and not self.future.done():
+            _recycle(self.pool)
+
+
+def _timeout() -> ExtractionTimeout:
+    return ExtractionTimeout(f"extraction exceeded {settings.ingestion_timeout_s:.0f}s")
+
+
+async def _await_work(work: _Work, deadline: float, retried: bool = False):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise _timeout()
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(work.future), remaining)
+    except asyncio.TimeoutError:
+        raise _timeout() from None
+    except BrokenProcessPool:
+        if retried or work.pool is _pool:
+            raise
+        # Killed by another upload's timeout: run it again on the fresh pool
+        work.pool = _get_pool()
+        work.future = work.pool.submit(work.fn, *work.args)
+        return await _await_work(work, deadline, retried=True)
+
+
+async def _iter_pdf(path: str, deadline: float) -> AsyncIterator[str]:
+    count = _Work.submit(_pdf_page_count, path)
+    try:
+        pages = await _await_work(count, deadline)
+    finally:
+        count.abandon()
+    if pages > settings.ingestion_max_pages:
+        print(f"[Extraction] {path}: {pages} pages, keeping the first {settings.ingestion_max_pages}")
+        pages = settings.ingestion_max_pages
+
+    step = max(1, settings.ingestion_pages_per_task)
+    ranges = [(start, min(pages, start + step)) for start in range(0, pages, step)]
+    # Bounded read-ahead keeps one upload from flooding the pool
+    window = max(1, settings.ingestion_workers * 2)
+    in_flight: Deque[_Work] = deque()
+    try:
+        for start, end in ranges:
+            in_flight.append(_Work.submit(_pdf_pages, path, start, end))
+            if len(in_flight) >= window:
+                for text in await _await_work(in_flight[0], deadline):
+                    yield text
+                in_flight.popleft()
+        while in_flight:
+            for text in await _await_work(in_flight[0], deadline):
+                yield text
+            in_flight.popleft()
+    finally:
+        # Timeout, client gone or consumer stopped: drop queued ranges and
+        # kill the pool if a range is still running
+        for work in in_flight:
+            work.abandon()
+
+
+async def _iter_docx(path: str, deadline: float) -> AsyncIterator[str]:
+    max_paragraphs = settings.ingestion_max_pages * DOCX_PARAGRAPHS_PER_PAGE
+    work = _Work.submit(_docx_segments, path, max_paragraphs)
+    try:
+        segments = await _await_work(work, deadline)
+    finally:
+        work.abandon()
+    for segment in segments:
+        yield segment
+
+
+async def _iter_plain_text(path: str, deadline: float) -> AsyncIterator[str]:
+    # Decoding is cheap; stays in-process
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as handle:
+        while True:
+            if time.monotonic() > deadline:
+                raise _timeout()
+            block = handle.read(TEXT_BLOCK_BYTES)
+            try:
+                text = decoder.decode(block, final=not block)
+            except UnicodeDecodeError:
+                # Not text after all: keep what was already valid
+                print(f"[Extraction] {path}: not valid UTF-8, stopping extraction")
+                return
+            if text:
+                yield text
+            if not block:
+                return
+
+
+def iter_text(path: str, content_type: str, filename: str) -> AsyncIterator[str]:
+    """Text of the spooled file as a stream of segments (pages, paragraphs, blocks)."""
+    deadline = time.monotonic() + settings.ingestion_timeout_s
+    content_type = (content_type or "").lower()
+    if content_type == "application/pdf" or filename.lower().endswith(".pdf"):
+        return _iter_pdf(path, deadline)
+    if content_type in ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/msword") or filename.lower().endswith(".docx"):
+        return _iter_docx(path, deadline)
+    # Plain text fallback
+    return _iter_plain_text(path, deadline)
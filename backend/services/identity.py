@@ -1,6 +1,10 @@
 """
 🔐 Aureon Cortex - Identity Service (Supabase)
 Unified user identity management across channels.
+
+Webhook senders (phone / telegram_id) resolve through an in-process cache of
+(profile, tenant_id, verified), including negative entries for unknown
+senders; verify_channel invalidates it.
 """
 from __future__ import annotations
 
@@ -11,7 +15,9 @@ import uuid
 import random
 import string
 
-from core.supabase import get_supabase_admin
+from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
+from core.auth_cache import TTLCache, identity_cache
 
 
 @dataclass
@@ -26,9 +32,18 @@ class ChannelVerification:
     created_at: datetime = None
 
 
+def _channel_key(channel: str, identifier) -> str:
+    if channel == "whatsapp":
+        return f"whatsapp:{str(identifier).replace('+', '').replace(' ', '')}"
+    return f"{channel}:{identifier}"
+
+
 class IdentityService:
     """Manages unified identity across PWA, Telegram, and WhatsApp."""
 
+    def __init__(self):
+        self.channel_cache = TTLCache(max_entries=settings.identity_cache_max_entries)
+
     def _generate_code(self, length: int = 6) -> str:
         return ''.join(random.choices(string.digits, k=length))
 
@@ -40,7 +55,7 @@ class IdentityService:
         if not user_id:
             return {}
 
-        existing = admin.table("user_profiles").select("id, email").eq("id", user_id).limit(1).execute()
+        existing = await db_execute(admin.table("user_profiles").select("id, email").eq("id", user_id).limit(1))
         if existing and existing.data:
             return existing.data[0]
 
@@ -50,30 +65,76 @@ class IdentityService:
             "email": email,
             "display_name": (email or "User").split("@")[0],
         }
-        inserted = admin.table("user_profiles").insert(profile).execute()
+        inserted = await db_execute(admin.table("user_profiles").insert(profile))
         return inserted.data[0] if inserted and inserted.data else profile
 
     async def get_profile(self, user_id: str) -> Optional[Dict]:
         admin = get_supabase_admin()
-        res = admin.table("user_profiles").select("*").eq("id", user_id).limit(1).execute()
+        res = await db_execute(admin.table("user_profiles").select("*").eq("id", user_id).limit(1))
         return res.data[0] if res and res.data else None
 
     async def get_by_email(self, email: str) -> Optional[Dict]:
         admin = get_supabase_admin()
-        res = admin.table("user_profiles").select("*").eq("email", email).limit(1).execute()
+        res = await db_execute(admin.table("user_profiles").select("*").eq("email", email).limit(1))
         return res.data[0] if res and res.data else None
 
     async def get_by_telegram(self, telegram_id: int) -> Optional[Dict]:
         admin = get_supabase_admin()
-        res = admin.table("user_profiles").select("*").eq("telegram_id", telegram_id).limit(1).execute()
+        res = await db_execute(admin.table("user_profiles").select("*").eq("telegram_id", telegram_id).limit(1))
         return res.data[0] if res and res.data else None
 
     async def get_by_whatsapp(self, phone: str) -> Optional[Dict]:
         phone_clean = phone.replace("+", "").replace(" ", "")
         admin = get_supabase_admin()
-        res = admin.table("user_profiles").select("*").eq("whatsapp_phone", phone_clean).limit(1).execute()
+        res = await db_execute(admin.table("user_profiles").select("*").eq("whatsapp_phone", phone_clean).limit(1))
         return res.data[0] if res and res.data else None
 
+    async def resolve_tenant(self, user_id: str) -> Optional[str]:
+        cached = identity_cache.get(user_id, "tenant") or identity_cache.get(user_id, "tenant_ref")
+        if cached:
+            return cached["id"]
+        admin = get_supabase_admin()
+        res = await db_execute(admin.table("tenant_users").select("tenant_id").eq("user_id", user_id).limit(1))
+        if res and res.data:
+            identity_cache.set(user_id, "tenant_ref", {"id": res.data[0]["tenant_id"]})
+            return res.data[0]["tenant_id"]
+        return None
+
+    async def resolve_channel(self, channel: str, identifier) -> Dict:
+        """
+        Cached sender lookup for telegram / whatsapp.
+        Returns {"profile": Optional[Dict], "tenant_id": Optional[str], "verified": bool}.
+        """
+        key = _channel_key(channel, identifier)
+        cached = self.channel_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if channel == "telegram":
+            profile = await self.get_by_telegram(int(identifier))
+        elif channel == "whatsapp":
+            profile = await self.get_by_whatsapp(str(identifier))
+        else:
+            raise ValueError(f"Unsupported channel: {channel}")
+
+        entry = {
+            "profile": profile,
+            "tenant_id": await self.resolve_tenant(profile["id"]) if profile else None,
+            "verified": bool(profile and profile.get(f"{channel}_verified_at")),
+        }
+        ttl = settings.identity_cache_ttl_s if entry["verified"] else settings.identity_negative_ttl_s
+        self.channel_cache.set(key, entry, ttl)
+        return entry
+
+    def invalidate_channel(self, channel: Optional[str] = None, identifier=None, user_id: Optional[str] = None) -> None:
+        """Drop a sender entry and/or every entry pointing at `user_id`."""
+        if channel and identifier is not None:
+            self.channel_cache.pop(_channel_key(channel, identifier))
+        if user_id:
+            for key, entry in self.channel_cache.items():
+                if (entry.get("profile") or {}).get("id") == user_id:
+                    self.channel_cache.pop(key)
+
     async def get_or_create_from_channel(
         self,
         channel: str,
@@ -93,11 +154,8 @@ class IdentityService:
                 })
             return profile
 
-        if channel == "telegram":
-            return await self.get_by_telegram(int(identifier))
-
-        if channel == "whatsapp":
-            return await self.get_by_whatsapp(identifier)
+        if channel in ("telegram", "whatsapp"):
+            return (await self.resolve_channel(channel, identifier))["profile"]
 
         return None
 
@@ -111,7 +169,7 @@ class IdentityService:
             "verification_code": code,
             "expires_at": (datetime.utcnow() + timedelta(minutes=15)).isoformat(),
         }
-        admin.table("channel_verifications").insert(payload).execute()
+        await db_execute(admin.table("channel_verifications").insert(payload))
         return ChannelVerification(
             id=payload["id"],
             user_id=user_id,
@@ -123,7 +181,7 @@ class IdentityService:
 
     async def verify_channel(self, code: str, channel: str, channel_identifier: str) -> Optional[Dict]:
         admin = get_supabase_admin()
-        verification = admin.table("channel_verifications").select("*").eq("verification_code", code).eq("channel", channel).limit(1).execute()
+        verification = await db_execute(admin.table("channel_verifications").select("*").eq("verification_code", code).eq("channel", channel).limit(1))
         if not verification or not verification.data:
             return None
 
@@ -149,12 +207,14 @@ class IdentityService:
         else:
             return None
 
-        admin.table("user_profiles").update(updates).eq("id", user_id).execute()
-        admin.table("channel_verifications").update({
+        await db_execute(admin.table("user_profiles").update(updates).eq("id", user_id))
+        await db_execute(admin.table("channel_verifications").update({
             "verified_at": now_iso,
             "channel_identifier": channel_identifier,
-        }).eq("id", record["id"]).execute()
+        }).eq("id", record["id"]))
 
+        # Old identifier of this user and the (negatively cached) new one
+        self.invalidate_channel(channel, channel_identifier, user_id=user_id)
         return await self.get_profile(user_id)
 
 
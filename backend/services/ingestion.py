@@ -1,114 +1,358 @@
 """
 📥 Aureon Cortex - Knowledge Ingestion Service
 Uploads files to Supabase Storage and creates vectorized chunks.
+
+Uploads are streamed end to end: the request body is spooled to a temp
+file in fixed-size blocks, storage reads from that file, text is
+extracted page by page (services/extraction.py, off the event loop),
+chunked incrementally (services/chunking.py) and inserted in bounded
+batches. Memory per upload stays flat regardless of document size.
 """
 from __future__ import annotations
 
-from typing import List, Dict
-import io
-import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import hashlib
+import os
+import tempfile
 
 from core.config import settings
-from core.supabase import get_supabase_admin
-from services.embeddings import generate_embedding
-
-
-def _chunk_text(text: str, chunk_size: int = 900, overlap: int = 120) -> List[str]:
-    text = text.strip()
-    if not text:
-        return []
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(len(text), start + chunk_size)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        start = end - overlap
-        if start < 0:
-            start = 0
-        if start >= len(text):
-            break
-    return chunks
+from core.supabase import get_supabase_admin, db_execute, run_blocking
+from services.embeddings import generate_embeddings
+from services.extraction import iter_text
+from services.chunking import Chunk, Chunker, ChunkerConfig
+from services.vectors import to_pgvector
+from services.jobs import job_queue
 
+EMBED_PAGE_SIZE = 400  # rows per page; embedded as concurrent provider batches
+INSERT_BATCH_SIZE = 200  # chunk rows per insert
+SPOOL_BLOCK_BYTES = 1024 * 1024
+SUMMARY_CHARS = 280
+EXISTING_PAGE_SIZE = 1000  # chunk ids read per page when diffing a re-upload
 
-def _extract_text_from_pdf(file_bytes: bytes) -> str:
-    try:
-        from pypdf import PdfReader
-    except Exception:
-        return ""
-    reader = PdfReader(io.BytesIO(file_bytes))
-    pages = [page.extract_text() or "" for page in reader.pages]
-    return "\n".join(pages)
 
+class UploadTooLarge(Exception):
+    """The upload exceeded `max_upload_mb` while being spooled."""
 
-def _extract_text_from_docx(file_bytes: bytes) -> str:
-    try:
-        import docx
-    except Exception:
-        return ""
-    document = docx.Document(io.BytesIO(file_bytes))
-    return "\n".join(p.text for p in document.paragraphs)
-
-
-def _extract_text(file_bytes: bytes, content_type: str, filename: str) -> str:
-    content_type = (content_type or "").lower()
-    if content_type == "application/pdf" or filename.lower().endswith(".pdf"):
-        return _extract_text_from_pdf(file_bytes)
-    if content_type in ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/msword") or filename.lower().endswith(".docx"):
-        return _extract_text_from_docx(file_bytes)
-    # Plain text fallback
+
+@dataclass
+class SpooledUpload:
+    path: str
+    sha256: str
+    size: int
+
+
+async def spool_upload(upload, max_bytes: int) -> SpooledUpload:
+    """Copy an UploadFile to a temp file block by block, hashing as it goes.
+
+    The caller owns the file and must remove it.
+    """
+    fd, path = tempfile.mkstemp(prefix="aureon-upload-")
+    digest = hashlib.sha256()
+    size = 0
     try:
-        return file_bytes.decode("utf-8")
-    except Exception:
-        return ""
+        with os.fdopen(fd, "wb") as spool:
+            while True:
+                block = await upload.read(SPOOL_BLOCK_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+                digest.update(block)
+                spool.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path=path, sha256=digest.hexdigest(), size=size)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(SPOOL_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_key(filename: str) -> str:
+    """Identity of a document across re-uploads."""
+    return " ".join(filename.split()).lower()
+
+
+async def _peek_summary(segments: AsyncIterator[str]) -> Tuple[str, AsyncIterator[str]]:
+    """First SUMMARY_CHARS of the text, plus the segment stream rewound."""
+    consumed: List[str] = []
+    head = ""
+    async for segment in segments:
+        consumed.append(segment)
+        head += segment
+        if len(head.strip()) > SUMMARY_CHARS:
+            break
+    head = head.strip()
+    summary = (head[:SUMMARY_CHARS] + "...") if len(head) > SUMMARY_CHARS else head
+
+    async def rewound() -> AsyncIterator[str]:
+        for segment in consumed:
+            yield segment
+        async for segment in segments:
+            yield segment
+
+    return summary, rewound()
 
 
 class IngestionService:
-    async def ingest_upload(self, tenant_id: str, user_id: str, filename: str, content_type: str, file_bytes: bytes) -> Dict:
+    async def ingest_upload(
+        self,
+        tenant_id: str,
+        user_id: str,
+        filename: str,
+        content_type: str,
+        file_path: str,
+        file_hash: Optional[str] = None,
+    ) -> Dict:
+        """Ingest a spooled upload (see `spool_upload`) without loading it whole.
+
+        Content-addressed: an identical file is skipped, and a new version of
+        a known document (same source key) only writes the chunks whose
+        content changed and deletes the ones that disappeared.
+        """
         admin = get_supabase_admin()
         storage = admin.storage.from_(settings.supabase_storage_bucket)
+        file_hash = file_hash or _file_sha256(file_path)
 
-        file_id = str(uuid.uuid4())
-        storage_path = f"{tenant_id}/{file_id}-{filename}"
-
-        storage.upload(
-            storage_path,
-            file_bytes,
-            file_options={"content-type": content_type or "application/octet-stream"},
-        )
+        same = await self._find_source(tenant_id, file_hash=file_hash)
+        if same:
+            job = None
+            # Chunks left without vectors by an interrupted or failed embed job
+            if await self._has_unembedded(same["id"]):
+                job = await self._enqueue_embed(same["id"], tenant_id, user_id)
+            return {
+                "status": "unchanged",
+                "source": same,
+                "chunk_count": await self._count_chunks(same["id"]),
+                "embedding_job_id": job["id"] if job else None,
+            }
 
-        text = _extract_text(file_bytes, content_type, filename)
-        chunks = _chunk_text(text)
+        previous = await self._find_source(tenant_id, key=source_key(filename))
+        storage_path = f"{tenant_id}/{file_hash[:16]}-{filename}"
 
-        source_payload = {
-            "tenant_id": tenant_id,
-            "title": filename,
-            "source_type": "pdf" if filename.lower().endswith(".pdf") else "text",
-            "source_url": storage_path,
-            "summary": (text[:280] + "...") if len(text) > 280 else text,
-        }
-        source_insert = admin.table("knowledge_sources").insert(source_payload).execute()
-        source = source_insert.data[0]
+        # storage3 streams file objects as multipart
+        with open(file_path, "rb") as handle:
+            await run_blocking(
+                storage.upload,
+                storage_path,
+                handle,
+                file_options={"content-type": content_type or "application/octet-stream", "upsert": "true"},
+            )
 
-        chunk_rows = []
-        for idx, chunk in enumerate(chunks):
-            embedding = await generate_embedding(chunk)
-            chunk_rows.append({
+        source = previous
+        existing: Dict[str, int] = {}
+        changes = {"inserted": 0, "moved": 0, "unchanged": 0, "deleted": 0}
+        text_stream = iter_text(file_path, content_type, filename)
+        try:
+            summary, segments = await _peek_summary(text_stream)
+            source_payload = {
                 "tenant_id": tenant_id,
-                "source_id": source["id"],
-                "chunk_index": idx,
-                "chunk_text": chunk,
-                "embedding": embedding,
-            })
+                "title": filename,
+                "source_type": "pdf" if filename.lower().endswith(".pdf") else "text",
+                "source_url": storage_path,
+                "summary": summary,
+                "source_key": source_key(filename),
+            }
+            if previous:
+                existing = await self._existing_chunks(previous["id"])
+            else:
+                # file_hash is only set once every chunk is written, so an
+                # interrupted ingestion is redone rather than skipped
+                source_insert = await db_execute(admin.table("knowledge_sources").insert(source_payload))
+                source = source_insert.data[0]
+
+            # New chunks are stored without vectors; the embedding job fills them in
+            chunker = Chunker(ChunkerConfig.for_tenant(tenant_id))
+            seen: Set[str] = set()
+            batch: List[Dict] = []
+            async for segment in segments:
+                for chunk in chunker.feed(segment):
+                    self._diff_chunk(tenant_id, source["id"], chunk, existing, seen, batch, changes)
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    await db_execute(admin.table("knowledge_chunks").upsert(batch, on_conflict="id"))
+                    batch = []
+            for chunk in chunker.flush():
+                self._diff_chunk(tenant_id, source["id"], chunk, existing, seen, batch, changes)
+            if batch:
+                await db_execute(admin.table("knowledge_chunks").upsert(batch, on_conflict="id"))
+
+            orphans = [chunk_id for chunk_id in existing if chunk_id not in seen]
+            for start in range(0, len(orphans), INSERT_BATCH_SIZE):
+                await db_execute(admin.table("knowledge_chunks").delete()
+                    .in_("id", orphans[start:start + INSERT_BATCH_SIZE]))
+            changes["deleted"] = len(orphans)
+
+            updated = await db_execute(admin.table("knowledge_sources")
+                .update({
+                    **source_payload,
+                    "file_hash": file_hash,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                })
+                .eq("id", source["id"]))
+            source = (updated.data or [source])[0]
+        except BaseException:
+            # Timeout, failure or client disconnect: a new source is removed
+            # entirely; an existing one keeps its old hash and is fully
+            # resynced by the next upload
+            await self._discard(
+                storage,
+                storage_path if not previous or previous.get("source_url") != storage_path else None,
+                None if previous else source,
+            )
+            raise
+        finally:
+            # Releases queued extraction work if we stopped early
+            await text_stream.aclose()
 
-        if chunk_rows:
-            admin.table("knowledge_chunks").insert(chunk_rows).execute()
+        if previous and previous.get("source_url") and previous["source_url"] != storage_path:
+            await self._discard(storage, previous["source_url"], None)
+
+        job = None
+        if changes["inserted"] or (previous and await self._has_unembedded(source["id"])):
+            job = await self._enqueue_embed(source["id"], tenant_id, user_id)
 
         return {
+            "status": "updated" if previous else "created",
             "source": source,
-            "chunk_count": len(chunk_rows),
+            "chunk_count": len(seen),
+            "changes": changes,
+            "embedding_job_id": job["id"] if job else None,
+        }
+
+    @staticmethod
+    def _diff_chunk(
+        tenant_id: str,
+        source_id: str,
+        chunk: Chunk,
+        existing: Dict[str, int],
+        seen: Set[str],
+        batch: List[Dict],
+        changes: Dict[str, int],
+    ) -> None:
+        """Queue a write only for new chunks or unchanged ones that moved."""
+        row = IngestionService._chunk_row(tenant_id, source_id, chunk)
+        seen.add(row["id"])
+        previous_index = existing.get(row["id"])
+        if previous_index is None:
+            changes["inserted"] += 1
+            batch.append(row)
+        elif previous_index != chunk.index:
+            # Same content at a new position: upsert keeps the stored embedding
+            changes["moved"] += 1
+            batch.append(row)
+        else:
+            changes["unchanged"] += 1
+
+    async def _find_source(
+        self, tenant_id: str, file_hash: Optional[str] = None, key: Optional[str] = None
+    ) -> Optional[Dict]:
+        admin = get_supabase_admin()
+        query = admin.table("knowledge_sources").select("*").eq("tenant_id", tenant_id)
+        query = query.eq("file_hash", file_hash) if file_hash else query.eq("source_key", key)
+        res = await db_execute(query.order("created_at", desc=True).limit(1))
+        return res.data[0] if res and res.data else None
+
+    async def _count_chunks(self, source_id: str) -> int:
+        admin = get_supabase_admin()
+        res = await db_execute(admin.table("knowledge_chunks").select("id", count="exact")
+            .eq("source_id", source_id)
+            .limit(1))
+        return res.count or 0
+
+    async def _has_unembedded(self, source_id: str) -> bool:
+        admin = get_supabase_admin()
+        res = await db_execute(admin.table("knowledge_chunks").select("id")
+            .eq("source_id", source_id)
+            .is_("embedding", "null")
+            .limit(1))
+        return bool(res and res.data)
+
+    async def _enqueue_embed(self, source_id: str, tenant_id: str, user_id: str) -> Dict:
+        # Dedupe key: at most one live embed job per source
+        return await job_queue.enqueue(
+            "knowledge.embed",
+            {"source_id": source_id},
+            dedupe_key=f"knowledge.embed:{source_id}",
+            tenant_id=tenant_id,
+            user_id=user_id,
+        )
+
+    async def _existing_chunks(self, source_id: str) -> Dict[str, int]:
+        """chunk id -> chunk_index for a source, read in pages."""
+        admin = get_supabase_admin()
+        existing: Dict[str, int] = {}
+        start = 0
+        while True:
+            res = await db_execute(admin.table("knowledge_chunks")
+                .select("id,chunk_index")
+                .eq("source_id", source_id)
+                .order("id")
+                .range(start, start + EXISTING_PAGE_SIZE - 1))
+            rows = res.data or []
+            existing.update((row["id"], row["chunk_index"]) for row in rows)
+            if len(rows) < EXISTING_PAGE_SIZE:
+                return existing
+            start += EXISTING_PAGE_SIZE
+
+    @staticmethod
+    def _chunk_row(tenant_id: str, source_id: str, chunk: Chunk) -> Dict:
+        return {
+            "id": chunk.row_id(source_id),
+            "tenant_id": tenant_id,
+            "source_id": source_id,
+            "chunk_index": chunk.index,
+            "chunk_text": chunk.text,
+            "content_hash": chunk.content_hash,
+            "token_count": chunk.tokens,
+            "heading": chunk.heading or None,
         }
 
+    async def _discard(self, storage, storage_path: Optional[str], source: Optional[Dict]) -> None:
+        admin = get_supabase_admin()
+        try:
+            if source:
+                # knowledge_chunks cascade
+                await db_execute(admin.table("knowledge_sources").delete().eq("id", source["id"]))
+            if storage_path:
+                await run_blocking(storage.remove, [storage_path])
+        except Exception as e:
+            print(f"[Ingestion] Cleanup of {storage_path} failed: {e}")
+
+    async def embed_pending_chunks(self, source_id: str, batch_size: int = EMBED_PAGE_SIZE) -> int:
+        """Embed every chunk of a source that has no vector yet."""
+        admin = get_supabase_admin()
+        embedded = 0
+        while True:
+            res = await db_execute(admin.table("knowledge_chunks")
+                .select("id,tenant_id,source_id,chunk_index,chunk_text")
+                .eq("source_id", source_id)
+                .is_("embedding", "null")
+                .order("chunk_index")
+                .limit(batch_size))
+            rows = res.data or []
+            if not rows:
+                return embedded
+            embeddings = await generate_embeddings([row["chunk_text"] for row in rows])
+            for row, embedding in zip(rows, embeddings):
+                row["embedding"] = to_pgvector(embedding)
+            await db_execute(admin.table("knowledge_chunks").upsert(rows, on_conflict="id"))
+            embedded += len(rows)
+
 
 ingestion_service = IngestionService()
+
+
+async def _embed_job(payload: Dict) -> Dict:
+    embedded = await ingestion_service.embed_pending_chunks(payload["source_id"])
+    return {"embedded": embedded}
+
+
+job_queue.register("knowledge.embed", _embed_job)
@@ -4,10 +4,16 @@ Selector dinámico de proveedores de IA con fallback y rotación.
 Python 3.9 compatible.
 """
 from enum import Enum
-from typing import Optional, List
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, List, Tuple
+import asyncio
+import json
 import random
-import httpx
+import time
 from core.config import settings
+from core.http import http_clients
+from .routing import provider_router
+from .completion_cache import completion_cache, normalize_prompt
+from .embeddings import generate_embeddings
 
 
 class AIProvider(Enum):
@@ -18,14 +24,29 @@ class AIProvider(Enum):
     DEEPSEEK = "deepseek"
 
 
+class _AttemptsFailed(Exception):
+    """All providers tried in one routing step failed."""
+
+    def __init__(self, error: BaseException, tried: int):
+        super().__init__(str(error))
+        self.error = error
+        self.tried = tried
+
+
 class IntelligencePool:
     """
     Pool de inteligencia que maneja múltiples proveedores de IA.
     Soporta rotación de keys y fallback automático.
+
+    Sin provider explícito, el orden sale de `provider_router` (latencia
+    p50/p95, tasa de error, rate limits y circuit breakers). Si un provider
+    falla se reintenta con el siguiente; con LLM_HEDGE_ENABLED se lanza una
+    petición paralela al segundo cuando el primero supera su p95.
     """
     
     def __init__(self):
         self._gemini_index = 0
+        self._deepseek_client = None
         # Founder tier: GROQ + Gemini + Mistral (free combo)
         self._provider_order = [
             AIProvider.GROQ,      # Fastest, free tier
@@ -34,14 +55,19 @@ class IntelligencePool:
             AIProvider.DEEPSEEK,  # Cost-effective
         ]
     
-    def _get_next_gemini_key(self) -> str:
-        """Rotación round-robin de Gemini keys."""
+    def _next_gemini_key(self) -> Tuple[Optional[int], str]:
+        """Rotación round-robin de Gemini keys, saltando las que están en rate limit."""
         pool = settings.gemini_key_pool
         if not pool:
-            return settings.gemini_api_key
-        key = pool[self._gemini_index % len(pool)]
+            return None, settings.gemini_api_key
+        for _ in range(len(pool)):
+            index = self._gemini_index % len(pool)
+            self._gemini_index += 1
+            if provider_router.key_available(AIProvider.GEMINI.value, index):
+                return index, pool[index]
+        index = self._gemini_index % len(pool)
         self._gemini_index += 1
-        return key
+        return index, pool[index]
     
     def get_available_providers(self) -> List[AIProvider]:
         """Lista de proveedores con API key configurada."""
@@ -56,6 +82,128 @@ class IntelligencePool:
             available.append(AIProvider.DEEPSEEK)
         return available
     
+    def _candidates(self) -> List[AIProvider]:
+        """Proveedores configurados, ordenados por salud (mejor primero)."""
+        available = self.get_available_providers()
+        configured = [p for p in self._provider_order if p in available]
+        if not configured:
+            raise ValueError("No AI providers configured")
+        ranked = provider_router.rank([p.value for p in configured])
+        return [AIProvider(value) for value in ranked]
+
+    def _record_failure(self, provider: AIProvider, error: BaseException, key_index: Optional[int]) -> None:
+        key_count = len(settings.gemini_key_pool) if provider == AIProvider.GEMINI else 1
+        provider_router.record_failure(provider.value, error, key_index, key_count=key_count)
+
+    async def _call(
+        self,
+        provider: AIProvider,
+        prompt: str,
+        system_prompt: str,
+        model: Optional[str],
+        max_tokens: int,
+        temperature: float,
+    ) -> str:
+        """Un intento contra un provider, registrado en el router."""
+        key_index, api_key = self._next_gemini_key() if provider == AIProvider.GEMINI else (None, None)
+        provider_router.begin(provider.value)
+        started = time.perf_counter()
+        try:
+            # Route to provider-specific implementation
+            if provider == AIProvider.GEMINI:
+                text = await self._complete_gemini(prompt, system_prompt, model, max_tokens, temperature, api_key)
+            elif provider == AIProvider.GROQ:
+                text = await self._complete_groq(prompt, system_prompt, model, max_tokens, temperature)
+            elif provider == AIProvider.MISTRAL:
+                text = await self._complete_mistral(prompt, system_prompt, model, max_tokens, temperature)
+            elif provider == AIProvider.DEEPSEEK:
+                text = await self._complete_deepseek(prompt, system_prompt, model, max_tokens, temperature)
+            else:
+                raise ValueError(f"Unknown provider: {provider}")
+        except Exception as e:
+            self._record_failure(provider, e, key_index)
+            raise
+        except BaseException:
+            # Cancelled (e.g. lost a hedge race): not a provider failure
+            provider_router.abandon(provider.value)
+            raise
+        provider_router.record_success(provider.value, time.perf_counter() - started)
+        return text
+
+    async def _race(
+        self,
+        call: Callable[[AIProvider], Awaitable[str]],
+        primary: AIProvider,
+        hedge: Optional[AIProvider],
+    ) -> Tuple[str, AIProvider]:
+        """Run `primary`; if it outlives its p95, also run `hedge` and take the first success."""
+        delay = provider_router.hedge_delay_s(primary.value) if hedge else None
+        owners = {asyncio.ensure_future(call(primary)): primary}
+        pending = set(owners)
+        error: Optional[BaseException] = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and hedge:
+                second = asyncio.ensure_future(call(hedge))
+                owners[second] = hedge
+                pending.add(second)
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), owners[task]
+                    error = task.exception()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+        raise _AttemptsFailed(error, len(owners))
+
+    async def _cache_lookup(
+        self,
+        scope: Optional[str],
+        prompt: str,
+        system_prompt: str,
+        provider: Optional[AIProvider],
+        model: Optional[str],
+        temperature: float,
+        cache_key: Optional[str] = None,
+        cache_context: str = "",
+    ) -> Tuple[Optional[str], Optional[Dict]]:
+        """(cached text or None, state to store a fresh answer under)."""
+        if not completion_cache.enabled_for(scope, temperature):
+            return None, None
+        model_key = model or (provider.value if provider else "auto")
+        prompt = prompt if cache_key is None else cache_key
+        context, key = completion_cache.keys(system_prompt, prompt, model_key, temperature, cache_context)
+        state = {"scope": scope, "context": context, "key": key, "embedding": None}
+
+        entry = completion_cache.get_exact(scope, key)
+        if entry is not None:
+            return entry.text, {"hit": "exact"}
+
+        if settings.completion_cache_semantic:
+            try:
+                state["embedding"] = (await generate_embeddings(
+                    [normalize_prompt(prompt)], task_type="semantic_similarity"
+                ))[0]
+                entry = completion_cache.get_similar(scope, context, state["embedding"])
+                if entry is not None:
+                    return entry.text, {"hit": "semantic"}
+            except Exception as e:
+                print(f"[CompletionCache] Semantic lookup failed: {e}")
+
+        completion_cache.miss()
+        return None, state
+
+    def _cache_store(self, state: Optional[Dict], text: str, provider: str) -> None:
+        if not state or "key" not in state or not text:
+            return
+        completion_cache.put(
+            state["scope"], state["context"], state["key"], text, provider, state["embedding"]
+        )
+
     async def complete(
         self,
         prompt: str,
@@ -64,40 +212,83 @@ class IntelligencePool:
         model: Optional[str] = None,
         max_tokens: int = 2048,
         temperature: float = 0.7,
+        meta: Optional[Dict] = None,
+        cache_scope: Optional[str] = None,
+        cache_key: Optional[str] = None,
+        cache_context: str = "",
     ) -> str:
         """
-        Genera una respuesta usando el provider especificado o el primero disponible.
+        Genera una respuesta usando el provider especificado o el mejor disponible,
+        con failover al siguiente. `meta["provider"]` recibe el provider usado
+        (o "cache:exact" / "cache:semantic").
+
+        `cache_scope` (normalmente el tenant_id) activa la caché de respuestas
+        cuando COMPLETION_CACHE_ENABLED está encendido. Con prompts ensamblados,
+        `cache_key` es el texto por el que se indexa (el mensaje del usuario) y
+        `cache_context` todo lo demás de lo que depende la respuesta (usuario,
+        conocimiento); sin ellos se indexa por el prompt completo.
         """
-        if provider is None:
-            # Use first available in priority order
-            for p in self._provider_order:
-                if p in self.get_available_providers():
-                    provider = p
-                    break
-        
-        if provider is None:
-            raise ValueError("No AI providers configured")
-        
-        # Route to provider-specific implementation
-        if provider == AIProvider.GEMINI:
-            return await self._complete_gemini(prompt, system_prompt, model, max_tokens, temperature)
-        elif provider == AIProvider.GROQ:
-            return await self._complete_groq(prompt, system_prompt, model, max_tokens, temperature)
-        elif provider == AIProvider.MISTRAL:
-            return await self._complete_mistral(prompt, system_prompt, model, max_tokens, temperature)
-        elif provider == AIProvider.DEEPSEEK:
-            return await self._complete_deepseek(prompt, system_prompt, model, max_tokens, temperature)
-        else:
-            raise ValueError(f"Unknown provider: {provider}")
+        meta = meta if meta is not None else {}
+        cached, state = await self._cache_lookup(
+            cache_scope, prompt, system_prompt, provider, model, temperature, cache_key, cache_context
+        )
+        if cached is not None:
+            meta["provider"] = f"cache:{state['hit']}"
+            return cached
+
+        text = await self._complete_routed(
+            prompt, system_prompt, provider, model, max_tokens, temperature, meta
+        )
+        self._cache_store(state, text, meta.get("provider", "auto"))
+        return text
+
+    async def _complete_routed(
+        self,
+        prompt: str,
+        system_prompt: str,
+        provider: Optional[AIProvider],
+        model: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        meta: Dict,
+    ) -> str:
+        if provider is not None:
+            text = await self._call(provider, prompt, system_prompt, model, max_tokens, temperature)
+            meta["provider"] = provider.value
+            return text
+
+        candidates = self._candidates()
+
+        async def call(p: AIProvider) -> str:
+            return await self._call(p, prompt, system_prompt, model, max_tokens, temperature)
+
+        last_error: Optional[BaseException] = None
+        index = 0
+        while index < len(candidates) and index < settings.llm_max_attempts:
+            primary = candidates[index]
+            hedge = None
+            if settings.llm_hedge_enabled and index + 1 < min(len(candidates), settings.llm_max_attempts):
+                hedge = candidates[index + 1]
+            try:
+                text, used = await self._race(call, primary, hedge)
+            except _AttemptsFailed as failed:
+                print(f"⚠️ IntelligencePool: {primary.value} failed ({failed.error}), failing over")
+                last_error = failed.error
+                index += failed.tried
+                continue
+            meta["provider"] = used.value
+            return text
+
+        raise last_error or ValueError("No AI providers configured")
     
     async def _complete_gemini(
-        self, prompt: str, system: str, model: Optional[str], max_tokens: int, temp: float
+        self, prompt: str, system: str, model: Optional[str], max_tokens: int, temp: float,
+        api_key: Optional[str] = None,
     ) -> str:
         """Google Gemini API."""
         import google.generativeai as genai
         
-        api_key = self._get_next_gemini_key()
-        genai.configure(api_key=api_key)
+        genai.configure(api_key=api_key or self._next_gemini_key()[1])
         
         model_name = model or "gemini-2.0-flash"
         model_instance = genai.GenerativeModel(
@@ -105,7 +296,7 @@ class IntelligencePool:
             system_instruction=system
         )
         
-        response = model_instance.generate_content(
+        response = await model_instance.generate_content_async(
             prompt,
             generation_config=genai.GenerationConfig(
                 max_output_tokens=max_tokens,
@@ -118,57 +309,63 @@ class IntelligencePool:
         self, prompt: str, system: str, model: Optional[str], max_tokens: int, temp: float
     ) -> str:
         """Groq API (ultra-fast inference)."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={"Authorization": f"Bearer {settings.groq_api_key}"},
-                json={
-                    "model": model or "llama-3.3-70b-versatile",
-                    "messages": [
-                        {"role": "system", "content": system},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "max_tokens": max_tokens,
-                    "temperature": temp
-                },
-                timeout=60
-            )
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
+        response = await http_clients.get("groq").post(
+            "https://api.groq.com/openai/v1/chat/completions",
+            headers={"Authorization": f"Bearer {settings.groq_api_key}"},
+            json={
+                "model": model or "llama-3.3-70b-versatile",
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt}
+                ],
+                "max_tokens": max_tokens,
+                "temperature": temp
+            },
+            timeout=60
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"]
     
     async def _complete_mistral(
         self, prompt: str, system: str, model: Optional[str], max_tokens: int, temp: float
     ) -> str:
         """Mistral API."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.mistral.ai/v1/chat/completions",
-                headers={"Authorization": f"Bearer {settings.mistral_api_key}"},
-                json={
-                    "model": model or "mistral-small-latest",
-                    "messages": [
-                        {"role": "system", "content": system},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "max_tokens": max_tokens,
-                    "temperature": temp
-                },
-                timeout=60
-            )
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
+        response = await http_clients.get("mistral").post(
+            "https://api.mistral.ai/v1/chat/completions",
+            headers={"Authorization": f"Bearer {settings.mistral_api_key}"},
+            json={
+                "model": model or "mistral-small-latest",
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt}
+                ],
+                "max_tokens": max_tokens,
+                "temperature": temp
+            },
+            timeout=60
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"]
     
+    def _get_deepseek_client(self):
+        """AsyncOpenAI client reused across calls, on the shared 'deepseek' pool."""
+        if self._deepseek_client is None:
+            from openai import AsyncOpenAI
+
+            self._deepseek_client = AsyncOpenAI(
+                api_key=settings.deepseek_api_key,
+                base_url="https://api.deepseek.com",
+                http_client=http_clients.get("deepseek"),
+            )
+        return self._deepseek_client
+
     async def _complete_deepseek(
         self, prompt: str, system: str, model: Optional[str], max_tokens: int, temp: float
     ) -> str:
         """DeepSeek API (OpenAI-compatible)."""
-        from openai import AsyncOpenAI
-        
-        client = AsyncOpenAI(
-            api_key=settings.deepseek_api_key,
-            base_url="https://api.deepseek.com"
-        )
-        response = await client.chat.completions.create(
+        response = await self._get_deepseek_client().chat.completions.create(
             model=model or "deepseek-chat",
             messages=[
                 {"role": "system", "content": system},
@@ -180,5 +377,193 @@ class IntelligencePool:
         return response.choices[0].message.content
 
 
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+
+    async def stream_complete(
+        self,
+        prompt: str,
+        system_prompt: str = "Eres Auréon, un polímata digital.",
+        provider: Optional[AIProvider] = None,
+        model: Optional[str] = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.7,
+        meta: Optional[Dict] = None,
+        cache_scope: Optional[str] = None,
+        cache_key: Optional[str] = None,
+        cache_context: str = "",
+    ) -> AsyncIterator[str]:
+        """
+        Igual que complete(), pero emite los deltas de texto según llegan.
+        El failover solo ocurre antes del primer token; la latencia registrada
+        en el router es el tiempo hasta el primer token. Un acierto de caché
+        se emite como un único delta.
+        """
+        meta = meta if meta is not None else {}
+        cached, state = await self._cache_lookup(
+            cache_scope, prompt, system_prompt, provider, model, temperature, cache_key, cache_context
+        )
+        if cached is not None:
+            meta["provider"] = f"cache:{state['hit']}"
+            yield cached
+            return
+
+        pieces: List[str] = []
+        async for delta in self._stream_routed(
+            prompt, system_prompt, provider, model, max_tokens, temperature, meta
+        ):
+            pieces.append(delta)
+            yield delta
+        self._cache_store(state, "".join(pieces), meta.get("provider", "auto"))
+
+    async def _stream_routed(
+        self,
+        prompt: str,
+        system_prompt: str,
+        provider: Optional[AIProvider],
+        model: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        meta: Dict,
+    ) -> AsyncIterator[str]:
+        candidates = [provider] if provider is not None else self._candidates()[:settings.llm_max_attempts]
+
+        last_error: Optional[BaseException] = None
+        for candidate in candidates:
+            key_index, api_key = self._next_gemini_key() if candidate == AIProvider.GEMINI else (None, None)
+            provider_router.begin(candidate.value)
+            started = time.perf_counter()
+            first = True
+            try:
+                async for delta in self._open_stream(
+                    candidate, prompt, system_prompt, model, max_tokens, temperature, api_key
+                ):
+                    if first:
+                        first = False
+                        provider_router.record_success(candidate.value, time.perf_counter() - started)
+                        meta["provider"] = candidate.value
+                    yield delta
+            except Exception as e:
+                self._record_failure(candidate, e, key_index)
+                if not first:
+                    raise  # the client already has part of this answer
+                print(f"⚠️ IntelligencePool: {candidate.value} stream failed ({e}), failing over")
+                last_error = e
+                continue
+            except BaseException:
+                provider_router.abandon(candidate.value)
+                raise
+            if first:
+                provider_router.record_success(candidate.value, time.perf_counter() - started)
+                meta["provider"] = candidate.value
+            return
+
+        raise last_error or ValueError("No AI providers configured")
+
+    def _open_stream(
+        self,
+        provider: AIProvider,
+        prompt: str,
+        system_prompt: str,
+        model: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        api_key: Optional[str],
+    ) -> AsyncIterator[str]:
+        if provider == AIProvider.GEMINI:
+            return self._stream_gemini(prompt, system_prompt, model, max_tokens, temperature, api_key)
+        if provider == AIProvider.GROQ:
+            return self._stream_openai_compatible(
+                "groq", "https://api.groq.com/openai/v1/chat/completions", settings.groq_api_key,
+                model or "llama-3.3-70b-versatile", prompt, system_prompt, max_tokens, temperature,
+            )
+        if provider == AIProvider.MISTRAL:
+            return self._stream_openai_compatible(
+                "mistral", "https://api.mistral.ai/v1/chat/completions", settings.mistral_api_key,
+                model or "mistral-small-latest", prompt, system_prompt, max_tokens, temperature,
+            )
+        if provider == AIProvider.DEEPSEEK:
+            return self._stream_openai_compatible(
+                "deepseek", "https://api.deepseek.com/chat/completions", settings.deepseek_api_key,
+                model or "deepseek-chat", prompt, system_prompt, max_tokens, temperature,
+            )
+        raise ValueError(f"Unknown provider: {provider}")
+
+    async def _stream_openai_compatible(
+        self,
+        client_name: str,
+        url: str,
+        api_key: str,
+        model: str,
+        prompt: str,
+        system: str,
+        max_tokens: int,
+        temp: float,
+    ) -> AsyncIterator[str]:
+        """Chat completions con `stream: true` (SSE estilo OpenAI)."""
+        async with http_clients.get(client_name).stream(
+            "POST",
+            url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            json={
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt}
+                ],
+                "max_tokens": max_tokens,
+                "temperature": temp,
+                "stream": True,
+            },
+            timeout=60,
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                for choice in chunk.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def _stream_gemini(
+        self, prompt: str, system: str, model: Optional[str], max_tokens: int, temp: float,
+        api_key: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Google Gemini con stream=True."""
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or self._next_gemini_key()[1])
+
+        model_instance = genai.GenerativeModel(
+            model or "gemini-2.0-flash",
+            system_instruction=system
+        )
+        response = await model_instance.generate_content_async(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                max_output_tokens=max_tokens,
+                temperature=temp
+            ),
+            stream=True,
+        )
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety/finish metadata)
+                continue
+            if text:
+                yield text
+
+
 # Singleton
 intelligence_pool = IntelligencePool()
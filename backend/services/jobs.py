@@ -0,0 +1,247 @@
+"""
+⏳ Aureon Cortex - Job Queue
+In-process worker pool over a durable Postgres `jobs` table.
+Retries with exponential backoff, dedupe keys and bounded concurrency.
+Running jobs are heartbeated so only a dead worker's jobs get reclaimed;
+finished jobs are purged after JOBS_RETENTION_DAYS.
+"""
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Dict, Optional, Set
+from datetime import datetime, timedelta, timezone
+import asyncio
+import os
+import random
+import socket
+import time
+
+from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
+
+JobHandler = Callable[[Dict], Awaitable[Optional[Dict]]]
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobQueue:
+    """
+    Durable background queue.
+
+    Services register handlers by kind at import time; HTTP handlers
+    `enqueue()` and return immediately. `start()` (FastAPI lifespan) polls
+    `claim_jobs` and runs up to `jobs_concurrency` handlers at once.
+    """
+
+    def __init__(self):
+        self.is_running = False
+        self._task: Optional[asyncio.Task] = None
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, JobHandler] = {}
+        self._active: Set[asyncio.Task] = set()
+        self._running_ids: Set[str] = set()
+        self._wake = asyncio.Event()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """Register the coroutine that executes jobs of `kind`."""
+        self._handlers[kind] = handler
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: Optional[Dict] = None,
+        dedupe_key: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        delay_s: float = 0,
+    ) -> Dict:
+        """Insert a pending job. With `dedupe_key`, returns the live duplicate instead."""
+        admin = get_supabase_admin()
+        row = {
+            "kind": kind,
+            "payload": payload or {},
+            "dedupe_key": dedupe_key,
+            "tenant_id": tenant_id,
+            "user_id": user_id,
+            "max_attempts": max_attempts or settings.jobs_max_attempts,
+            "run_after": (datetime.now(timezone.utc) + timedelta(seconds=delay_s)).isoformat(),
+        }
+        try:
+            inserted = await db_execute(admin.table("jobs").insert(row))
+        except Exception:
+            if not dedupe_key:
+                raise
+            existing = await self._get_live(dedupe_key)
+            if not existing:
+                raise
+            return existing
+
+        self._wake.set()
+        return inserted.data[0]
+
+    async def _get_live(self, dedupe_key: str) -> Optional[Dict]:
+        admin = get_supabase_admin()
+        res = await db_execute(admin.table("jobs").select("*")
+            .eq("dedupe_key", dedupe_key)
+            .in_("status", ["pending", "running"])
+            .limit(1))
+        return res.data[0] if res and res.data else None
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        admin = get_supabase_admin()
+        res = await db_execute(admin.table("jobs").select("*").eq("id", job_id).limit(1))
+        return res.data[0] if res and res.data else None
+
+    async def start(self):
+        """Start polling for jobs."""
+        if self.is_running:
+            return
+        self.is_running = True
+        self._task = asyncio.create_task(self._run_loop())
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        """Stop polling; give handlers a grace period, then cancel them (they are requeued)."""
+        self.is_running = False
+        self._wake.set()
+        for task in (self._task, self._maintenance_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._active:
+            await asyncio.wait(self._active, timeout=settings.jobs_shutdown_grace_s)
+        pending = list(self._active)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _run_loop(self):
+        while self.is_running:
+            free = settings.jobs_concurrency - len(self._active)
+            claimed = []
+            if free > 0 and self._handlers:
+                try:
+                    claimed = await self._claim(free)
+                except Exception as e:
+                    print(f"[Jobs] Claim failed: {e}")
+                for job in claimed:
+                    task = asyncio.create_task(self._run_job(job))
+                    self._active.add(task)
+                    task.add_done_callback(self._active.discard)
+
+            if claimed and len(claimed) == free:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.jobs_poll_interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self, limit: int) -> list:
+        admin = get_supabase_admin()
+        res = await db_execute(admin.rpc("claim_jobs", {
+            "p_worker": self.worker_id,
+            "p_limit": limit,
+            "p_kinds": list(self._handlers),
+            "p_stale_after_s": settings.jobs_stale_after_s,
+        }))
+        return res.data or []
+
+    async def _maintenance_loop(self):
+        """Heartbeat running jobs; purge old finished jobs every JOBS_PURGE_INTERVAL_S."""
+        next_purge = time.monotonic()
+        while self.is_running:
+            if self._running_ids:
+                try:
+                    await self._heartbeat()
+                except Exception as e:
+                    print(f"[Jobs] Heartbeat failed: {e}")
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + settings.jobs_purge_interval_s
+                try:
+                    await self.purge_finished()
+                except Exception as e:
+                    print(f"[Jobs] Purge failed: {e}")
+            await asyncio.sleep(settings.jobs_heartbeat_s)
+
+    async def _heartbeat(self) -> None:
+        admin = get_supabase_admin()
+        await db_execute(admin.rpc("heartbeat_jobs", {
+            "p_worker": self.worker_id,
+            "p_ids": list(self._running_ids),
+        }))
+
+    async def purge_finished(self, batch: int = 5000) -> int:
+        """Delete succeeded/failed jobs older than JOBS_RETENTION_DAYS."""
+        admin = get_supabase_admin()
+        total = 0
+        while True:
+            res = await db_execute(admin.rpc("purge_finished_jobs", {
+                "p_older_than_s": int(settings.jobs_retention_days * 86400),
+                "p_limit": batch,
+            }))
+            deleted = res.data or 0
+            total += deleted
+            if deleted < batch:
+                break
+        if total:
+            print(f"[Jobs] Purged {total} finished jobs")
+        return total
+
+    async def _run_job(self, job: Dict) -> None:
+        admin = get_supabase_admin()
+        handler = self._handlers.get(job["kind"])
+        cancelled = False
+        self._running_ids.add(job["id"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler for job kind '{job['kind']}'")
+            result = await handler(job.get("payload") or {})
+            updates = {"status": "succeeded", "result": result, "last_error": None, "finished_at": _now_iso()}
+        except asyncio.CancelledError:
+            # Worker shutting down: hand the job back right away, without spending an attempt
+            cancelled = True
+            updates = {
+                "status": "pending",
+                "attempts": max((job.get("attempts") or 1) - 1, 0),
+                "run_after": _now_iso(),
+            }
+        except Exception as e:
+            attempts = job.get("attempts") or 1
+            if attempts >= (job.get("max_attempts") or settings.jobs_max_attempts):
+                updates = {"status": "failed", "last_error": str(e)[:1000], "finished_at": _now_iso()}
+            else:
+                backoff = settings.jobs_backoff_base_s * (2 ** (attempts - 1))
+                backoff *= random.uniform(0.8, 1.2)
+                updates = {
+                    "status": "pending",
+                    "last_error": str(e)[:1000],
+                    "run_after": (datetime.now(timezone.utc) + timedelta(seconds=backoff)).isoformat(),
+                }
+            print(f"[Jobs] {job['kind']} {job['id']} attempt {attempts} failed: {e}")
+        finally:
+            self._running_ids.discard(job["id"])
+
+        updates["locked_by"] = None
+        try:
+            # Only while still ours: a reclaimed job belongs to its new worker
+            await db_execute(admin.table("jobs").update(updates)
+                .eq("id", job["id"])
+                .eq("locked_by", self.worker_id))
+        except Exception as e:
+            # Left 'running': claim_jobs reclaims it once stale
+            print(f"[Jobs] Could not record outcome of {job['id']}: {e}")
+        self._wake.set()
+        if cancelled:
+            raise asyncio.CancelledError()
+
+
+# Singleton
+job_queue = JobQueue()
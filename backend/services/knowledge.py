@@ -0,0 +1,122 @@
+"""
+📚 Aureon Cortex - Knowledge Search
+Tenant knowledge retrieval over `knowledge_chunks`.
+
+- vector: pgvector cosine search (`search_knowledge_chunks`)
+- hybrid: full-text + vector fused by reciprocal rank
+  (`search_knowledge_hybrid`), optionally reranked locally
+
+The reranker is a cheap in-process pass over the fused candidates: it
+rewards chunks that contain every query term, and exact codes/numbers in
+particular, which is where embeddings (and hash fallbacks) are weakest.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Literal, Optional
+import re
+
+from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
+from services.embeddings import generate_embeddings
+from services.vectors import to_pgvector
+
+SearchMode = Literal["vector", "hybrid"]
+
+# Candidates fetched per side before fusion, and for the reranker
+CANDIDATES_PER_SIDE = 50
+RERANK_POOL_FACTOR = 4
+RRF_K = 60
+
+# Words, keeping codes like "LX-200" or "A1/3" in one piece
+_TERM = re.compile(r"\w+(?:[-/.]\w+)*", re.UNICODE)
+# Terms that look like identifiers: contain a digit, or are short all-caps
+_CODE = re.compile(r"^(?=.*\d)\S+$|^[A-Z]{2,6}$")
+# Function words longer than two letters (shorter ones are dropped anyway)
+_STOP_WORDS = frozenset("""
+    que los las del por para con una uno unos unas como más pero sus sobre este esta
+    esto estos estas ese esa eso hay son está están ser fue han muy sin entre también
+    cuál cual cuáles qué cómo cuándo dónde cuánto cuánta cuántos cuántas quién
+    the and for with that this are was how what when where which who
+""".split())
+
+
+def _query_terms(text: str) -> List[str]:
+    """Query words worth matching: codes, plus words that are not stop words.
+
+    Mirrors knowledge_lexical_query (sql/019) so the reranker and the
+    full-text side agree on which words count.
+    """
+    return [
+        t.lower() for t in _TERM.findall(text)
+        if _CODE.match(t) or (len(t) > 2 and t.lower() not in _STOP_WORDS)
+    ]
+
+
+def rerank(query: str, rows: List[Dict], k: int) -> List[Dict]:
+    """Reorder fused candidates by query-term coverage, keeping fusion as prior."""
+    query_terms = set(_query_terms(query))
+    if not rows or not query_terms:
+        return rows[:k]
+    codes = {t.lower() for t in _TERM.findall(query) if _CODE.match(t)}
+    top_score = max(row.get("score") or 0.0 for row in rows) or 1.0
+
+    for row in rows:
+        text = f"{row.get('heading') or ''} {row.get('chunk_text') or ''}"
+        chunk_terms = {t.lower() for t in _TERM.findall(text)}
+        coverage = len(query_terms & chunk_terms) / len(query_terms)
+        code_hits = len(codes & chunk_terms) / len(codes) if codes else 0.0
+        prior = (row.get("score") or 0.0) / top_score
+        row["rerank_score"] = round(0.5 * prior + 0.35 * coverage + 0.15 * code_hits, 4)
+    return sorted(rows, key=lambda r: r["rerank_score"], reverse=True)[:k]
+
+
+class KnowledgeService:
+    async def search(
+        self,
+        tenant_id: str,
+        query: str,
+        k: int = 5,
+        mode: Optional[SearchMode] = None,
+        rerank_results: Optional[bool] = None,
+    ) -> List[Dict]:
+        mode = mode or settings.knowledge_search_mode
+        admin = get_supabase_admin()
+        embedding = (await generate_embeddings([query], task_type="retrieval_query"))[0]
+
+        if mode == "vector":
+            res = await db_execute(admin.rpc("search_knowledge_chunks", {
+                "p_tenant_id": tenant_id,
+                "p_query_embedding": to_pgvector(embedding),
+                "p_limit": k,
+            }))
+            return res.data or []
+
+        use_rerank = settings.knowledge_rerank if rerank_results is None else rerank_results
+        res = await db_execute(admin.rpc("search_knowledge_hybrid", {
+            "p_tenant_id": tenant_id,
+            "p_query_text": query,
+            "p_query_embedding": to_pgvector(embedding),
+            "p_limit": k * RERANK_POOL_FACTOR if use_rerank else k,
+            "p_candidates": CANDIDATES_PER_SIDE,
+            "p_rrf_k": RRF_K,
+            # Without a provider key queries get hash embeddings: little signal
+            "p_vector_weight": settings.knowledge_vector_weight if settings.gemini_api_key else 0.2,
+            "p_lexical_weight": 1.0,
+        }))
+        rows = res.data or []
+        return rerank(query, rows, k) if use_rerank else rows
+
+    async def get_context_text(self, tenant_id: str, query: str, k: int = 4) -> str:
+        """Tenant knowledge block for the orchestrator prompt."""
+        rows = await self.search(tenant_id, query, k)
+        if not rows:
+            return ""
+        lines = ["[Base de conocimiento:]"]
+        for row in rows:
+            heading = f"({row['heading']}) " if row.get("heading") else ""
+            lines.append(f"- {heading}{row['chunk_text']}")
+        return "\n".join(lines)
+
+
+# Singleton
+knowledge_service = KnowledgeService()
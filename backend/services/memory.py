@@ -4,17 +4,24 @@ Manages conversation context, summarization, and vectorized memories.
 """
 from __future__ import annotations
 
-from typing import Optional, Dict, List, Tuple
+from typing import Any, Optional, Dict, List, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 
-from core.supabase import get_supabase_admin
+from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
+from core.auth_cache import TTLCache
 from services.embeddings import generate_embedding
+from services.vectors import to_pgvector
 from services.intelligence import intelligence_pool
+from services.jobs import job_queue
 
 # Context window settings
 MAX_CONTEXT_MESSAGES = 20
 SUMMARIZE_AFTER_MESSAGES = 30
+ARCHIVE_WINDOW_MESSAGES = 200
+# Per-user message counters of this worker outlive a day of inactivity at most
+ARCHIVE_COUNTER_TTL_S = 24 * 3600
 
 
 @dataclass
@@ -34,7 +41,7 @@ class Memory:
     user_id: str
     content: str
     summary: str
-    embedding: Optional[List[float]] = None
+    embedding: Optional[Any] = None  # np.ndarray or pgvector literal
     source_channel: Optional[str] = None
     message_count: int = 0
     time_start: Optional[datetime] = None
@@ -44,12 +51,24 @@ class Memory:
     created_at: datetime = field(default_factory=datetime.utcnow)
 
 
+def _parse_timestamp(value: Optional[str]) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else datetime.utcnow()
+
+
 class MemoryService:
     """Supabase-backed memory vault with summarization and RAG search."""
 
+    def __init__(self):
+        # user_id -> {"rows": newest-first page, "complete": bool}
+        self.recent_cache = TTLCache(settings.recent_context_cache_max_entries)
+        # user_id -> write counter; a fetch that raced a write is not cached
+        self._recent_epochs = TTLCache(settings.recent_context_cache_max_entries)
+        # user_id -> messages written by this worker since its last archive enqueue
+        self._unarchived = TTLCache(settings.recent_context_cache_max_entries)
+
     async def get_conversation(self, conversation_id: str) -> Optional[Dict]:
         admin = get_supabase_admin()
-        res = admin.table("conversations").select("*").eq("id", conversation_id).limit(1).execute()
+        res = await db_execute(admin.table("conversations").select("*").eq("id", conversation_id).limit(1))
         return res.data[0] if res and res.data else None
 
     async def get_or_create_conversation(
@@ -60,21 +79,21 @@ class MemoryService:
         channel_user_id: str,
     ) -> Dict:
         admin = get_supabase_admin()
-        existing = admin.table("conversations").select("*") \
-            .eq("tenant_id", tenant_id) \
-            .eq("channel", channel) \
-            .eq("channel_user_id", channel_user_id) \
-            .limit(1).execute()
+        existing = await db_execute(admin.table("conversations").select("*")
+            .eq("tenant_id", tenant_id)
+            .eq("channel", channel)
+            .eq("channel_user_id", channel_user_id)
+            .limit(1))
         if existing and existing.data:
             return existing.data[0]
 
-        created = admin.table("conversations").insert({
+        created = await db_execute(admin.table("conversations").insert({
             "tenant_id": tenant_id,
             "channel": channel,
             "channel_user_id": channel_user_id,
             "user_id": user_id,
             "status": "active",
-        }).execute()
+        }))
         return created.data[0]
 
     async def add_message(
@@ -93,7 +112,8 @@ class MemoryService:
             "content": content,
             "metadata": metadata or {},
         }
-        admin.table("messages").insert(payload).execute()
+        await db_execute(admin.table("messages").insert(payload))
+        self.invalidate_recent(user_id)
         return ContextMessage(
             id=conversation_id,
             user_id=user_id,
@@ -103,32 +123,65 @@ class MemoryService:
             metadata=metadata or {},
         )
 
-    async def get_context(self, user_id: str, limit: int = MAX_CONTEXT_MESSAGES) -> List[ContextMessage]:
+    def invalidate_recent(self, user_id: str) -> None:
+        self.recent_cache.pop(user_id)
+        epoch = self._recent_epochs.get(user_id) or 0
+        self._recent_epochs.set(user_id, epoch + 1, settings.recent_context_cache_ttl_s * 2)
+
+    async def _recent_rows(
+        self, user_id: str, limit: int, before: Optional[str], before_id: Optional[str] = None
+    ) -> List[Dict]:
+        """Newest-first rows from recent_user_messages; the first page is cached per user."""
+        if before is None:
+            cached = self.recent_cache.get(user_id)
+            if cached is not None and (cached["complete"] or len(cached["rows"]) >= limit):
+                return cached["rows"][:limit]
+
+        epoch = self._recent_epochs.get(user_id) or 0
         admin = get_supabase_admin()
-        convs = admin.table("conversations").select("id,channel").eq("user_id", user_id).execute()
-        conversation_ids = [c["id"] for c in (convs.data or [])]
-        if not conversation_ids:
-            return []
+        res = await db_execute(admin.rpc("recent_user_messages", {
+            "p_user_id": user_id,
+            "p_limit": limit,
+            "p_before": before,
+            "p_before_id": before_id if before else None,
+        }))
+        rows = res.data or []
+
+        if before is None and (self._recent_epochs.get(user_id) or 0) == epoch:
+            self.recent_cache.set(
+                user_id,
+                {"rows": rows, "complete": len(rows) < limit},
+                settings.recent_context_cache_ttl_s,
+            )
+        return rows
 
-        messages = admin.table("messages") \
-            .select("id,content,role,created_at,conversation_id,metadata") \
-            .in_("conversation_id", conversation_ids) \
-            .order("created_at", desc=True) \
-            .limit(limit).execute()
-
-        results = []
-        for msg in (messages.data or [])[::-1]:
-            channel = next((c["channel"] for c in (convs.data or []) if c["id"] == msg["conversation_id"]), "pwa")
-            results.append(ContextMessage(
-                id=msg["id"],
+    async def get_context(
+        self,
+        user_id: str,
+        limit: int = MAX_CONTEXT_MESSAGES,
+        before: Optional[str] = None,
+        before_id: Optional[str] = None,
+    ) -> List[ContextMessage]:
+        """Last `limit` messages across the user's channels, oldest first.
+
+        Pages backwards: pass the oldest message of a page as `before`
+        (its timestamp) and `before_id` (its id).
+        """
+        if limit <= 0:
+            return []
+        rows = await self._recent_rows(user_id, limit, before, before_id)
+        return [
+            ContextMessage(
+                id=row["id"],
                 user_id=user_id,
-                channel=channel,
-                role=msg["role"],
-                content=msg["content"],
-                timestamp=datetime.fromisoformat(msg["created_at"].replace("Z", "+00:00")) if msg.get("created_at") else datetime.utcnow(),
-                metadata=msg.get("metadata") or {},
-            ))
-        return results
+                channel=row.get("channel") or "pwa",
+                role=row["role"],
+                content=row["content"],
+                timestamp=_parse_timestamp(row.get("created_at")),
+                metadata=row.get("metadata") or {},
+            )
+            for row in rows[::-1]
+        ]
 
     async def get_context_text(self, user_id: str, limit: int = 10) -> str:
         messages = await self.get_context(user_id, limit)
@@ -140,17 +193,30 @@ class MemoryService:
             lines.append(f"[{role}]: {msg.content}")
         return "\n".join(lines)
 
-    async def summarize_and_archive(self, user_id: str, force: bool = False) -> Optional[Memory]:
+    async def _get_archive_watermark(self, user_id: str) -> Optional[Dict]:
         admin = get_supabase_admin()
-        convs = admin.table("conversations").select("id,channel").eq("user_id", user_id).execute()
-        conversation_ids = [c["id"] for c in (convs.data or [])]
-        if not conversation_ids:
-            return None
+        res = await db_execute(admin.table("memory_archive_state")
+            .select("last_message_id,last_archived_at,archived_count")
+            .eq("user_id", user_id)
+            .limit(1))
+        return res.data[0] if res and res.data else None
 
-        messages = admin.table("messages") \
-            .select("content,role,created_at,conversation_id") \
-            .in_("conversation_id", conversation_ids) \
-            .order("created_at", desc=False).execute()
+    async def summarize_and_archive(self, user_id: str, force: bool = False) -> Optional[Memory]:
+        """Fold messages newer than the user's watermark into one memory.
+
+        The watermark is the (created_at, id) of the last archived message,
+        so messages sharing its timestamp are not skipped. Reads at most
+        ARCHIVE_WINDOW_MESSAGES past it, so each call costs O(new messages)
+        regardless of history length.
+        """
+        admin = get_supabase_admin()
+        watermark = await self._get_archive_watermark(user_id)
+        messages = await db_execute(admin.rpc("user_messages_since", {
+            "p_user_id": user_id,
+            "p_after": (watermark or {}).get("last_archived_at"),
+            "p_after_id": (watermark or {}).get("last_message_id"),
+            "p_limit": ARCHIVE_WINDOW_MESSAGES,
+        }))
 
         if not messages.data:
             return None
@@ -163,8 +229,7 @@ class MemoryService:
         for msg in messages.data:
             role = "Aureon" if msg["role"] == "assistant" else "Usuario"
             lines.append(f"[{role}]: {msg['content']}")
-            channel = next((c["channel"] for c in (convs.data or []) if c["id"] == msg["conversation_id"]), "pwa")
-            channels.add(channel)
+            channels.add(msg.get("channel") or "pwa")
 
         content = "\n".join(lines)
         summary = await self._generate_summary(content)
@@ -174,16 +239,24 @@ class MemoryService:
             "user_id": user_id,
             "content": content,
             "summary": summary,
-            "embedding": embedding,
+            "embedding": to_pgvector(embedding),
             "source_channel": list(channels)[0] if len(channels) == 1 else "mixed",
             "message_count": len(messages.data),
             "time_start": messages.data[0]["created_at"],
             "time_end": messages.data[-1]["created_at"],
         }
-        inserted = admin.table("memory_vault").insert(memory_payload).execute()
+        inserted = await db_execute(admin.table("memory_vault").insert(memory_payload))
         if not inserted or not inserted.data:
             return None
 
+        last = messages.data[-1]
+        await db_execute(admin.table("memory_archive_state").upsert({
+            "user_id": user_id,
+            "last_message_id": last["id"],
+            "last_archived_at": last["created_at"],
+            "archived_count": ((watermark or {}).get("archived_count") or 0) + len(messages.data),
+        }, on_conflict="user_id"))
+
         record = inserted.data[0]
         return Memory(
             id=record["id"],
@@ -197,6 +270,29 @@ class MemoryService:
             time_end=None,
         )
 
+    async def schedule_archive(self, user_id: str) -> Dict:
+        """Queue an incremental archive for the user (one live job per user)."""
+        return await job_queue.enqueue(
+            "memory.archive",
+            {"user_id": user_id},
+            dedupe_key=f"memory.archive:{user_id}",
+            user_id=user_id,
+        )
+
+    async def note_messages(self, user_id: str, count: int = 2) -> Optional[Dict]:
+        """Count a turn's messages; enqueue an archive once enough have accumulated.
+
+        Chat turns call this instead of enqueueing every time. Counts are per
+        worker, so users spread across workers are caught by the summarizer's
+        `users_pending_archive` sweep.
+        """
+        pending = (self._unarchived.get(user_id) or 0) + count
+        if pending < SUMMARIZE_AFTER_MESSAGES:
+            self._unarchived.set(user_id, pending, ARCHIVE_COUNTER_TTL_S)
+            return None
+        self._unarchived.pop(user_id)
+        return await self.schedule_archive(user_id)
+
     async def _generate_summary(self, content: str) -> str:
         system_prompt = (
             "Eres un asistente especializado en resumir conversaciones. "
@@ -208,6 +304,7 @@ class MemoryService:
                 system_prompt=system_prompt,
                 max_tokens=200,
                 temperature=0.3,
+                cache_scope="system",
             )
             return summary
         except Exception:
@@ -218,11 +315,11 @@ class MemoryService:
         admin = get_supabase_admin()
         query_embedding = await generate_embedding(query)
         try:
-            results = admin.rpc("search_memories", {
+            results = await db_execute(admin.rpc("search_memories", {
                 "p_user_id": user_id,
-                "p_query_embedding": query_embedding,
+                "p_query_embedding": to_pgvector(query_embedding),
                 "p_limit": k,
-            }).execute()
+            }))
         except Exception:
             return []
 
@@ -252,15 +349,15 @@ class MemoryService:
 
     async def get_user_stats(self, user_id: str) -> Dict:
         admin = get_supabase_admin()
-        convs = admin.table("conversations").select("id").eq("user_id", user_id).execute()
+        convs = await db_execute(admin.table("conversations").select("id").eq("user_id", user_id))
         conversation_ids = [c["id"] for c in (convs.data or [])]
         msg_count = 0
         if conversation_ids:
-            msgs = admin.table("messages").select("id", count="exact") \
-                .in_("conversation_id", conversation_ids).execute()
+            msgs = await db_execute(admin.table("messages").select("id", count="exact")
+                .in_("conversation_id", conversation_ids))
             msg_count = msgs.count or 0
-        memories = admin.table("memory_vault").select("id", count="exact") \
-            .eq("user_id", user_id).execute()
+        memories = await db_execute(admin.table("memory_vault").select("id", count="exact")
+            .eq("user_id", user_id))
 
         return {
             "active_context_messages": msg_count,
@@ -270,10 +367,19 @@ class MemoryService:
 
     async def clear_context(self, user_id: str) -> None:
         admin = get_supabase_admin()
-        convs = admin.table("conversations").select("id").eq("user_id", user_id).execute()
+        convs = await db_execute(admin.table("conversations").select("id").eq("user_id", user_id))
         conversation_ids = [c["id"] for c in (convs.data or [])]
         if conversation_ids:
-            admin.table("messages").delete().in_("conversation_id", conversation_ids).execute()
+            await db_execute(admin.table("messages").delete().in_("conversation_id", conversation_ids))
+        self.invalidate_recent(user_id)
 
 
 memory_service = MemoryService()
+
+
+async def _archive_job(payload: Dict) -> Dict:
+    memory = await memory_service.summarize_and_archive(payload["user_id"], force=False)
+    return {"memory_id": memory.id if memory else None}
+
+
+job_queue.register("memory.archive", _archive_job)
@@ -41,7 +41,8 @@ class NanoAureon:
                 prompt=task,
                 system_prompt=self.system_prompt,
                 max_tokens=2048,
-                temperature=0.5  # Lower for more focused responses
+                temperature=0.5,  # Lower for more focused responses
+                cache_scope="nano",
             )
             self.status = "idle"
             self.current_task = None
@@ -5,18 +5,36 @@ Aureon (cerebro frío) + Runa (alma).
 """
 from __future__ import annotations
 
-from typing import Literal, Optional, Dict, List
-from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Literal, Optional, Dict, List, Tuple, TypeVar
+from dataclasses import dataclass, field
 from datetime import datetime
+import asyncio
 import time
 
+from core.config import settings
 from .intelligence import intelligence_pool
 from .identity import identity_service
 from .memory import memory_service
+from .knowledge import knowledge_service
 from .research import research_service
 from .cards import card_generator
+from .prompt_builder import PromptSection, build_prompt, estimate_tokens
 from .runa import SYSTEM_PROMPT as RUNA_SYSTEM_PROMPT
 
+T = TypeVar("T")
+
+# Per-stage budgets for optional context; a slow stage degrades to empty
+STAGE_TIMEOUTS_S = {
+    "memory": 4.0,
+    "knowledge": 4.0,
+    "recent_context": 3.0,
+    "research": 12.0,
+}
+
+# Shorter messages are usually follow-ups ("sí", "¿y el sábado?") whose answer
+# depends on the recent turns, which the completion cache does not key on
+CACHE_MIN_WORDS = 4
+
 
 @dataclass
 class Message:
@@ -45,6 +63,42 @@ class Response:
     conversation_id: Optional[str] = None
     card: Optional[Dict] = None
     citations: Optional[List[Dict]] = None
+    stage_timings_ms: Optional[Dict[str, int]] = None
+    prompt_tokens: Optional[Dict] = None
+
+
+@dataclass
+class _Turn:
+    """State shared between preparing a turn and finishing it."""
+    message: Message
+    start: float
+    timings: Dict[str, int] = field(default_factory=dict)
+    task_type: str = "general"
+    agent: str = "aureon"
+    profile: Optional[Dict] = None
+    conversation: Optional[Dict] = None
+    citations: List[Dict] = field(default_factory=list)
+    research_answer: str = ""
+    prompt: str = ""
+    prompt_report: Optional[Dict] = None
+    system_prompt: str = ""
+    grounding: str = ""
+    history: str = ""
+
+    @property
+    def temperature(self) -> float:
+        return 0.8 if self.agent == "runa" else 0.7
+
+    def cache_args(self) -> Dict:
+        """Completion cache keyed on the current message, per user, grounding
+        and the memories/recent turns the prompt carried."""
+        if len(self.message.content.split()) < CACHE_MIN_WORDS:
+            return {"cache_scope": None}
+        return {
+            "cache_scope": self.message.tenant_id,
+            "cache_key": self.message.content,
+            "cache_context": f"{self.profile['id']}\n{self.grounding}\n{self.history}",
+        }
 
 
 class Orchestrator:
@@ -91,33 +145,47 @@ Reglas:
             return "runa"
         return "aureon"
 
-    async def process(self, message: Message) -> Response:
-        start = time.time()
+    async def _stage(
+        self,
+        name: str,
+        awaitable: Awaitable[T],
+        timings: Dict[str, int],
+        timeout: Optional[float] = None,
+        fallback: Optional[T] = None,
+        required: bool = False,
+    ) -> Optional[T]:
+        """Await one pipeline stage, recording its wall time.
 
-        profile = await identity_service.get_or_create_from_channel(
-            channel=message.channel,
-            identifier=message.sender_id,
-            metadata=message.metadata,
-            auth_user_id=message.user_id,
-        )
-        if not profile:
-            raise ValueError("User profile not verified for this channel")
+        Optional stages degrade to `fallback` on timeout or error; required
+        stages (identity, conversation) propagate the exception.
+        """
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except Exception as e:
+            if required:
+                raise
+            kind = "timeout" if isinstance(e, asyncio.TimeoutError) else f"error: {e}"
+            print(f"⚠️ Orchestrator stage '{name}' degraded ({kind})")
+            return fallback
+        finally:
+            timings[name] = int((time.perf_counter() - started) * 1000)
 
-        user_id = profile["id"]
-        conversation = None
+    async def _resolve_conversation(self, message: Message, user_id: str) -> Dict:
         if message.metadata and message.metadata.get("conversation_id"):
             existing = await memory_service.get_conversation(message.metadata["conversation_id"])
             if existing and existing.get("tenant_id") == message.tenant_id:
-                conversation = existing
+                return existing
 
-        if not conversation:
-            conversation = await memory_service.get_or_create_conversation(
-                tenant_id=message.tenant_id,
-                user_id=user_id,
-                channel=message.channel,
-                channel_user_id=message.sender_id,
-            )
+        return await memory_service.get_or_create_conversation(
+            tenant_id=message.tenant_id,
+            user_id=user_id,
+            channel=message.channel,
+            channel_user_id=message.sender_id,
+        )
 
+    async def _store_user_message(self, message: Message, user_id: str) -> Dict:
+        conversation = await self._resolve_conversation(message, user_id)
         await memory_service.add_message(
             conversation_id=conversation["id"],
             user_id=user_id,
@@ -126,96 +194,251 @@ Reglas:
             content=message.content,
             metadata=message.metadata,
         )
+        return conversation
 
-        memory_context = await memory_service.get_relevant_context(
-            user_id=user_id,
-            query=message.content,
-            k=3,
+    async def _recent_then_store(
+        self, message: Message, user_id: str, timings: Dict[str, int]
+    ) -> Tuple[Dict, str]:
+        """(conversation, recent context as it was before this message)."""
+        recent_context = await self._stage(
+            "recent_context",
+            memory_service.get_context_text(user_id=user_id, limit=8),
+            timings,
+            timeout=STAGE_TIMEOUTS_S["recent_context"],
+            fallback="",
         )
-        recent_context = await memory_service.get_context_text(
-            user_id=user_id,
-            limit=8,
+        conversation = await self._stage(
+            "conversation",
+            self._store_user_message(message, user_id),
+            timings,
+            required=True,
         )
+        return conversation, recent_context
 
-        task_type = self._detect_task_type(message.content)
-        citations: List[Dict] = []
-        research_context = ""
-        research_answer = ""
-        if task_type == "researcher":
-            try:
-                research_answer, citations = await research_service.search(message.content, k=5)
-                if research_answer:
-                    research_context = f"[Respuesta de investigación]\n{research_answer}"
-                if citations:
-                    sources_block = "\n".join(
-                        f"- {c['title']} ({c['url']})" for c in citations if c.get("url")
-                    )
-                    if sources_block:
-                        research_context += f"\n\n[Fuentes:]\n{sources_block}"
-            except Exception:
-                citations = []
-
-        user_info = f"Estás hablando con {profile.get('display_name') or 'un usuario'}."
-        prompt_parts = [user_info]
-
-        if memory_context:
-            prompt_parts.append(memory_context)
-        if recent_context:
-            prompt_parts.append(f"\n[Conversación reciente:]\n{recent_context}")
-        if research_context:
-            prompt_parts.append(research_context)
+    async def _knowledge_stage(self, message: Message, timings: Dict[str, int]) -> str:
+        """Tenant knowledge grounding (hybrid search), empty when disabled."""
+        if not settings.knowledge_grounding_enabled or not message.tenant_id:
+            return ""
+        return await self._stage(
+            "knowledge",
+            knowledge_service.get_context_text(
+                tenant_id=message.tenant_id,
+                query=message.content,
+                k=settings.knowledge_context_chunks,
+            ),
+            timings,
+            timeout=STAGE_TIMEOUTS_S["knowledge"],
+            fallback="",
+        )
 
-        prompt_parts.append(f"\n[Mensaje actual:]\n{message.content}")
-        full_prompt = "\n\n".join(prompt_parts)
+    async def _prepare_turn(self, message: Message) -> _Turn:
+        """Resolve identity, store the user message and assemble the prompt."""
+        turn = _Turn(message=message, start=time.time())
+        timings = turn.timings
 
-        agent = self._detect_agent(message.content)
-        system_prompt = RUNA_SYSTEM_PROMPT if agent == "runa" else self.AUREON_SYSTEM_PROMPT
+        # Research only depends on the message text: start it before identity.
+        turn.task_type = self._detect_task_type(message.content)
+        research_task = None
+        if turn.task_type == "researcher":
+            research_task = asyncio.create_task(self._stage(
+                "research",
+                research_service.search(message.content, k=5),
+                timings,
+                timeout=STAGE_TIMEOUTS_S["research"],
+                fallback=("", []),
+            ))
 
         try:
-            response_text = await intelligence_pool.complete(
-                prompt=full_prompt,
-                system_prompt=system_prompt,
-                max_tokens=1024,
-                temperature=0.8 if agent == "runa" else 0.7,
+            profile = await self._stage(
+                "identity",
+                identity_service.get_or_create_from_channel(
+                    channel=message.channel,
+                    identifier=message.sender_id,
+                    metadata=message.metadata,
+                    auth_user_id=message.user_id,
+                ),
+                timings,
+                required=True,
             )
-            provider = "auto"
-        except Exception as e:
-            response_text = f"⚠️ Error procesando tu mensaje: {str(e)}"
-            provider = "error"
+            if not profile:
+                raise ValueError("User profile not verified for this channel")
+        except BaseException:
+            if research_task:
+                research_task.cancel()
+            raise
 
-        await memory_service.add_message(
-            conversation_id=conversation["id"],
-            user_id=user_id,
-            channel=message.channel,
-            role="assistant",
-            content=response_text,
-            metadata={"provider": provider},
+        turn.profile = profile
+        user_id = profile["id"]
+
+        # Recent context is read before the current message is stored, so the
+        # message never shows up in both [Conversación reciente] and [Mensaje actual].
+        # Memory/knowledge search run alongside.
+        stored, memory_context, knowledge_context = await asyncio.gather(
+            self._recent_then_store(message, user_id, timings),
+            self._stage(
+                "memory",
+                memory_service.get_relevant_context(user_id=user_id, query=message.content, k=3),
+                timings,
+                timeout=STAGE_TIMEOUTS_S["memory"],
+                fallback="",
+            ),
+            self._knowledge_stage(message, timings),
+            return_exceptions=True,
+        )
+        conversation, recent_context = stored if not isinstance(stored, BaseException) else (stored, "")
+        if isinstance(conversation, BaseException):
+            if research_task:
+                research_task.cancel()
+            raise conversation
+        turn.conversation = conversation
+
+        research_context = ""
+        if research_task:
+            turn.research_answer, turn.citations = await research_task
+            if turn.research_answer:
+                research_context = f"[Respuesta de investigación]\n{turn.research_answer}"
+            if turn.citations:
+                sources_block = "\n".join(
+                    f"- {c['title']} ({c['url']})" for c in turn.citations if c.get("url")
+                )
+                if sources_block:
+                    research_context += f"\n\n[Fuentes:]\n{sources_block}"
+
+        turn.grounding = f"{knowledge_context}\n{research_context}"
+        turn.history = f"{memory_context}\n{recent_context}"
+        turn.agent = self._detect_agent(message.content)
+        turn.system_prompt = RUNA_SYSTEM_PROMPT if turn.agent == "runa" else self.AUREON_SYSTEM_PROMPT
+
+        # Budget order: current message > recent turns > memories > knowledge > research.
+        # Sections keep their reading order in the prompt.
+        providers = [p.value for p in intelligence_pool.get_available_providers()]
+        user_info = f"Estás hablando con {profile.get('display_name') or 'un usuario'}."
+        turn.prompt, turn.prompt_report = build_prompt(
+            [
+                PromptSection("user_info", user_info, priority=0),
+                PromptSection("memories", memory_context, priority=3, keep="head", min_tokens=30),
+                PromptSection("recent", recent_context, priority=2, keep="tail",
+                              header="\n[Conversación reciente:]\n", min_tokens=30),
+                PromptSection("knowledge", knowledge_context, priority=4, keep="head", min_tokens=30),
+                PromptSection("research", research_context, priority=5, keep="head", min_tokens=30),
+                PromptSection("message", message.content, priority=1, keep="ends",
+                              header="\n[Mensaje actual:]\n"),
+            ],
+            budget_tokens=max(
+                settings.prompt_budget_tokens - estimate_tokens(turn.system_prompt, providers), 256
+            ),
+            providers=providers,
         )
+        return turn
 
-        await memory_service.summarize_and_archive(user_id=user_id, force=False)
+    async def _finish_turn(self, turn: _Turn, response_text: str, provider: str) -> Response:
+        """Persist the assistant reply and build the Response."""
+        user_id = turn.profile["id"]
+        await self._stage(
+            "persist",
+            memory_service.add_message(
+                conversation_id=turn.conversation["id"],
+                user_id=user_id,
+                channel=turn.message.channel,
+                role="assistant",
+                content=response_text,
+                metadata={"provider": provider},
+            ),
+            turn.timings,
+        )
+
+        # Incremental archive runs off the request path (job queue), once enough is pending
+        await self._stage("archive_enqueue", memory_service.note_messages(user_id), turn.timings)
 
         card = None
-        if citations:
+        if turn.citations:
             card = card_generator.create_research_card(
                 title="Investigación",
-                summary=research_answer or "Resultados encontrados",
-                key_points=[c.get("title", "") for c in citations[:3]],
-                sources=citations,
+                summary=turn.research_answer or "Resultados encontrados",
+                key_points=[c.get("title", "") for c in turn.citations[:3]],
+                sources=turn.citations,
                 confidence=0.82,
-                duration_ms=int((time.time() - start) * 1000),
+                duration_ms=int((time.time() - turn.start) * 1000),
             ).to_dict()
 
         return Response(
             content=response_text,
-            nanoaureon_used=f"{agent}:{task_type}",
+            nanoaureon_used=f"{turn.agent}:{turn.task_type}",
             provider_used=provider,
-            processing_time_ms=int((time.time() - start) * 1000),
+            processing_time_ms=int((time.time() - turn.start) * 1000),
             user_id=user_id,
-            user_name=profile.get("display_name"),
-            conversation_id=conversation["id"],
+            user_name=turn.profile.get("display_name"),
+            conversation_id=turn.conversation["id"],
             card=card,
-            citations=citations or None,
+            citations=turn.citations or None,
+            stage_timings_ms=turn.timings,
+            prompt_tokens=turn.prompt_report,
         )
 
+    async def process(self, message: Message) -> Response:
+        turn = await self._prepare_turn(message)
+
+        llm_started = time.perf_counter()
+        routing: Dict = {}
+        try:
+            response_text = await intelligence_pool.complete(
+                prompt=turn.prompt,
+                system_prompt=turn.system_prompt,
+                max_tokens=1024,
+                temperature=turn.temperature,
+                meta=routing,
+                **turn.cache_args(),
+            )
+            provider = routing.get("provider", "auto")
+        except Exception as e:
+            response_text = f"⚠️ Error procesando tu mensaje: {str(e)}"
+            provider = "error"
+        turn.timings["llm"] = int((time.perf_counter() - llm_started) * 1000)
+
+        return await self._finish_turn(turn, response_text, provider)
+
+    async def process_stream(self, message: Message) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of process().
+
+        Yields {"type": "context", ...} once the prompt is assembled, then
+        {"type": "delta", "content": str} per LLM token chunk, and finally
+        {"type": "done", "response": Response}.
+        """
+        turn = await self._prepare_turn(message)
+        yield {"type": "context", "stage_timings_ms": dict(turn.timings), "prompt_tokens": turn.prompt_report}
+
+        llm_started = time.perf_counter()
+        pieces: List[str] = []
+        routing: Dict = {}
+        provider = "auto"
+        try:
+            async for delta in intelligence_pool.stream_complete(
+                prompt=turn.prompt,
+                system_prompt=turn.system_prompt,
+                max_tokens=1024,
+                temperature=turn.temperature,
+                meta=routing,
+                **turn.cache_args(),
+            ):
+                if not pieces:
+                    turn.timings["llm_first_token"] = int((time.perf_counter() - llm_started) * 1000)
+                pieces.append(delta)
+                yield {"type": "delta", "content": delta}
+        except Exception as e:
+            error_text = f"⚠️ Error procesando tu mensaje: {str(e)}"
+            if pieces:
+                # Keep what the user already saw; flag the cut
+                error_text = "\n\n" + error_text
+            pieces.append(error_text)
+            provider = "error"
+            yield {"type": "delta", "content": error_text}
+        else:
+            provider = routing.get("provider", provider)
+        turn.timings["llm"] = int((time.perf_counter() - llm_started) * 1000)
+
+        response = await self._finish_turn(turn, "".join(pieces), provider)
+        yield {"type": "done", "response": response}
+
 
 orchestrator = Orchestrator()
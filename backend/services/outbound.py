@@ -0,0 +1,302 @@
+"""
+📤 Aureon Cortex - Outbound Dispatcher
+Splits long replies on message boundaries and paces sends with token
+buckets (global per channel + per chat), retrying rate-limit responses
+after the provider's `retry_after`.
+
+Channels register a part sender at import time (see whatsapp.py /
+telegram.py); the sender posts one part through the pooled HTTP client and
+raises `RateLimited` when the provider throttles.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import re
+import time
+
+from core.config import settings
+
+# sender(chat_id, part, **options) -> provider response
+PartSender = Callable[..., Awaitable[Dict]]
+
+# Idle per-chat buckets/locks kept around (LRU)
+MAX_TRACKED_CHATS = 5000
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+# Telegram-style HTML: tags and entities must never be cut
+_HTML_TOKEN = re.compile(r"<[^<>]*>|&#?\w+;")
+_HTML_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^<>]*>")
+_TRAILING_OPEN_TAG = re.compile(r"<[a-zA-Z][^<>]*>\s*$")
+
+
+class RateLimited(Exception):
+    """Provider throttled a send. `scope` is "chat" (pair limit) or "global" (throughput)."""
+
+    def __init__(self, retry_after_s: Optional[float] = None, scope: str = "chat", detail: str = ""):
+        super().__init__(detail or "rate limited")
+        self.retry_after_s = retry_after_s
+        self.scope = scope
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.updated:
+                    # Paused by pause(): nothing refills until then
+                    await asyncio.sleep(self.updated - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Provider said slow down: drain and push the next token out by `seconds`."""
+        self.tokens = 0.0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+def _split_at(text: str, limit: int, pattern: str) -> Optional[int]:
+    """Last `pattern` boundary at or before `limit` (past the first third)."""
+    cut = -1
+    for match in re.finditer(pattern, text[:limit + 1]):
+        cut = match.end()
+    return cut if cut > limit // 3 else None
+
+
+def _boundary(text: str, limit: int) -> int:
+    """Where to cut: paragraph > line > sentence > word boundary, else `limit`."""
+    return (
+        _split_at(text, limit, r"\n\s*\n")
+        or _split_at(text, limit, r"\n")
+        or _split_at(text, limit, _SENTENCE_END.pattern)
+        or _split_at(text, limit, r"\s+")
+        or limit
+    )
+
+
+def split_message(text: str, limit: int) -> List[str]:
+    """Cut `text` into parts of at most `limit` chars, preferring
+    paragraph > line > sentence > word boundaries."""
+    parts: List[str] = []
+    rest = (text or "").strip()
+    while len(rest) > limit:
+        cut = _boundary(rest, limit)
+        parts.append(rest[:cut].rstrip())
+        rest = rest[cut:].lstrip()
+    if rest:
+        parts.append(rest)
+    return parts
+
+
+def _html_safe_cut(text: str, cut: int) -> int:
+    """Move `cut` back to the start of a tag/entity it falls inside, and before
+    trailing opening tags (they belong with the text they wrap)."""
+    for match in _HTML_TOKEN.finditer(text):
+        if match.start() >= cut:
+            break
+        if cut < match.end():
+            cut = match.start()
+            break
+    trailing = _TRAILING_OPEN_TAG.search(text[:cut])
+    while trailing and trailing.start() > 0:
+        cut = trailing.start()
+        trailing = _TRAILING_OPEN_TAG.search(text[:cut])
+    return cut
+
+
+def _open_tags(html: str) -> List[Tuple[str, str]]:
+    """(name, opening tag) of the tags still open at the end of `html`, outermost first."""
+    stack: List[Tuple[str, str]] = []
+    for match in _HTML_TAG.finditer(html):
+        closing, name = match.group(1), match.group(2).lower()
+        if not closing:
+            stack.append((name, match.group(0)))
+            continue
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == name:
+                del stack[i]
+                break
+    return stack
+
+
+def _split_without_tags(html: str, limit: int) -> List[str]:
+    """Fallback for markup split_html cannot rebalance: drop the tags, keep
+    entities (still valid HTML text) and never cut inside one."""
+    parts: List[str] = []
+    rest = _HTML_TAG.sub("", html).strip()
+    while len(rest) > limit:
+        cut = _html_safe_cut(rest, _boundary(rest, limit))
+        if cut <= 0:
+            cut = limit
+        parts.append(rest[:cut].rstrip())
+        rest = rest[cut:].lstrip()
+    if rest:
+        parts.append(rest)
+    return parts
+
+
+def split_html(text: str, limit: int) -> List[str]:
+    """split_message for HTML parse mode: cuts outside tags and entities,
+    closes tags left open at the end of a part and reopens them in the next.
+
+    Every pass must emit a part within `limit` and shorten what is left;
+    when the reopened tags make that impossible (deep or unbalanced nesting),
+    the rest is sent without tags.
+    """
+    parts: List[str] = []
+    rest = (text or "").strip()
+    reopened = 0
+    while len(rest) > limit:
+        budget = limit
+        while True:
+            cut = _html_safe_cut(rest, _boundary(rest, budget))
+            if cut <= reopened:
+                # No usable boundary past the reopened tags: hard cut, still outside markup
+                cut = _html_safe_cut(rest, budget)
+                if cut <= reopened:
+                    token = _HTML_TOKEN.match(rest, reopened)
+                    cut = token.end() if token else reopened + 1
+            head = rest[:cut].rstrip()
+            open_tags = _open_tags(head)
+            closers = "".join(f"</{name}>" for name, _ in reversed(open_tags))
+            overflow = len(head) + len(closers) - limit
+            if overflow <= 0 or budget <= reopened + 1:
+                break
+            budget = max(budget - overflow, reopened + 1)
+        reopen = "".join(tag for _, tag in open_tags)
+        remaining = reopen + rest[cut:].lstrip()
+        if overflow > 0 or len(remaining) >= len(rest):
+            return parts + _split_without_tags(rest, limit)
+        parts.append(head + closers)
+        reopened = len(reopen)
+        rest = remaining
+    if rest:
+        parts.append(rest)
+    return parts
+
+
+@dataclass
+class ChannelLimits:
+    max_chars: int
+    global_rps: float
+    global_burst: float
+    chat_rps: float
+    chat_burst: float
+    # Send option naming the markup of the text (Telegram: "parse_mode")
+    markup_option: Optional[str] = None
+
+
+class _Channel:
+    def __init__(self, sender: PartSender, limits: ChannelLimits):
+        self.sender = sender
+        self.limits = limits
+        self.bucket = TokenBucket(limits.global_rps, limits.global_burst)
+        # chat_id -> (bucket, lock); the lock keeps one reply's parts in order
+        self.chats: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def chat(self, chat_id: str) -> tuple:
+        entry = self.chats.get(chat_id)
+        if entry is None:
+            entry = (TokenBucket(self.limits.chat_rps, self.limits.chat_burst), asyncio.Lock())
+            self.chats[chat_id] = entry
+            while len(self.chats) > MAX_TRACKED_CHATS:
+                oldest, (_, lock) = next(iter(self.chats.items()))
+                if lock.locked():
+                    break
+                del self.chats[oldest]
+        else:
+            self.chats.move_to_end(chat_id)
+        return entry
+
+
+class OutboundDispatcher:
+    """Paced, split, retried sends for every outbound channel."""
+
+    def __init__(self):
+        self._channels: Dict[str, _Channel] = {}
+        self.stats: Dict[str, int] = {"messages": 0, "parts": 0, "rate_limited": 0, "errors": 0}
+
+    def register(self, channel: str, sender: PartSender, limits: ChannelLimits) -> None:
+        self._channels[channel] = _Channel(sender, limits)
+
+    async def send(self, channel: str, chat_id, text: str, **options) -> Dict:
+        """Send `text` as one or more parts. Stops at the first non-retryable error.
+
+        `options` are passed through to the channel's part sender.
+        """
+        route = self._channels[channel]
+        chat_bucket, chat_lock = route.chat(str(chat_id))
+        parts, options = self._split(route.limits, text, options)
+        results: List[Dict] = []
+        self.stats["messages"] += 1
+
+        async with chat_lock:
+            for part in parts:
+                result = await self._send_part(route, chat_bucket, str(chat_id), part, options)
+                results.append(result)
+                if "error" in result:
+                    self.stats["errors"] += 1
+                    break
+                self.stats["parts"] += 1
+
+        response = {"parts": len(parts), "sent": sum(1 for r in results if "error" not in r), "results": results}
+        if results and "error" in results[-1]:
+            response["error"] = results[-1]["error"]
+        return response
+
+    @staticmethod
+    def _split(limits: ChannelLimits, text: str, options: Dict) -> Tuple[List[str], Dict]:
+        """Parts to send and the options to send them with.
+
+        HTML is split markup-aware. Other markups (Markdown) cannot be split
+        safely, so a multi-part message goes out as plain text.
+        """
+        markup = options.get(limits.markup_option) if limits.markup_option else None
+        if markup and markup.upper() == "HTML":
+            return split_html(text, limits.max_chars), options
+        parts = split_message(text, limits.max_chars)
+        if markup and len(parts) > 1:
+            options = {**options, limits.markup_option: None}
+        return parts, options
+
+    async def _send_part(
+        self, route: _Channel, chat_bucket: TokenBucket, chat_id: str, part: str, options: Dict
+    ) -> Dict:
+        for attempt in range(settings.outbound_max_retries + 1):
+            await chat_bucket.acquire()
+            await route.bucket.acquire()
+            try:
+                return await route.sender(chat_id, part, **options)
+            except RateLimited as e:
+                self.stats["rate_limited"] += 1
+                if attempt >= settings.outbound_max_retries:
+                    return {"error": f"rate limited: {e}"}
+                wait = e.retry_after_s or settings.outbound_backoff_base_s * (2 ** attempt)
+                (route.bucket if e.scope == "global" else chat_bucket).pause(wait)
+                print(f"[Outbound] {chat_id} throttled, retrying in {wait:.1f}s")
+            except Exception as e:
+                return {"error": str(e)}
+        return {"error": "rate limited"}
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "chats": {name: len(ch.chats) for name, ch in self._channels.items()}}
+
+
+# Singleton
+outbound_dispatcher = OutboundDispatcher()
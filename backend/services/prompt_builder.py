@@ -0,0 +1,141 @@
+"""
+📐 Aureon Cortex - Prompt Builder
+Assembles the orchestrator prompt under a token budget.
+
+Budget is granted by priority (current message > recent turns > memories >
+research); the prompt keeps its reading order. A section that does not fit
+is cut at line/sentence boundaries from the side that matters least
+(oldest turns, last memories, trailing sources), or head+tail for the
+current message.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Iterable, List, Literal, Optional, Tuple, Union
+import math
+import re
+
+from core.config import settings
+
+# Rough chars per token for each provider's tokenizer on mixed ES/EN text
+CHARS_PER_TOKEN: Dict[str, float] = {
+    "gemini": 4.0,
+    "groq": 3.6,      # Llama 3 tokenizer
+    "mistral": 3.4,
+    "deepseek": 3.7,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.4
+TRUNCATION_MARK = "…[recortado]"
+SECTION_SEPARATOR = "\n\n"
+
+Keep = Literal["head", "tail", "ends"]
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def chars_per_token(providers: Optional[Iterable[Union[str, Enum]]] = None) -> float:
+    """Densest tokenizer among `providers` (names or AIProvider), so the estimate never undercounts."""
+    ratios = [
+        CHARS_PER_TOKEN.get(p.value if isinstance(p, Enum) else p, DEFAULT_CHARS_PER_TOKEN)
+        for p in (providers or [])
+    ]
+    return min(ratios) if ratios else DEFAULT_CHARS_PER_TOKEN
+
+
+def estimate_tokens(text: str, providers: Optional[Iterable[Union[str, Enum]]] = None) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / chars_per_token(providers))
+
+
+@dataclass
+class PromptSection:
+    name: str
+    text: str
+    priority: int          # lower = funded first
+    keep: Keep = "head"    # which part survives truncation
+    header: str = ""       # label kept verbatim above the (possibly cut) text
+    min_tokens: int = 0    # below this, drop the section instead of a stub
+
+
+def _cut_head(text: str, max_chars: int) -> str:
+    """Longest prefix within max_chars, ending at a line or sentence break if possible."""
+    if len(text) <= max_chars:
+        return text
+    window = text[:max_chars]
+    cut = window.rfind("\n")
+    if cut <= max_chars // 2:
+        ends = [m.end() for m in _SENTENCE_END.finditer(window)]
+        cut = ends[-1] if ends else -1
+    if cut > max_chars // 2:
+        return window[:cut].rstrip()
+    return window.rstrip()
+
+
+def _cut_tail(text: str, max_chars: int) -> str:
+    """Longest suffix within max_chars, starting at a line break if possible."""
+    if len(text) <= max_chars:
+        return text
+    window = text[-max_chars:]
+    cut = window.find("\n")
+    if 0 <= cut < max_chars // 2:
+        return window[cut + 1:].lstrip()
+    return window.lstrip()
+
+
+def truncate(text: str, max_tokens: int, keep: Keep, providers: Optional[Iterable[str]] = None) -> str:
+    if estimate_tokens(text, providers) <= max_tokens:
+        return text
+    max_chars = int(max_tokens * chars_per_token(providers)) - len(TRUNCATION_MARK) - 2
+    if max_chars <= 0:
+        return ""
+    if keep == "tail":
+        return f"{TRUNCATION_MARK}\n{_cut_tail(text, max_chars)}"
+    if keep == "ends":
+        half = max_chars // 2
+        return f"{_cut_head(text, half)}\n{TRUNCATION_MARK}\n{_cut_tail(text, half)}"
+    return f"{_cut_head(text, max_chars)}\n{TRUNCATION_MARK}"
+
+
+def build_prompt(
+    sections: List[PromptSection],
+    budget_tokens: Optional[int] = None,
+    providers: Optional[Iterable[str]] = None,
+) -> Tuple[str, Dict]:
+    """Fit `sections` (in reading order) into the budget.
+
+    Returns (prompt, report) where report has per-section token use;
+    headers and the separators between sections count against the budget.
+    """
+    providers = list(providers or [])
+    budget = budget_tokens or settings.prompt_budget_tokens
+    remaining = budget
+    fitted: Dict[str, str] = {}
+    report: Dict = {"budget": budget, "chars_per_token": chars_per_token(providers), "sections": {}}
+
+    separator = estimate_tokens(SECTION_SEPARATOR, providers)
+
+    for section in sorted(sections, key=lambda s: s.priority):
+        # Every section after the first one kept also costs a separator
+        joint = separator if any(fitted.values()) else 0
+        full = f"{section.header}{section.text}" if section.text else ""
+        original = estimate_tokens(full, providers)
+        text = full
+        if original > remaining - joint:
+            body_budget = remaining - joint - estimate_tokens(section.header, providers)
+            body = truncate(section.text, body_budget, section.keep, providers) if body_budget > 0 else ""
+            text = f"{section.header}{body}" if body else ""
+            if estimate_tokens(body, providers) < section.min_tokens:
+                text = ""
+        used = estimate_tokens(text, providers)
+        remaining -= used + (joint if text else 0)
+        fitted[section.name] = text
+        report["sections"][section.name] = {
+            "tokens": used,
+            "original_tokens": original,
+            "truncated": used < original,
+        }
+
+    prompt = SECTION_SEPARATOR.join(fitted[s.name] for s in sections if fitted.get(s.name))
+    report["total"] = budget - remaining
+    return prompt, report
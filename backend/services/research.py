@@ -6,9 +6,8 @@ from __future__ import annotations
 
 from typing import List, Dict, Tuple
 
-import httpx
-
 from core.config import settings
+from core.http import http_clients
 
 
 class ResearchService:
@@ -25,10 +24,9 @@ class ResearchService:
             "search_depth": "basic",
         }
 
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.post("https://api.tavily.com/search", json=payload)
-            response.raise_for_status()
-            data = response.json()
+        response = await http_clients.get("tavily").post("https://api.tavily.com/search", json=payload)
+        response.raise_for_status()
+        data = response.json()
 
         answer = data.get("answer", "")
         citations: List[Dict] = []
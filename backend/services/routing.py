@@ -0,0 +1,203 @@
+"""
+🧭 Aureon Cortex - Provider Router
+Rolling latency / error-rate / rate-limit state per AI provider and key,
+with circuit breakers. Used by IntelligencePool to rank providers,
+fail over and decide when to hedge.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import time
+
+import httpx
+
+from core.config import settings
+
+LATENCY_WINDOW = 100
+OUTCOME_WINDOW = 50
+MIN_SAMPLES_FOR_HEDGE = 20
+DEFAULT_RATE_LIMIT_S = 30.0
+AUTH_FAILURE_COOLDOWN_S = 600.0
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """HTTP status behind an exception from httpx, openai or google-api-core."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def retry_after_s(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _percentile(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class ProviderHealth:
+    """Rolling stats + circuit breaker for one provider."""
+
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=OUTCOME_WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.rate_limited_until = 0.0
+        self.half_open_probe = False
+
+    @property
+    def p50(self) -> Optional[float]:
+        return _percentile(list(self.latencies), 0.50)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return _percentile(list(self.latencies), 0.95)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def state(self, now: float) -> str:
+        if self.consecutive_failures < settings.llm_breaker_failures:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+    def available(self, now: float) -> bool:
+        if now < self.rate_limited_until:
+            return False
+        state = self.state(now)
+        if state == "open":
+            return False
+        # Half-open: let exactly one probe through until it reports back
+        return not (state == "half_open" and self.half_open_probe)
+
+    def snapshot(self, now: float) -> Dict:
+        return {
+            "state": self.state(now),
+            "p50_ms": int(self.p50 * 1000) if self.p50 is not None else None,
+            "p95_ms": int(self.p95 * 1000) if self.p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "samples": len(self.latencies),
+            "rate_limited_for_s": max(0, int(self.rate_limited_until - now)),
+        }
+
+
+class ProviderRouter:
+    """Ranks providers by observed health; tracks per-key rate limits."""
+
+    def __init__(self):
+        self._health: Dict[str, ProviderHealth] = {}
+        self._key_limited_until: Dict[Tuple[str, int], float] = {}
+
+    def health(self, provider: str) -> ProviderHealth:
+        if provider not in self._health:
+            self._health[provider] = ProviderHealth()
+        return self._health[provider]
+
+    def rank(self, providers: List[str]) -> List[str]:
+        """Healthy providers first, fastest (error-weighted p50) first.
+
+        Providers without samples keep their configured position, so the
+        static priority order applies until there is data. Unavailable
+        providers are appended last as a last resort.
+        """
+        now = time.monotonic()
+
+        def score(item: Tuple[int, str]) -> Tuple[float, int]:
+            position, provider = item
+            health = self.health(provider)
+            p50 = health.p50
+            if p50 is None:
+                return (float(position), position)
+            # Seconds-based score on the same scale as positions (~1 per second)
+            return (p50 * (1 + 4 * health.error_rate), position)
+
+        indexed = list(enumerate(providers))
+        healthy = [item for item in indexed if self.health(item[1]).available(now)]
+        degraded = [item for item in indexed if not self.health(item[1]).available(now)]
+        ordered = sorted(healthy, key=score) + sorted(degraded, key=score)
+        return [provider for _, provider in ordered]
+
+    def begin(self, provider: str) -> None:
+        health = self.health(provider)
+        if health.state(time.monotonic()) == "half_open":
+            health.half_open_probe = True
+
+    def abandon(self, provider: str) -> None:
+        """A started call was cancelled; release the half-open probe slot."""
+        self.health(provider).half_open_probe = False
+
+    def hedge_delay_s(self, provider: str) -> Optional[float]:
+        health = self.health(provider)
+        if len(health.latencies) < MIN_SAMPLES_FOR_HEDGE:
+            return None
+        return health.p95
+
+    def record_success(self, provider: str, latency_s: float) -> None:
+        health = self.health(provider)
+        health.latencies.append(latency_s)
+        health.outcomes.append(True)
+        health.consecutive_failures = 0
+        health.half_open_probe = False
+
+    def record_failure(
+        self,
+        provider: str,
+        exc: BaseException,
+        key_index: Optional[int] = None,
+        key_count: int = 1,
+    ) -> None:
+        now = time.monotonic()
+        health = self.health(provider)
+        health.outcomes.append(False)
+        health.half_open_probe = False
+        status = error_status(exc)
+
+        if status == 429:
+            until = now + (retry_after_s(exc) or DEFAULT_RATE_LIMIT_S)
+            if key_index is None:
+                health.rate_limited_until = until
+                return
+            # Only this key is throttled; the provider stays routable until all are
+            self._key_limited_until[(provider, key_index)] = until
+            limits = [
+                self._key_limited_until.get((provider, i), 0.0) for i in range(key_count)
+            ]
+            if min(limits) > now:
+                health.rate_limited_until = min(limits)
+            return
+
+        health.consecutive_failures += 1
+        cooldown = AUTH_FAILURE_COOLDOWN_S if status in (401, 403) else settings.llm_breaker_cooldown_s
+        if status in (401, 403):
+            health.consecutive_failures = max(health.consecutive_failures, settings.llm_breaker_failures)
+        if health.consecutive_failures >= settings.llm_breaker_failures:
+            health.open_until = now + cooldown
+
+    def key_available(self, provider: str, key_index: int) -> bool:
+        return time.monotonic() >= self._key_limited_until.get((provider, key_index), 0.0)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        return {provider: health.snapshot(now) for provider, health in self._health.items()}
+
+
+# Singleton
+provider_router = ProviderRouter()
@@ -0,0 +1,122 @@
+"""
+🔁 Aureon Cortex - Resumable Streams
+Chat generation runs as a background task that publishes numbered events
+into a bounded per-task ring buffer. SSE connections are just readers:
+a client that drops and reconnects with `Last-Event-ID` replays what it
+missed and keeps following the same in-flight task.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+import asyncio
+
+from core.config import settings
+
+EVENT_ID_SEP = ":"
+
+
+def format_event_id(task_id: str, seq: int) -> str:
+    return f"{task_id}{EVENT_ID_SEP}{seq}"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """`<task_id>:<seq>` -> (task_id, seq)."""
+    if not value or EVENT_ID_SEP not in value:
+        return None
+    task_id, _, seq = value.rpartition(EVENT_ID_SEP)
+    try:
+        return task_id, int(seq)
+    except ValueError:
+        return None
+
+
+class TaskStream:
+    """Events of one task: ring buffer + running text for gap recovery."""
+
+    def __init__(self, task_id: str, user_id: str):
+        self.task_id = task_id
+        self.user_id = user_id
+        # (seq, event, len(content) before the event)
+        self.events: Deque[Tuple[int, Dict, int]] = deque(maxlen=settings.stream_buffer_events)
+        self.next_seq = 1
+        self.content = ""
+        self.finished = False
+        self.producer: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event: Dict) -> None:
+        self.events.append((self.next_seq, event, len(self.content)))
+        if event.get("type") == "delta":
+            self.content += event.get("content", "")
+        self.next_seq += 1
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        self.finished = True
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self, after_seq: int = 0) -> AsyncIterator[Tuple[int, Dict]]:
+        """Yield (seq, event) after `after_seq` until the task finishes."""
+        cursor = after_seq
+        while True:
+            if self.events and cursor + 1 < self.events[0][0]:
+                # The ring buffer dropped events this reader never saw:
+                # send the text up to the oldest buffered event, then replay
+                oldest, _, content_len = self.events[0]
+                cursor = oldest - 1
+                yield cursor, {"type": "resync", "content": self.content[:content_len]}
+            for seq, event, _ in list(self.events):
+                if seq > cursor:
+                    cursor = seq
+                    yield seq, event
+            if self.finished and cursor >= self.next_seq - 1:
+                return
+            async with self._changed:
+                if cursor >= self.next_seq - 1 and not self.finished:
+                    await self._changed.wait()
+
+
+class StreamHub:
+    """In-process registry of live task streams."""
+
+    def __init__(self):
+        self._streams: Dict[str, TaskStream] = {}
+
+    def get(self, task_id: str) -> Optional[TaskStream]:
+        return self._streams.get(task_id)
+
+    def start(
+        self,
+        task_id: str,
+        user_id: str,
+        producer: Callable[[TaskStream], Awaitable[None]],
+    ) -> TaskStream:
+        """Run `producer(stream)` detached from any connection."""
+        stream = TaskStream(task_id, user_id)
+        self._streams[task_id] = stream
+
+        async def run():
+            try:
+                await producer(stream)
+            finally:
+                await stream.finish()
+                # Late reconnects can still replay for a while
+                asyncio.get_running_loop().call_later(
+                    settings.stream_retention_s, self._streams.pop, task_id, None
+                )
+
+        stream.producer = asyncio.create_task(run())
+        return stream
+
+    def snapshot(self) -> Dict:
+        return {
+            "streams": len(self._streams),
+            "active": sum(1 for s in self._streams.values() if not s.finished),
+        }
+
+
+# Singleton
+stream_hub = StreamHub()
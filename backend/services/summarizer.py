@@ -3,14 +3,16 @@
 Background service for conversation summarization and vectorization.
 Python 3.9 compatible.
 """
-from typing import Optional, List
+from typing import Optional
 from datetime import datetime, timedelta
 import asyncio
 
-from .memory import memory_service, Memory
+import numpy as np
+
+from .memory import memory_service, Memory, SUMMARIZE_AFTER_MESSAGES
 from .intelligence import intelligence_pool
 from .embeddings import generate_embedding
-from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
 
 
 class SummarizerService:
@@ -27,7 +29,7 @@ class SummarizerService:
         self.is_running = False
         self._task: Optional[asyncio.Task] = None
     
-    async def start(self, interval_hours: int = 24):
+    async def start(self, interval_hours: float = 24):
         """Start the background summarization job."""
         if self.is_running:
             return
@@ -45,7 +47,7 @@ class SummarizerService:
             except asyncio.CancelledError:
                 pass
     
-    async def _run_loop(self, interval_hours: int):
+    async def _run_loop(self, interval_hours: float):
         """Main loop for periodic summarization."""
         while self.is_running:
             try:
@@ -57,20 +59,20 @@ class SummarizerService:
             await asyncio.sleep(interval_hours * 3600)
     
     async def run_summarization(self):
-        """Run summarization for all users with pending context."""
+        """Queue an archive job for every user with pending context."""
         print("[Summarizer] Starting summarization cycle...")
-        
-        # In production, query Supabase for users with large context windows
-        # For now, use in-memory data
-        from .memory import _context_db
-        
-        summarized = 0
-        for user_id in list(_context_db.keys()):
-            memory = await memory_service.summarize_and_archive(user_id, force=False)
-            if memory:
-                summarized += 1
-        
-        print(f"[Summarizer] Completed. Summarized {summarized} context windows.")
+
+        admin = get_supabase_admin()
+        pending = await db_execute(admin.rpc("users_pending_archive", {
+            "p_min_messages": SUMMARIZE_AFTER_MESSAGES,
+        }))
+
+        queued = 0
+        for row in (pending.data or []):
+            await memory_service.schedule_archive(row["user_id"])
+            queued += 1
+
+        print(f"[Summarizer] Completed. Queued {queued} context windows.")
     
     async def generate_smart_summary(self, content: str) -> str:
         """
@@ -90,7 +92,8 @@ El resumen debe:
                 prompt=f"Resume esta conversación:\n\n{content}",
                 system_prompt=system_prompt,
                 max_tokens=200,
-                temperature=0.3
+                temperature=0.3,
+                cache_scope="system",
             )
             return summary
         except Exception as e:
@@ -98,31 +101,11 @@ El resumen debe:
             lines = content.split("\n")
             return f"Conversación de {len(lines)} mensajes"
     
-    async def generate_embedding(self, text: str) -> List[float]:
+    async def generate_embedding(self, text: str) -> np.ndarray:
         """
         Generate embedding vector for text.
-        Uses Gemini embeddings o hash fallback.
+        Uses Gemini embeddings o hash fallback (async, non-blocking).
         """
-        try:
-            # Gemini embeddings
-            import google.generativeai as genai
-            
-            if settings.gemini_api_key:
-                genai.configure(api_key=settings.gemini_api_key)
-                result = genai.embed_content(
-                    model="models/embedding-001",
-                    content=text[:8000],
-                    task_type="retrieval_document"
-                )
-                # Pad to 1536 dimensions if needed
-                embedding = result['embedding']
-                if len(embedding) < 1536:
-                    embedding.extend([0.0] * (1536 - len(embedding)))
-                return embedding[:1536]
-        except Exception as e:
-            print(f"[Summarizer] Gemini embedding failed: {e}")
-        
-        # Fallback: embeddings module (Gemini o hash)
         return await generate_embedding(text)
     
     async def reprocess_memory(self, memory: Memory) -> Memory:
@@ -0,0 +1,212 @@
+"""
+🗂️ Aureon Cortex - Task Store
+State of in-flight chat tasks (SSE progress), readable from any worker.
+
+- `memory`: per-process dict (single worker / dev)
+- `postgres`: `chat_tasks` table shared by every worker and replica
+- `auto` (default): `postgres` when Supabase is configured, else `memory`
+
+Entries expire after `task_ttl_s`; there is no per-task cleanup.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set
+import asyncio
+import copy
+import time
+
+from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
+
+# Expired rows are purged at most this often
+PURGE_INTERVAL_S = 300.0
+
+
+class InMemoryTaskStore:
+    def __init__(self):
+        self._tasks: Dict[str, tuple] = {}
+        self._last_purge = 0.0
+
+    async def save(self, task: Dict) -> None:
+        self._tasks[task["id"]] = (time.monotonic() + settings.task_ttl_s, copy.deepcopy(task))
+        await self.purge()
+
+    async def load(self, task_id: str) -> Optional[Dict]:
+        item = self._tasks.get(task_id)
+        if item is None or item[0] <= time.monotonic():
+            return None
+        return copy.deepcopy(item[1])
+
+    async def purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL_S:
+            return
+        self._last_purge = now
+        for task_id in [k for k, (expires, _) in self._tasks.items() if expires <= now]:
+            del self._tasks[task_id]
+
+
+class PostgresTaskStore:
+    def __init__(self):
+        self._last_purge = 0.0
+
+    async def save(self, task: Dict) -> None:
+        admin = get_supabase_admin()
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.task_ttl_s)
+        await db_execute(admin.table("chat_tasks").upsert({
+            "id": task["id"],
+            "user_id": task.get("user_id"),
+            "tenant_id": task.get("tenant_id"),
+            "status": task["status"],
+            "state": task,
+            "expires_at": expires_at.isoformat(),
+        }, on_conflict="id"))
+        await self.purge()
+
+    async def load(self, task_id: str) -> Optional[Dict]:
+        admin = get_supabase_admin()
+        res = await db_execute(admin.table("chat_tasks").select("state")
+            .eq("id", task_id)
+            .gt("expires_at", datetime.now(timezone.utc).isoformat())
+            .limit(1))
+        return res.data[0]["state"] if res and res.data else None
+
+    async def purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL_S:
+            return
+        self._last_purge = now
+        try:
+            admin = get_supabase_admin()
+            await db_execute(admin.table("chat_tasks").delete()
+                .lt("expires_at", datetime.now(timezone.utc).isoformat()))
+        except Exception as e:
+            print(f"[Tasks] Purge failed: {e}")
+
+
+def _build_store():
+    if settings.task_store != "memory" and settings.supabase_url:
+        return PostgresTaskStore()
+    return InMemoryTaskStore()
+
+
+class TaskManager:
+    """
+    Manages in-flight tasks for SSE streaming.
+
+    The streaming worker owns the live copy and mutates it synchronously;
+    writes to the store run in the background, coalesced to the latest
+    state, so progress updates never stall the stream.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or _build_store()
+        self._live: Dict[str, Dict] = {}
+        self._flushing: Set[str] = set()
+        self._dirty: Set[str] = set()
+        # The loop only keeps weak references to tasks
+        self._flush_tasks: Set[asyncio.Task] = set()
+
+    def create_task(self, task_id: str, message: str, user_id: str = None, tenant_id: str = None) -> Dict:
+        """Create a new task with initial steps."""
+        self._live[task_id] = {
+            "id": task_id,
+            "message": message,
+            "user_id": user_id,
+            "tenant_id": tenant_id,
+            "status": "active",
+            "steps": [
+                {"number": 1, "description": "Analizando mensaje", "status": "active", "result": None},
+                {"number": 2, "description": "Procesando contexto", "status": "pending", "result": None},
+                {"number": 3, "description": "Generando respuesta", "status": "pending", "result": None},
+            ],
+            "current_step": 0,
+            "created_at": datetime.now().isoformat(),
+            "response": None
+        }
+        self._schedule(task_id)
+        return self._live[task_id]
+
+    def update_step(self, task_id: str, step_number: int, status: str, result: str = None):
+        """Update a specific step's status."""
+        task = self._live.get(task_id)
+        if not task:
+            return
+        for step in task["steps"]:
+            if step["number"] == step_number:
+                step["status"] = status
+                if result:
+                    step["result"] = result
+                break
+        task["current_step"] = step_number
+        self._schedule(task_id)
+
+    def complete_task(self, task_id: str, response: str, card: Dict = None):
+        """Mark task as complete with response."""
+        task = self._live.get(task_id)
+        if not task:
+            return
+        task["status"] = "complete"
+        task["response"] = response
+        task["card"] = card
+        for step in task["steps"]:
+            if step["status"] != "complete":
+                step["status"] = "complete"
+        self._schedule(task_id)
+
+    def fail_task(self, task_id: str, error: str):
+        task = self._live.get(task_id)
+        if not task:
+            return
+        task["status"] = "error"
+        task["error"] = error
+        self._schedule(task_id)
+
+    def release(self, task_id: str):
+        """Stream ended. An unfinished task is stored as cancelled; the live
+        copy is dropped once its final state has been written."""
+        task = self._live.get(task_id)
+        if task is None:
+            return
+        if task["status"] == "active":
+            task["status"] = "cancelled"
+            self._schedule(task_id)
+        elif task_id not in self._flushing:
+            self._live.pop(task_id, None)
+
+    async def get_task(self, task_id: str) -> Optional[Dict]:
+        """Get task by ID (live copy on the owning worker, else the shared store)."""
+        task = self._live.get(task_id)
+        if task is not None:
+            return copy.deepcopy(task)
+        return await self.store.load(task_id)
+
+    def _schedule(self, task_id: str) -> None:
+        self._dirty.add(task_id)
+        if task_id not in self._flushing:
+            self._flushing.add(task_id)
+            flush = asyncio.create_task(self._flush(task_id))
+            self._flush_tasks.add(flush)
+            flush.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, task_id: str) -> None:
+        try:
+            while task_id in self._dirty:
+                self._dirty.discard(task_id)
+                task = self._live.get(task_id)
+                if task is None:
+                    break
+                try:
+                    await self.store.save(copy.deepcopy(task))
+                except Exception as e:
+                    print(f"[Tasks] Could not store {task_id}: {e}")
+        finally:
+            self._flushing.discard(task_id)
+            task = self._live.get(task_id)
+            if task is not None and task["status"] != "active" and task_id not in self._dirty:
+                self._live.pop(task_id, None)
+
+
+# Singleton
+task_manager = TaskManager()
@@ -4,8 +4,11 @@ Envío y recepción de mensajes via Telegram Bot API.
 Python 3.9 compatible.
 """
 from typing import Optional, Dict, List, Union
-import httpx
 from core.config import settings
+from core.http import http_clients
+from services.outbound import ChannelLimits, RateLimited, outbound_dispatcher
+
+MAX_MESSAGE_CHARS = 4096
 
 
 class TelegramService:
@@ -26,23 +29,28 @@ class TelegramService:
         return user_id in self.allowed_ids or not self.allowed_ids
     
     async def send_message(self, chat_id: Union[int, str], message: str, parse_mode: str = "HTML") -> Dict:
-        """Envía un mensaje a un chat de Telegram."""
+        """Envía un mensaje (partido en varios si excede el límite) a un chat de Telegram."""
         if not self.token:
             return {"error": "Telegram not configured"}
-        
+        return await outbound_dispatcher.send("telegram", chat_id, message, parse_mode=parse_mode)
+
+    async def _send_part(self, chat_id: str, message: str, parse_mode: Optional[str] = "HTML") -> Dict:
+        """Un sendMessage; lanza RateLimited ante un 429 (con retry_after). Sin parse_mode = texto plano."""
         url = f"{self.api_url}/sendMessage"
         payload = {
             "chat_id": chat_id,
-            "text": message[:4096],  # Telegram limit
-            "parse_mode": parse_mode
+            "text": message,
         }
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=30)
-                return response.json()
-        except Exception as e:
-            return {"error": str(e)}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+
+        response = await http_clients.get("telegram").post(url, json=payload, timeout=30)
+        data = response.json()
+        if data.get("error_code") == 429 or response.status_code == 429:
+            raise RateLimited((data.get("parameters") or {}).get("retry_after"), detail=data.get("description", ""))
+        if not data.get("ok", False):
+            return {"error": data.get("description", "Telegram error"), **data}
+        return data
     
     async def set_webhook(self, webhook_url: str) -> Dict:
         """Configura el webhook de Telegram."""
@@ -53,9 +61,8 @@ class TelegramService:
         payload = {"url": webhook_url}
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=30)
-                return response.json()
+            response = await http_clients.get("telegram").post(url, json=payload, timeout=30)
+            return response.json()
         except Exception as e:
             return {"error": str(e)}
     
@@ -79,3 +86,12 @@ class TelegramService:
 
 # Singleton
 telegram_service = TelegramService()
+
+outbound_dispatcher.register("telegram", telegram_service._send_part, ChannelLimits(
+    max_chars=MAX_MESSAGE_CHARS,
+    global_rps=settings.outbound_telegram_rps,
+    global_burst=settings.outbound_telegram_rps,
+    chat_rps=settings.outbound_telegram_chat_rps,
+    chat_burst=settings.outbound_telegram_chat_burst,
+    markup_option="parse_mode",
+))
@@ -0,0 +1,41 @@
+"""
+📐 Aureon Cortex - Vector Utilities
+NumPy float32 helpers shared by embeddings, caches and pgvector payloads.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional, Sequence
+import json
+
+import numpy as np
+
+
+def to_array(embedding: Sequence[float]) -> np.ndarray:
+    """float32 vector representation used throughout the embedding path."""
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def l2_normalize(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        return vector
+    return vector / np.float32(norm)
+
+
+def to_pgvector(embedding: Sequence[float], decimals: int = 6) -> str:
+    """Compact pgvector literal ("[0.012345,-0.4561,...]") for PostgREST payloads.
+
+    Unit vectors rounded to 6 decimals keep cosine scores exact to ~1e-6
+    while cutting the JSON size roughly in half versus full float reprs.
+    """
+    rounded = np.round(to_array(embedding).astype(np.float64), decimals)
+    return "[" + ",".join(map(repr, rounded.tolist())) + "]"
+
+
+def from_pgvector(value: Any) -> Optional[np.ndarray]:
+    """Parse a pgvector column as returned by PostgREST ("[...]" or a list)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return to_array(value)
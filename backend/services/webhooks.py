@@ -0,0 +1,283 @@
+"""
+📨 Aureon Cortex - Inbound Webhook Dispatcher
+Webhooks persist an inbound event keyed by the provider message id and ACK
+right away; events are then processed by a bounded worker pool.
+
+Events from one sender run strictly in arrival order (one lane per sender);
+different senders run concurrently up to `webhook_workers`. Channels can
+opt into coalescing: a burst from one sender (each message within
+`coalesce_window_s` of the previous) becomes a single handler call.
+
+The worker that persists an event owns it (`locked_by`) and heartbeats it
+until it is processed. Every replica periodically claims unfinished events
+whose owner stopped heartbeating (`claim_inbound_events`, SKIP LOCKED), so
+a crash or deploy never loses an event and no two replicas replay one.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+import asyncio
+import os
+import socket
+import time
+import uuid
+
+from core.config import settings
+from core.supabase import get_supabase_admin, db_execute
+
+# Handlers receive the batch of events for one turn (a single event unless coalesced)
+EventHandler = Callable[[List[Dict]], Awaitable[None]]
+
+# Abandoned events claimed per recovery sweep
+RECOVERY_BATCH = 200
+
+
+def _persist_enabled() -> bool:
+    return bool(settings.supabase_url and settings.supabase_service_role_key)
+
+
+@dataclass
+class _Route:
+    handler: EventHandler
+    coalesce_window_s: float = 0.0
+    coalesce_max_wait_s: float = 0.0
+    max_batch: int = 1
+
+
+class InboundDispatcher:
+    """Dedupe + per-sender ordered, bounded processing of webhook events."""
+
+    def __init__(self):
+        self._routes: Dict[str, _Route] = {}
+        # lane -> (monotonic arrival, event)
+        self._lanes: Dict[str, Deque[Tuple[float, Dict]]] = {}
+        self._active: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._recovery_task: Optional[asyncio.Task] = None
+        # Persisted events this worker owns (queued or processing)
+        self._held: Set[str] = set()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # Fast path for redeliveries seen by this process
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.stats: Dict[str, int] = {
+            "accepted": 0,
+            "duplicates": 0,
+            "processed": 0,
+            "failed": 0,
+            "turns": 0,
+            "coalesced": 0,
+        }
+
+    def register(
+        self,
+        channel: str,
+        handler: EventHandler,
+        coalesce_window_s: float = 0.0,
+        coalesce_max_wait_s: float = 0.0,
+        max_batch: int = 1,
+    ) -> None:
+        self._routes[channel] = _Route(handler, coalesce_window_s, coalesce_max_wait_s, max(1, max_batch))
+
+    def _remember(self, key: str) -> bool:
+        """False if `key` was already seen."""
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return False
+        self._seen[key] = None
+        while len(self._seen) > settings.webhook_dedupe_cache_size:
+            self._seen.popitem(last=False)
+        return True
+
+    async def accept(
+        self,
+        channel: str,
+        provider_message_id: str,
+        sender_id: str,
+        payload: Dict,
+        tenant_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Optional[Dict]:
+        """Persist and enqueue an event. Returns None for a duplicate delivery."""
+        provider_message_id = str(provider_message_id or uuid.uuid4())
+        if not self._remember(f"{channel}:{provider_message_id}"):
+            self.stats["duplicates"] += 1
+            return None
+
+        event = {
+            "channel": channel,
+            "provider_message_id": provider_message_id,
+            "sender_id": str(sender_id),
+            "tenant_id": tenant_id,
+            "user_id": user_id,
+            "payload": payload,
+            "status": "received",
+        }
+        if _persist_enabled():
+            event["locked_by"] = self.worker_id
+            event["locked_at"] = datetime.now(timezone.utc).isoformat()
+            event["attempts"] = 1
+            admin = get_supabase_admin()
+            try:
+                inserted = await db_execute(admin.table("inbound_events").insert(event))
+                event = inserted.data[0]
+            except Exception as e:
+                if await self._exists(channel, provider_message_id):
+                    self.stats["duplicates"] += 1
+                    return None
+                # Still process it: losing the message is worse than a rare duplicate
+                print(f"[Webhooks] Could not persist {channel}:{provider_message_id}: {e}")
+
+        self.stats["accepted"] += 1
+        self.dispatch(event)
+        return event
+
+    async def _exists(self, channel: str, provider_message_id: str) -> bool:
+        try:
+            admin = get_supabase_admin()
+            res = await db_execute(admin.table("inbound_events").select("id")
+                .eq("channel", channel)
+                .eq("provider_message_id", provider_message_id)
+                .limit(1))
+            return bool(res and res.data)
+        except Exception:
+            return False
+
+    def dispatch(self, event: Dict) -> None:
+        """Queue `event` on its sender's lane, starting the lane if idle."""
+        lane_key = f"{event['channel']}:{event['sender_id']}"
+        if event.get("id"):
+            self._held.add(event["id"])
+        item = (time.monotonic(), event)
+        lane = self._lanes.get(lane_key)
+        if lane is not None:
+            lane.append(item)
+            return
+        self._lanes[lane_key] = deque([item])
+        task = asyncio.create_task(self._drain(lane_key))
+        self._active.add(task)
+        task.add_done_callback(self._active.discard)
+
+    async def _drain(self, lane_key: str) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.webhook_workers)
+        lane = self._lanes[lane_key]
+        try:
+            while lane:
+                route = self._routes.get(lane[0][1]["channel"])
+                if route and route.coalesce_window_s > 0:
+                    await self._settle(lane, route)
+                count = min(len(lane), route.max_batch if route else 1)
+                batch = [lane[i][1] for i in range(count)]
+                async with self._semaphore:
+                    await self._process(route, batch)
+                for _ in range(count):
+                    lane.popleft()
+        finally:
+            self._lanes.pop(lane_key, None)
+
+    async def _settle(self, lane: Deque[Tuple[float, Dict]], route: _Route) -> None:
+        """Wait until the sender pauses for `coalesce_window_s` (capped by max wait / batch)."""
+        deadline = lane[0][0] + max(route.coalesce_max_wait_s, route.coalesce_window_s)
+        while len(lane) < route.max_batch:
+            now = time.monotonic()
+            quiet_until = min(lane[-1][0] + route.coalesce_window_s, deadline)
+            if now >= quiet_until:
+                return
+            await asyncio.sleep(quiet_until - now)
+
+    async def _process(self, route: Optional[_Route], batch: List[Dict]) -> None:
+        channel = batch[0]["channel"]
+        await self._mark(batch, {"status": "processing"})
+        try:
+            if route is None:
+                raise RuntimeError(f"No handler for channel '{channel}'")
+            await route.handler(batch)
+            updates = {"status": "processed", "last_error": None}
+            self.stats["processed"] += len(batch)
+        except Exception as e:
+            ids = ",".join(str(event.get("provider_message_id")) for event in batch)
+            print(f"❌ {channel} event(s) {ids} failed: {e}")
+            updates = {"status": "failed", "last_error": str(e)[:1000]}
+            self.stats["failed"] += len(batch)
+        self.stats["turns"] += 1
+        self.stats["coalesced"] += len(batch) - 1
+        updates["processed_at"] = datetime.now(timezone.utc).isoformat()
+        await self._mark(batch, updates)
+        for event in batch:
+            self._held.discard(event.get("id"))
+
+    async def _mark(self, batch: List[Dict], updates: Dict) -> None:
+        ids = [event["id"] for event in batch if event.get("id")]
+        if not ids or not _persist_enabled():
+            return
+        try:
+            admin = get_supabase_admin()
+            await db_execute(admin.table("inbound_events").update(updates).in_("id", ids))
+        except Exception as e:
+            print(f"[Webhooks] Could not update events {ids}: {e}")
+
+    async def start(self) -> None:
+        """Start heartbeating owned events and sweeping abandoned ones (crash, deploy)."""
+        if not _persist_enabled() or self._recovery_task is not None:
+            return
+        self._recovery_task = asyncio.create_task(self._recovery_loop())
+
+    async def _recovery_loop(self) -> None:
+        while True:
+            if self._held:
+                try:
+                    admin = get_supabase_admin()
+                    await db_execute(admin.rpc("heartbeat_inbound_events", {
+                        "p_worker": self.worker_id,
+                        "p_ids": list(self._held),
+                    }))
+                except Exception as e:
+                    print(f"[Webhooks] Heartbeat failed: {e}")
+            await self.recover()
+            await asyncio.sleep(settings.webhook_recovery_interval_s)
+
+    async def recover(self) -> int:
+        """Claim and replay events whose owner stopped heartbeating."""
+        try:
+            admin = get_supabase_admin()
+            res = await db_execute(admin.rpc("claim_inbound_events", {
+                "p_worker": self.worker_id,
+                "p_limit": RECOVERY_BATCH,
+                "p_stale_after_s": settings.webhook_lock_stale_s,
+                "p_max_attempts": settings.webhook_max_attempts,
+            }))
+        except Exception as e:
+            print(f"[Webhooks] Recovery claim failed: {e}")
+            return 0
+        for event in res.data or []:
+            self._remember(f"{event['channel']}:{event['provider_message_id']}")
+            self.dispatch(event)
+        if res.data:
+            print(f"   Webhooks: replaying {len(res.data)} abandoned events")
+        return len(res.data or [])
+
+    async def stop(self) -> None:
+        """Give in-flight lanes a moment to finish; leftovers are reclaimed once stale."""
+        if self._recovery_task:
+            self._recovery_task.cancel()
+            try:
+                await self._recovery_task
+            except asyncio.CancelledError:
+                pass
+            self._recovery_task = None
+        if self._active:
+            await asyncio.wait(self._active, timeout=10)
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "lanes": len(self._lanes),
+            "queued": sum(len(lane) for lane in self._lanes.values()),
+        }
+
+
+# Singleton
+inbound_dispatcher = InboundDispatcher()
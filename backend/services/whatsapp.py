@@ -3,9 +3,15 @@
 Envío y recepción de mensajes via WhatsApp Cloud API.
 Python 3.9 compatible.
 """
-from typing import Optional, Dict, List
-import httpx
+from typing import Iterator, Optional, Dict, List
 from core.config import settings
+from core.http import http_clients
+from services.outbound import ChannelLimits, RateLimited, outbound_dispatcher
+
+MAX_MESSAGE_CHARS = 4096
+# Graph API throttling codes: pair rate (same recipient) vs. account throughput
+PAIR_RATE_LIMIT_CODES = {131056}
+THROUGHPUT_LIMIT_CODES = {4, 80007, 130429}
 
 
 class WhatsAppService:
@@ -27,10 +33,13 @@ class WhatsAppService:
         return phone_clean in allowed_clean or not self.allowed_phones
     
     async def send_message(self, to: str, message: str) -> Dict:
-        """Envía un mensaje de texto a un número de WhatsApp."""
+        """Envía un mensaje de texto (partido en varios si excede el límite) a un número de WhatsApp."""
         if not self.phone_id or not self.token:
             return {"error": "WhatsApp not configured"}
-        
+        return await outbound_dispatcher.send("whatsapp", to.replace("+", ""), message)
+
+    async def _send_part(self, to: str, message: str) -> Dict:
+        """Un POST a /messages; lanza RateLimited si Meta pide frenar."""
         url = f"{self.BASE_URL}/{self.phone_id}/messages"
         headers = {
             "Authorization": f"Bearer {self.token}",
@@ -41,37 +50,64 @@ class WhatsAppService:
             "recipient_type": "individual",
             "to": to.replace("+", ""),
             "type": "text",
-            "text": {"body": message[:4096]}  # WhatsApp limit
+            "text": {"body": message}
         }
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=headers, timeout=30)
-                return response.json()
-        except Exception as e:
-            return {"error": str(e)}
+
+        response = await http_clients.get("whatsapp").post(url, json=payload, headers=headers, timeout=30)
+        data = response.json()
+        code = (data.get("error") or {}).get("code")
+        if code in PAIR_RATE_LIMIT_CODES:
+            raise RateLimited(detail=str(data["error"].get("message", "")))
+        if response.status_code == 429 or code in THROUGHPUT_LIMIT_CODES:
+            retry_after = response.headers.get("retry-after")
+            raise RateLimited(
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+                scope="global",
+                detail=str((data.get("error") or {}).get("message", "")),
+            )
+        return data
     
+    def iter_incoming(self, data: Dict) -> Iterator[Dict]:
+        """Recorre todos los mensajes del webhook (Meta agrupa entries/changes/messages)."""
+        for entry in data.get("entry") or []:
+            for change in entry.get("changes") or []:
+                value = change.get("value") or {}
+                for msg in value.get("messages") or []:
+                    yield {
+                        "from": msg.get("from", ""),
+                        "text": (msg.get("text") or {}).get("body", ""),
+                        "msg_id": msg.get("id", ""),
+                        "timestamp": msg.get("timestamp", ""),
+                    }
+
     def parse_incoming(self, data: Dict) -> Optional[Dict]:
-        """Extrae información del webhook entrante."""
+        """Extrae el primer mensaje del webhook entrante."""
         try:
-            entry = data.get("entry", [{}])[0]
-            changes = entry.get("changes", [{}])[0]
-            value = changes.get("value", {})
-            messages = value.get("messages", [])
-            
-            if not messages:
-                return None
-            
-            msg = messages[0]
-            return {
-                "from": msg.get("from", ""),
-                "text": msg.get("text", {}).get("body", ""),
-                "msg_id": msg.get("id", ""),
-                "timestamp": msg.get("timestamp", "")
-            }
+            return next(self.iter_incoming(data), None)
         except Exception:
             return None
 
+    def group_by_sender(self, data: Dict) -> Dict[str, List[Dict]]:
+        """Mensajes con texto agrupados por remitente, en orden de llegada."""
+        grouped: Dict[str, List[Dict]] = {}
+        try:
+            for msg in self.iter_incoming(data):
+                if msg["from"] and msg["text"]:
+                    grouped.setdefault(msg["from"], []).append(msg)
+        except Exception as e:
+            print(f"📱 WhatsApp malformed payload: {e}")
+        for messages in grouped.values():
+            messages.sort(key=lambda m: int(m["timestamp"]) if str(m.get("timestamp", "")).isdigit() else 0)
+        return grouped
+
 
 # Singleton
 whatsapp_service = WhatsAppService()
+
+outbound_dispatcher.register("whatsapp", whatsapp_service._send_part, ChannelLimits(
+    max_chars=MAX_MESSAGE_CHARS,
+    global_rps=settings.outbound_whatsapp_rps,
+    global_burst=settings.outbound_whatsapp_rps,
+    chat_rps=settings.outbound_whatsapp_chat_rps,
+    chat_burst=settings.outbound_whatsapp_chat_burst,
+))
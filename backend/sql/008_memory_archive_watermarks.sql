@@ -0,0 +1,33 @@
+-- ==========================================================================
+-- Memory Archive Watermarks (incremental summarization)
+-- ==========================================================================
+
+-- One row per user: the newest message already folded into memory_vault.
+-- summarize_and_archive only reads messages after this point.
+CREATE TABLE IF NOT EXISTS memory_archive_state (
+    user_id UUID PRIMARY KEY REFERENCES user_profiles(id) ON DELETE CASCADE,
+    last_message_id UUID,
+    last_archived_at TIMESTAMPTZ,
+    archived_count INT DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+ALTER TABLE memory_archive_state ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "service_role_memory_archive_state" ON memory_archive_state;
+CREATE POLICY "service_role_memory_archive_state" ON memory_archive_state
+    FOR ALL TO service_role USING (true);
+
+DROP TRIGGER IF EXISTS memory_archive_state_updated_at ON memory_archive_state;
+CREATE TRIGGER memory_archive_state_updated_at
+    BEFORE UPDATE ON memory_archive_state
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at();
+
+-- Range scans "messages of these conversations after the watermark"
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created
+    ON messages(conversation_id, created_at);
+
+-- Archives spanning several channels are stored as 'mixed'
+ALTER TABLE memory_vault DROP CONSTRAINT IF EXISTS memory_vault_source_channel_check;
+ALTER TABLE memory_vault ADD CONSTRAINT memory_vault_source_channel_check
+    CHECK (source_channel IN ('pwa', 'telegram', 'whatsapp', 'mixed'));
@@ -0,0 +1,98 @@
+-- ==========================================================================
+-- Background Jobs (durable in-process queue)
+-- ==========================================================================
+
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    kind TEXT NOT NULL,
+    payload JSONB DEFAULT '{}',
+    dedupe_key TEXT,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    user_id UUID,
+    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'succeeded', 'failed')),
+    attempts INT DEFAULT 0,
+    max_attempts INT DEFAULT 5,
+    run_after TIMESTAMPTZ DEFAULT now(),
+    locked_by TEXT,
+    locked_at TIMESTAMPTZ,
+    last_error TEXT,
+    result JSONB,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Only one live (pending/running) job per dedupe key
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe_live ON jobs(dedupe_key)
+    WHERE dedupe_key IS NOT NULL AND status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS idx_jobs_tenant ON jobs(tenant_id);
+
+ALTER TABLE jobs ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "service_role_jobs" ON jobs;
+CREATE POLICY "service_role_jobs" ON jobs
+    FOR ALL TO service_role USING (true);
+
+DROP TRIGGER IF EXISTS jobs_updated_at ON jobs;
+CREATE TRIGGER jobs_updated_at
+    BEFORE UPDATE ON jobs
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at();
+
+-- Atomically claim ready jobs (SKIP LOCKED so several workers can poll).
+-- Jobs stuck in 'running' longer than p_stale_after_s are reclaimed.
+CREATE OR REPLACE FUNCTION claim_jobs(
+    p_worker TEXT,
+    p_limit INT DEFAULT 1,
+    p_kinds TEXT[] DEFAULT NULL,
+    p_stale_after_s INT DEFAULT 600
+)
+RETURNS SETOF jobs AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE jobs j
+    SET status = 'running',
+        locked_by = p_worker,
+        locked_at = now(),
+        attempts = j.attempts + 1
+    WHERE j.id IN (
+        SELECT q.id FROM jobs q
+        WHERE (
+                (q.status = 'pending' AND q.run_after <= now())
+                OR (q.status = 'running' AND q.locked_at < now() - make_interval(secs => p_stale_after_s))
+            )
+            AND (p_kinds IS NULL OR q.kind = ANY(p_kinds))
+        ORDER BY q.run_after
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Users with at least p_min_messages messages past their archive watermark
+CREATE OR REPLACE FUNCTION users_pending_archive(
+    p_min_messages INT DEFAULT 30,
+    p_limit INT DEFAULT 500
+)
+RETURNS TABLE (
+    user_id UUID,
+    pending_messages BIGINT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT c.user_id, COUNT(*) AS pending_messages
+    FROM messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    LEFT JOIN memory_archive_state s ON s.user_id = c.user_id
+    WHERE c.user_id IS NOT NULL
+        AND (s.last_archived_at IS NULL OR m.created_at > s.last_archived_at)
+    GROUP BY c.user_id
+    HAVING COUNT(*) >= p_min_messages
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT EXECUTE ON FUNCTION claim_jobs TO service_role;
+GRANT EXECUTE ON FUNCTION users_pending_archive TO service_role;
@@ -0,0 +1,22 @@
+-- ==========================================================================
+-- Embedding Cache (persistent tier)
+-- ==========================================================================
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- key = sha256(model | task_type | dims | text)
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dims INT NOT NULL,
+    embedding VECTOR NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON embedding_cache(created_at);
+
+ALTER TABLE embedding_cache ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "service_role_embedding_cache" ON embedding_cache;
+CREATE POLICY "service_role_embedding_cache" ON embedding_cache
+    FOR ALL TO service_role USING (true);
@@ -0,0 +1,30 @@
+-- ==========================================================================
+-- Inbound webhook events (dedupe by provider message id)
+-- ==========================================================================
+
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+CREATE TABLE IF NOT EXISTS inbound_events (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    channel TEXT NOT NULL,
+    provider_message_id TEXT NOT NULL,
+    sender_id TEXT NOT NULL,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    user_id UUID,
+    payload JSONB DEFAULT '{}',
+    status TEXT DEFAULT 'received' CHECK (status IN ('received', 'processing', 'processed', 'failed')),
+    last_error TEXT,
+    received_at TIMESTAMPTZ DEFAULT now(),
+    processed_at TIMESTAMPTZ,
+    -- Meta / Telegram redeliveries of the same message hit this constraint
+    UNIQUE (channel, provider_message_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_inbound_events_pending
+    ON inbound_events(received_at) WHERE status = 'received';
+
+ALTER TABLE inbound_events ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "service_role_inbound_events" ON inbound_events;
+CREATE POLICY "service_role_inbound_events" ON inbound_events
+    FOR ALL TO service_role USING (true);
@@ -0,0 +1,34 @@
+-- ==========================================================================
+-- Chat task state (shared by every worker / replica for SSE progress)
+-- ==========================================================================
+
+CREATE TABLE IF NOT EXISTS chat_tasks (
+    id TEXT PRIMARY KEY,
+    user_id UUID,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'active',
+    state JSONB NOT NULL DEFAULT '{}',
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_tasks_expires ON chat_tasks(expires_at);
+
+ALTER TABLE chat_tasks ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "service_role_chat_tasks" ON chat_tasks;
+CREATE POLICY "service_role_chat_tasks" ON chat_tasks
+    FOR ALL TO service_role USING (true);
+
+-- Listeners (LISTEN chat_tasks / Supabase Realtime) get the task id on every change
+CREATE OR REPLACE FUNCTION notify_chat_task() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('chat_tasks', NEW.id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS chat_tasks_notify ON chat_tasks;
+CREATE TRIGGER chat_tasks_notify
+    AFTER INSERT OR UPDATE ON chat_tasks
+    FOR EACH ROW EXECUTE FUNCTION notify_chat_task();
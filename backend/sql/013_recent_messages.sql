@@ -0,0 +1,77 @@
+-- ==========================================================================
+-- Recent messages per user (context window + incremental archive)
+-- ==========================================================================
+
+-- Both functions walk the user's conversations (idx_conversations_user) and
+-- take at most p_limit rows from each one through
+-- idx_messages_conversation_created, so the cost is bounded by
+-- conversations x p_limit index reads instead of the user's full history.
+
+-- Newest first; pass the oldest created_at of a page as p_before for the next one
+CREATE OR REPLACE FUNCTION recent_user_messages(
+    p_user_id UUID,
+    p_limit INT DEFAULT 20,
+    p_before TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    conversation_id UUID,
+    channel TEXT,
+    role TEXT,
+    content TEXT,
+    metadata JSONB,
+    created_at TIMESTAMPTZ
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT m.id, c.id, c.channel, m.role, m.content, m.metadata, m.created_at
+    FROM conversations c
+    CROSS JOIN LATERAL (
+        SELECT mm.id, mm.role, mm.content, mm.metadata, mm.created_at
+        FROM messages mm
+        WHERE mm.conversation_id = c.id
+            AND (p_before IS NULL OR mm.created_at < p_before)
+        ORDER BY mm.created_at DESC
+        LIMIT p_limit
+    ) m
+    WHERE c.user_id = p_user_id
+    ORDER BY m.created_at DESC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Oldest first, strictly after p_after (archive watermark)
+CREATE OR REPLACE FUNCTION user_messages_since(
+    p_user_id UUID,
+    p_after TIMESTAMPTZ DEFAULT NULL,
+    p_limit INT DEFAULT 200
+)
+RETURNS TABLE (
+    id UUID,
+    conversation_id UUID,
+    channel TEXT,
+    role TEXT,
+    content TEXT,
+    metadata JSONB,
+    created_at TIMESTAMPTZ
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT m.id, c.id, c.channel, m.role, m.content, m.metadata, m.created_at
+    FROM conversations c
+    CROSS JOIN LATERAL (
+        SELECT mm.id, mm.role, mm.content, mm.metadata, mm.created_at
+        FROM messages mm
+        WHERE mm.conversation_id = c.id
+            AND (p_after IS NULL OR mm.created_at > p_after)
+        ORDER BY mm.created_at ASC
+        LIMIT p_limit
+    ) m
+    WHERE c.user_id = p_user_id
+    ORDER BY m.created_at ASC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- 004 only creates this index when it adds the column
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations(user_id);
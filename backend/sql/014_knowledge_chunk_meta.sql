@@ -0,0 +1,12 @@
+-- ==========================================================================
+-- Knowledge chunk metadata (structure-aware chunking engine)
+-- ==========================================================================
+
+-- Chunk ids are now deterministic (uuid5 of source + content hash + occurrence);
+-- content_hash is whitespace-insensitive sha256 of chunk_text.
+ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS token_count INT;
+ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS heading TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_chunks_source_hash
+    ON knowledge_chunks(source_id, content_hash);
@@ -0,0 +1,20 @@
+-- ==========================================================================
+-- Content-addressed knowledge sources (dedupe + incremental re-ingestion)
+-- ==========================================================================
+
+-- file_hash: sha256 of the uploaded bytes (identical re-uploads are skipped)
+-- source_key: normalized filename; a re-upload under the same key updates
+-- the existing source in place, touching only the chunks that changed.
+-- The backfill mirrors ingestion.source_key: whitespace runs collapse to
+-- one space, then lowercase.
+ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS file_hash TEXT;
+ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS source_key TEXT;
+ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now();
+
+UPDATE knowledge_sources SET source_key = lower(regexp_replace(trim(title), '\s+', ' ', 'g'))
+    WHERE source_key IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_sources_file_hash
+    ON knowledge_sources(tenant_id, file_hash);
+CREATE INDEX IF NOT EXISTS idx_knowledge_sources_key
+    ON knowledge_sources(tenant_id, source_key);
@@ -0,0 +1,90 @@
+-- ==========================================================================
+-- Hybrid knowledge search (full-text + pgvector, reciprocal rank fusion)
+-- ==========================================================================
+
+-- 'simple' keeps product codes, names and procedure terms verbatim (no
+-- stemming or stop words); the vector side covers paraphrases.
+ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS chunk_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(heading, '') || ' ' || chunk_text)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_chunks_tsv
+    ON knowledge_chunks USING GIN (chunk_tsv);
+
+-- Each side ranks its own top p_candidates; a chunk scores
+-- sum(weight / (p_rrf_k + rank)) over the sides it appears in.
+-- Query terms are OR-ed so long questions still match partially;
+-- ts_rank_cd rewards chunks that cover more of them.
+CREATE OR REPLACE FUNCTION search_knowledge_hybrid(
+    p_tenant_id UUID,
+    p_query_text TEXT,
+    p_query_embedding VECTOR(1536) DEFAULT NULL,
+    p_limit INT DEFAULT 5,
+    p_candidates INT DEFAULT 50,
+    p_rrf_k INT DEFAULT 60,
+    p_vector_weight REAL DEFAULT 1.0,
+    p_lexical_weight REAL DEFAULT 1.0
+)
+RETURNS TABLE (
+    id UUID,
+    source_id UUID,
+    chunk_text TEXT,
+    heading TEXT,
+    similarity REAL,
+    lexical_score REAL,
+    vector_rank INT,
+    lexical_rank INT,
+    score REAL
+) AS $$
+DECLARE
+    v_query TSQUERY;
+BEGIN
+    SELECT to_tsquery('simple', string_agg(quote_literal(lexeme), ' | '))
+    INTO v_query
+    FROM unnest(tsvector_to_array(to_tsvector('simple', coalesce(p_query_text, '')))) AS lexeme;
+
+    RETURN QUERY
+    WITH vector_hits AS (
+        SELECT
+            kc.id,
+            (1 - (kc.embedding <=> p_query_embedding))::REAL AS similarity,
+            ROW_NUMBER() OVER (ORDER BY kc.embedding <=> p_query_embedding)::INT AS rank
+        FROM knowledge_chunks kc
+        WHERE p_query_embedding IS NOT NULL
+            AND p_vector_weight > 0
+            AND kc.tenant_id = p_tenant_id
+            AND kc.embedding IS NOT NULL
+        ORDER BY kc.embedding <=> p_query_embedding
+        LIMIT p_candidates
+    ),
+    lexical_hits AS (
+        SELECT
+            kc.id,
+            ts_rank_cd(kc.chunk_tsv, v_query)::REAL AS lexical_score,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(kc.chunk_tsv, v_query) DESC)::INT AS rank
+        FROM knowledge_chunks kc
+        WHERE v_query IS NOT NULL
+            AND kc.tenant_id = p_tenant_id
+            AND kc.chunk_tsv @@ v_query
+        ORDER BY ts_rank_cd(kc.chunk_tsv, v_query) DESC
+        LIMIT p_candidates
+    ),
+    fused AS (
+        SELECT
+            coalesce(v.id, l.id) AS id,
+            v.similarity,
+            l.lexical_score,
+            v.rank AS vector_rank,
+            l.rank AS lexical_rank,
+            (coalesce(p_vector_weight / (p_rrf_k + v.rank), 0)
+                + coalesce(p_lexical_weight / (p_rrf_k + l.rank), 0))::REAL AS score
+        FROM vector_hits v
+        FULL OUTER JOIN lexical_hits l ON l.id = v.id
+    )
+    SELECT kc.id, kc.source_id, kc.chunk_text, kc.heading,
+           f.similarity, f.lexical_score, f.vector_rank, f.lexical_rank, f.score
+    FROM fused f
+    JOIN knowledge_chunks kc ON kc.id = f.id
+    ORDER BY f.score DESC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
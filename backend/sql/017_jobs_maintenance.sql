@@ -0,0 +1,53 @@
+-- ==========================================================================
+-- Jobs: heartbeats and retention
+-- ==========================================================================
+
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS finished_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at)
+    WHERE status IN ('succeeded', 'failed');
+
+-- Workers refresh locked_at on the jobs they are running, so claim_jobs
+-- only reclaims jobs whose worker stopped heartbeating (crashed/killed).
+CREATE OR REPLACE FUNCTION heartbeat_jobs(
+    p_worker TEXT,
+    p_ids UUID[]
+)
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    UPDATE jobs
+    SET locked_at = now()
+    WHERE id = ANY(p_ids)
+        AND locked_by = p_worker
+        AND status = 'running';
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Delete finished jobs older than p_older_than_s, at most p_limit per call
+-- (callers loop) so one sweep never holds a long lock.
+CREATE OR REPLACE FUNCTION purge_finished_jobs(
+    p_older_than_s INT DEFAULT 604800,
+    p_limit INT DEFAULT 5000
+)
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    DELETE FROM jobs
+    WHERE id IN (
+        SELECT q.id FROM jobs q
+        WHERE q.status IN ('succeeded', 'failed')
+            AND coalesce(q.finished_at, q.updated_at) < now() - make_interval(secs => p_older_than_s)
+        LIMIT p_limit
+    );
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT EXECUTE ON FUNCTION heartbeat_jobs TO service_role;
+GRANT EXECUTE ON FUNCTION purge_finished_jobs TO service_role;
@@ -0,0 +1,71 @@
+-- ==========================================================================
+-- Inbound events: ownership, heartbeats and recovery claims
+-- ==========================================================================
+
+-- The worker that ACKed (or reclaimed) an event owns it and refreshes
+-- locked_at while the event waits in its lane or is being processed.
+ALTER TABLE inbound_events ADD COLUMN IF NOT EXISTS locked_by TEXT;
+ALTER TABLE inbound_events ADD COLUMN IF NOT EXISTS locked_at TIMESTAMPTZ;
+ALTER TABLE inbound_events ADD COLUMN IF NOT EXISTS attempts INT DEFAULT 0;
+
+DROP INDEX IF EXISTS idx_inbound_events_pending;
+CREATE INDEX IF NOT EXISTS idx_inbound_events_pending
+    ON inbound_events(received_at) WHERE status IN ('received', 'processing');
+
+CREATE OR REPLACE FUNCTION heartbeat_inbound_events(
+    p_worker TEXT,
+    p_ids UUID[]
+)
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    UPDATE inbound_events
+    SET locked_at = now()
+    WHERE id = ANY(p_ids)
+        AND locked_by = p_worker
+        AND status IN ('received', 'processing');
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Atomically take over unfinished events whose owner stopped heartbeating
+-- (crash, deploy) or that never had one. SKIP LOCKED lets every replica
+-- sweep concurrently without two of them claiming the same row.
+-- Events that already took down p_max_attempts workers are failed instead.
+CREATE OR REPLACE FUNCTION claim_inbound_events(
+    p_worker TEXT,
+    p_limit INT DEFAULT 200,
+    p_stale_after_s INT DEFAULT 120,
+    p_max_attempts INT DEFAULT 3
+)
+RETURNS SETOF inbound_events AS $$
+BEGIN
+    UPDATE inbound_events e
+    SET status = 'failed',
+        last_error = 'abandoned after ' || e.attempts || ' attempts',
+        processed_at = now()
+    WHERE e.status IN ('received', 'processing')
+        AND e.attempts >= p_max_attempts
+        AND (e.locked_at IS NULL OR e.locked_at < now() - make_interval(secs => p_stale_after_s));
+
+    RETURN QUERY
+    UPDATE inbound_events e
+    SET locked_by = p_worker,
+        locked_at = now(),
+        attempts = e.attempts + 1
+    WHERE e.id IN (
+        SELECT q.id FROM inbound_events q
+        WHERE q.status IN ('received', 'processing')
+            AND (q.locked_at IS NULL OR q.locked_at < now() - make_interval(secs => p_stale_after_s))
+        ORDER BY q.received_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING e.*;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT EXECUTE ON FUNCTION heartbeat_inbound_events TO service_role;
+GRANT EXECUTE ON FUNCTION claim_inbound_events TO service_role;
@@ -0,0 +1,99 @@
+-- ==========================================================================
+-- Hybrid knowledge search: drop stop words from the lexical query
+-- ==========================================================================
+
+-- 'simple' has no stop-word list, so OR-ing every lexeme of a question let
+-- 'la', 'de', 'que' match nearly every chunk. Words are kept when they look
+-- like codes (contain a digit, or are written as 2-6 capitals: 'RX', 'IV')
+-- or when neither the Spanish nor the English config treats them as stop
+-- words. Lexemes stay in 'simple' form to match chunk_tsv.
+-- STABLE, not IMMUTABLE: the result depends on the text search
+-- configurations and dictionaries, which can change between sessions.
+CREATE OR REPLACE FUNCTION knowledge_lexical_query(p_query_text TEXT)
+RETURNS TSQUERY AS $$
+    WITH terms AS (
+        SELECT lexeme
+        FROM unnest(tsvector_to_array(to_tsvector('simple', coalesce(p_query_text, '')))) AS lexeme
+        WHERE lexeme ~ '[0-9]'
+            OR (length(lexeme) > 2
+                AND to_tsvector('spanish', lexeme) <> ''::tsvector
+                AND to_tsvector('english', lexeme) <> ''::tsvector)
+        UNION
+        SELECT lower(m[1])
+        FROM regexp_matches(coalesce(p_query_text, ''), '\m([A-Z]{2,6})\M', 'g') AS m
+    )
+    SELECT to_tsquery('simple', string_agg(quote_literal(lexeme), ' | ')) FROM terms;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION search_knowledge_hybrid(
+    p_tenant_id UUID,
+    p_query_text TEXT,
+    p_query_embedding VECTOR(1536) DEFAULT NULL,
+    p_limit INT DEFAULT 5,
+    p_candidates INT DEFAULT 50,
+    p_rrf_k INT DEFAULT 60,
+    p_vector_weight REAL DEFAULT 1.0,
+    p_lexical_weight REAL DEFAULT 1.0
+)
+RETURNS TABLE (
+    id UUID,
+    source_id UUID,
+    chunk_text TEXT,
+    heading TEXT,
+    similarity REAL,
+    lexical_score REAL,
+    vector_rank INT,
+    lexical_rank INT,
+    score REAL
+) AS $$
+DECLARE
+    v_query TSQUERY := knowledge_lexical_query(p_query_text);
+BEGIN
+    RETURN QUERY
+    WITH vector_hits AS (
+        SELECT
+            kc.id,
+            (1 - (kc.embedding <=> p_query_embedding))::REAL AS similarity,
+            ROW_NUMBER() OVER (ORDER BY kc.embedding <=> p_query_embedding)::INT AS rank
+        FROM knowledge_chunks kc
+        WHERE p_query_embedding IS NOT NULL
+            AND p_vector_weight > 0
+            AND kc.tenant_id = p_tenant_id
+            AND kc.embedding IS NOT NULL
+        ORDER BY kc.embedding <=> p_query_embedding
+        LIMIT p_candidates
+    ),
+    lexical_hits AS (
+        SELECT
+            kc.id,
+            ts_rank_cd(kc.chunk_tsv, v_query)::REAL AS lexical_score,
+            ROW_NUMBER() OVER (ORDER BY ts_rank_cd(kc.chunk_tsv, v_query) DESC)::INT AS rank
+        FROM knowledge_chunks kc
+        WHERE v_query IS NOT NULL
+            AND kc.tenant_id = p_tenant_id
+            AND kc.chunk_tsv @@ v_query
+        ORDER BY ts_rank_cd(kc.chunk_tsv, v_query) DESC
+        LIMIT p_candidates
+    ),
+    fused AS (
+        SELECT
+            coalesce(v.id, l.id) AS id,
+            v.similarity,
+            l.lexical_score,
+            v.rank AS vector_rank,
+            l.rank AS lexical_rank,
+            (coalesce(p_vector_weight / (p_rrf_k + v.rank), 0)
+                + coalesce(p_lexical_weight / (p_rrf_k + l.rank), 0))::REAL AS score
+        FROM vector_hits v
+        FULL OUTER JOIN lexical_hits l ON l.id = v.id
+    )
+    SELECT kc.id, kc.source_id, kc.chunk_text, kc.heading,
+           f.similarity, f.lexical_score, f.vector_rank, f.lexical_rank, f.score
+    FROM fused f
+    JOIN knowledge_chunks kc ON kc.id = f.id
+    ORDER BY f.score DESC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT EXECUTE ON FUNCTION knowledge_lexical_query TO service_role;
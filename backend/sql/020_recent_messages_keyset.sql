@@ -0,0 +1,45 @@
+-- ==========================================================================
+-- Recent messages: (created_at, id) keyset paging
+-- ==========================================================================
+
+-- Paging on created_at alone skipped messages sharing the boundary
+-- timestamp. The cursor is now the (created_at, id) of the oldest message
+-- of a page; p_before without p_before_id keeps the old strict behaviour.
+DROP FUNCTION IF EXISTS recent_user_messages(UUID, INT, TIMESTAMPTZ);
+
+CREATE OR REPLACE FUNCTION recent_user_messages(
+    p_user_id UUID,
+    p_limit INT DEFAULT 20,
+    p_before TIMESTAMPTZ DEFAULT NULL,
+    p_before_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    conversation_id UUID,
+    channel TEXT,
+    role TEXT,
+    content TEXT,
+    metadata JSONB,
+    created_at TIMESTAMPTZ
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT m.id, c.id, c.channel, m.role, m.content, m.metadata, m.created_at
+    FROM conversations c
+    CROSS JOIN LATERAL (
+        SELECT mm.id, mm.role, mm.content, mm.metadata, mm.created_at
+        FROM messages mm
+        WHERE mm.conversation_id = c.id
+            AND (
+                p_before IS NULL
+                OR (p_before_id IS NULL AND mm.created_at < p_before)
+                OR (p_before_id IS NOT NULL AND (mm.created_at, mm.id) < (p_before, p_before_id))
+            )
+        ORDER BY mm.created_at DESC, mm.id DESC
+        LIMIT p_limit
+    ) m
+    WHERE c.user_id = p_user_id
+    ORDER BY m.created_at DESC, m.id DESC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
@@ -0,0 +1,10 @@
+-- ==========================================================================
+-- Chat tasks: keep updated_at current
+-- ==========================================================================
+
+-- The store upserts task state; ON CONFLICT DO UPDATE fires BEFORE UPDATE
+-- triggers, so updated_at now tracks the last step instead of creation.
+DROP TRIGGER IF EXISTS chat_tasks_updated_at ON chat_tasks;
+CREATE TRIGGER chat_tasks_updated_at
+    BEFORE UPDATE ON chat_tasks
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at();
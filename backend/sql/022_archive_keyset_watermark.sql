@@ -0,0 +1,75 @@
+-- ==========================================================================
+-- Memory archive: (created_at, id) watermark
+-- ==========================================================================
+
+-- Filtering on created_at > last_archived_at skipped messages sharing the
+-- last archived timestamp that fell past the ARCHIVE_WINDOW_MESSAGES cut.
+-- The watermark is now (last_archived_at, last_message_id), both already
+-- stored in memory_archive_state; p_after without p_after_id keeps the old
+-- strict behaviour.
+DROP FUNCTION IF EXISTS user_messages_since(UUID, TIMESTAMPTZ, INT);
+
+CREATE OR REPLACE FUNCTION user_messages_since(
+    p_user_id UUID,
+    p_after TIMESTAMPTZ DEFAULT NULL,
+    p_limit INT DEFAULT 200,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    conversation_id UUID,
+    channel TEXT,
+    role TEXT,
+    content TEXT,
+    metadata JSONB,
+    created_at TIMESTAMPTZ
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT m.id, c.id, c.channel, m.role, m.content, m.metadata, m.created_at
+    FROM conversations c
+    CROSS JOIN LATERAL (
+        SELECT mm.id, mm.role, mm.content, mm.metadata, mm.created_at
+        FROM messages mm
+        WHERE mm.conversation_id = c.id
+            AND (
+                p_after IS NULL
+                OR (p_after_id IS NULL AND mm.created_at > p_after)
+                OR (p_after_id IS NOT NULL AND (mm.created_at, mm.id) > (p_after, p_after_id))
+            )
+        ORDER BY mm.created_at ASC, mm.id ASC
+        LIMIT p_limit
+    ) m
+    WHERE c.user_id = p_user_id
+    ORDER BY m.created_at ASC, m.id ASC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Same watermark when picking users to archive
+CREATE OR REPLACE FUNCTION users_pending_archive(
+    p_min_messages INT DEFAULT 30,
+    p_limit INT DEFAULT 500
+)
+RETURNS TABLE (
+    user_id UUID,
+    pending_messages BIGINT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT c.user_id, COUNT(*) AS pending_messages
+    FROM messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    LEFT JOIN memory_archive_state s ON s.user_id = c.user_id
+    WHERE c.user_id IS NOT NULL
+        AND (
+            s.last_archived_at IS NULL
+            OR (s.last_message_id IS NULL AND m.created_at > s.last_archived_at)
+            OR (s.last_message_id IS NOT NULL
+                AND (m.created_at, m.id) > (s.last_archived_at, s.last_message_id))
+        )
+    GROUP BY c.user_id
+    HAVING COUNT(*) >= p_min_messages
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
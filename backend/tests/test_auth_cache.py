@@ -0,0 +1,64 @@
+import asyncio
+import base64
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from jose import jwk, jwt
+
+from core.auth_cache import InvalidToken, JWKSVerifier
+from core.config import settings
+
+
+def _b64(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+
+@pytest.fixture
+def verifier(monkeypatch):
+    monkeypatch.setattr(settings, "supabase_url", "https://project.supabase.co")
+    private = ec.generate_private_key(ec.SECP256R1())
+    public_pem = private.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    public = jwk.construct(public_pem, "ES256").to_dict()
+    public.pop("alg", None)  # Supabase JWKs may omit alg: pinned from kty
+    public["kid"] = "k1"
+    verifier = JWKSVerifier()
+    verifier._keys = {"k1": public}
+    verifier._fetched_at = time.monotonic()
+    private_pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    return verifier, private_pem
+
+
+def test_valid_token_verifies(verifier):
+    verifier, private_pem = verifier
+    token = jwt.encode(
+        {"sub": "user-1", "aud": "authenticated", "exp": time.time() + 60},
+        private_pem, algorithm="ES256", headers={"kid": "k1"},
+    )
+    assert asyncio.run(verifier.verify(token))["sub"] == "user-1"
+
+
+@pytest.mark.parametrize("alg", ["none", "RS256", "HS256", "HS512"])
+def test_header_algorithm_is_not_trusted(verifier, monkeypatch, alg):
+    verifier, _ = verifier
+    monkeypatch.setattr(settings, "supabase_jwt_secret", "")
+    token = f"{_b64({'alg': alg, 'kid': 'k1'})}.{_b64({'sub': 'attacker'})}."
+    result = None
+    try:
+        result = asyncio.run(verifier.verify(token))
+    except InvalidToken:
+        return
+    # HS256 without a configured secret: no local key, caller falls back to Supabase Auth
+    assert alg == "HS256" and result is None
+
+
+def test_malformed_token_is_invalid(verifier):
+    verifier, _ = verifier
+    with pytest.raises(InvalidToken):
+        asyncio.run(verifier.verify("not-a-jwt"))
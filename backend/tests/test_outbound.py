@@ -0,0 +1,70 @@
+import random
+import re
+
+import pytest
+
+from services.outbound import _HTML_TOKEN, _open_tags, split_html, split_message
+
+
+def _plain(html: str) -> str:
+    return re.sub(r"\s+", "", _HTML_TOKEN.sub("", html))
+
+
+def _assert_well_formed(parts, limit):
+    for part in parts:
+        assert len(part) <= limit
+        # Nothing left open, and no tag or entity cut in half
+        assert not _open_tags(part)
+        leftover = _HTML_TOKEN.sub("", part)
+        assert "<" not in leftover and ">" not in leftover
+        assert not re.search(r"&#?\w*$", leftover)
+
+
+def test_split_message_prefers_paragraphs():
+    text = "uno dos tres.\n\ncuatro cinco seis siete."
+    assert split_message(text, 30) == ["uno dos tres.", "cuatro cinco seis siete."]
+
+
+def test_split_message_hard_cuts_long_words():
+    parts = split_message("x" * 25, 10)
+    assert parts == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_split_html_short_text_untouched():
+    assert split_html("<b>hola</b> mundo", 4096) == ["<b>hola</b> mundo"]
+
+
+def test_split_html_reopens_tags_across_parts():
+    text = "<b>" + "palabra " * 12 + "</b> y <a href=\"https://x.io\">enlace</a>"
+    parts = split_html(text, 40)
+    _assert_well_formed(parts, 40)
+    assert all(part.startswith("<b>") for part in parts[:-1])
+    assert _plain("".join(parts)) == _plain(text)
+
+
+def test_split_html_never_cuts_entities():
+    text = " ".join(["&amp;&lt;x&gt;"] * 40)
+    parts = split_html(text, 30)
+    _assert_well_formed(parts, 30)
+    assert _plain("".join(parts)) == _plain(text)
+
+
+@pytest.mark.parametrize("limit", [50, 100])
+def test_split_html_unbalanced_llm_markup_terminates(limit):
+    rng = random.Random(limit)
+    pieces = ["<b>", "<i>", "<u>", "</b>", "<a href=\"https://example.com/x\">", "texto", "más texto.", "\n", "&amp;"]
+    for _ in range(200):
+        text = " ".join(rng.choice(pieces) for _ in range(rng.randint(10, 300)))
+        parts = split_html(text, limit)
+        for part in parts:
+            assert len(part) <= limit
+            leftover = _HTML_TOKEN.sub("", part)
+            assert "<" not in leftover and ">" not in leftover
+        assert _plain(_HTML_TOKEN.sub("", "".join(parts))) == _plain(_HTML_TOKEN.sub("", text))
+
+
+def test_split_html_deep_nesting_falls_back_to_plain_text():
+    text = "<b><i><u><s><code>" + "<a href=\"https://example.com/a/long/path\">" + "palabra " * 40
+    parts = split_html(text, 50)
+    assert all(len(part) <= 50 for part in parts)
+    assert "palabra" in parts[-1] and "<" not in parts[-1]
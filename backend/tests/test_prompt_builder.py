@@ -0,0 +1,45 @@
+from services.intelligence import AIProvider
+from services.prompt_builder import PromptSection, build_prompt, chars_per_token, estimate_tokens
+
+
+def test_chars_per_token_accepts_provider_enum():
+    assert chars_per_token([AIProvider.GEMINI]) == chars_per_token(["gemini"]) == 4.0
+    assert chars_per_token([AIProvider.GEMINI, AIProvider.MISTRAL]) == 3.4
+
+
+def test_estimate_uses_densest_provider():
+    text = "x" * 400
+    assert estimate_tokens(text, [AIProvider.GEMINI]) == 100
+    assert estimate_tokens(text, [AIProvider.GEMINI, AIProvider.GROQ]) == 112
+
+
+def test_budget_applies_per_provider():
+    providers = [p.value for p in (AIProvider.GEMINI,)]
+    prompt, report = build_prompt(
+        [PromptSection("message", "hola " * 200, priority=1, keep="ends")],
+        budget_tokens=100,
+        providers=providers,
+    )
+    assert report["chars_per_token"] == 4.0
+    assert report["sections"]["message"]["truncated"]
+    assert estimate_tokens(prompt, providers) <= 100
+
+
+def test_separators_count_against_budget():
+    providers = ["gemini"]
+    sections = [PromptSection(f"s{i}", "x" * 40, priority=i) for i in range(4)]
+    prompt, report = build_prompt(sections, budget_tokens=40, providers=providers)
+    assert estimate_tokens(prompt, providers) <= 40
+    assert report["total"] <= 40
+    assert report["sections"]["s3"]["truncated"]
+
+
+def test_headers_count_against_budget():
+    providers = ["gemini"]
+    sections = [
+        PromptSection(f"s{i}", "x" * 38, priority=i, header="[h]\n", min_tokens=1)
+        for i in range(8)
+    ]
+    prompt, report = build_prompt(sections, budget_tokens=60, providers=providers)
+    assert estimate_tokens(prompt, providers) <= 60
+    assert prompt.count("[h]") >= 2
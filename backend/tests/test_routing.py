@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from core.config import settings
+from services import routing
+from services.routing import ProviderRouter
+
+
+def _http_error(status: int, headers=None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://llm.test/v1")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(routing, "time", SimpleNamespace(monotonic=lambda: now.value))
+    monkeypatch.setattr(settings, "llm_breaker_failures", 3)
+    monkeypatch.setattr(settings, "llm_breaker_cooldown_s", 30.0)
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    router = ProviderRouter()
+    for _ in range(2):
+        router.record_failure("groq", _http_error(500))
+    assert router.health("groq").state(clock.value) == "closed"
+    router.record_failure("groq", _http_error(500))
+    assert router.health("groq").state(clock.value) == "open"
+    assert router.rank(["groq", "gemini"]) == ["gemini", "groq"]
+
+
+def test_half_open_lets_one_probe_through(clock):
+    router = ProviderRouter()
+    for _ in range(3):
+        router.record_failure("groq", _http_error(502))
+    clock.value += 31
+    health = router.health("groq")
+    assert health.state(clock.value) == "half_open"
+    assert health.available(clock.value)
+
+    router.begin("groq")
+    assert not health.available(clock.value)
+    router.abandon("groq")
+    assert health.available(clock.value)
+
+
+def test_probe_success_closes_and_failure_reopens(clock):
+    router = ProviderRouter()
+    for _ in range(3):
+        router.record_failure("groq", _http_error(500))
+    clock.value += 31
+    router.begin("groq")
+    router.record_failure("groq", _http_error(500))
+    assert router.health("groq").state(clock.value) == "open"
+
+    clock.value += 31
+    router.begin("groq")
+    router.record_success("groq", 0.2)
+    assert router.health("groq").state(clock.value) == "closed"
+    assert router.health("groq").available(clock.value)
+
+
+def test_auth_failure_opens_immediately_for_longer(clock):
+    router = ProviderRouter()
+    router.record_failure("mistral", _http_error(401))
+    health = router.health("mistral")
+    assert health.state(clock.value) == "open"
+    clock.value += 31
+    assert health.state(clock.value) == "open"
+    clock.value += routing.AUTH_FAILURE_COOLDOWN_S
+    assert health.state(clock.value) == "half_open"
+
+
+def test_rate_limit_is_per_key_until_all_keys_throttled(clock):
+    router = ProviderRouter()
+    router.record_failure("gemini", _http_error(429, {"retry-after": "10"}), key_index=0, key_count=2)
+    health = router.health("gemini")
+    assert health.available(clock.value)
+    assert not router.key_available("gemini", 0)
+    assert router.key_available("gemini", 1)
+
+    router.record_failure("gemini", _http_error(429), key_index=1, key_count=2)
+    assert not health.available(clock.value)
+    assert health.state(clock.value) == "closed"
+    clock.value += 11
+    assert health.available(clock.value)
+    assert router.key_available("gemini", 0)
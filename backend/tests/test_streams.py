@@ -0,0 +1,58 @@
+import asyncio
+
+from core.config import settings
+from services.streams import TaskStream, format_event_id, parse_event_id
+
+
+async def _collect(stream: TaskStream, after_seq: int = 0):
+    return [item async for item in stream.follow(after_seq)]
+
+
+def test_event_id_round_trip():
+    assert parse_event_id(format_event_id("task:1", 7)) == ("task:1", 7)
+    assert parse_event_id("task-1") is None
+    assert parse_event_id("task:x") is None
+
+
+def test_follow_replays_after_cursor():
+    async def scenario():
+        stream = TaskStream("t", "u")
+        for text in ("a", "b", "c"):
+            await stream.publish({"type": "delta", "content": text})
+        await stream.finish()
+        return await _collect(stream, after_seq=1)
+
+    events = asyncio.run(scenario())
+    assert [seq for seq, _ in events] == [2, 3]
+
+
+def test_follow_resyncs_when_buffer_dropped_events(monkeypatch):
+    monkeypatch.setattr(settings, "stream_buffer_events", 3)
+
+    async def scenario():
+        stream = TaskStream("t", "u")
+        for text in ("a", "b", "c", "d", "e"):
+            await stream.publish({"type": "delta", "content": text})
+        await stream.finish()
+        return await _collect(stream, after_seq=1)
+
+    events = asyncio.run(scenario())
+    # Event 2 was dropped: the reader gets the text up to event 3, then 3..5
+    assert events[0] == (2, {"type": "resync", "content": "ab"})
+    assert [seq for seq, _ in events[1:]] == [3, 4, 5]
+    resync = events[0][1]["content"]
+    assert resync + "".join(e["content"] for _, e in events[1:]) == "abcde"
+
+
+def test_follow_waits_for_live_events():
+    async def scenario():
+        stream = TaskStream("t", "u")
+        reader = asyncio.create_task(_collect(stream))
+        await asyncio.sleep(0)
+        await stream.publish({"type": "delta", "content": "hola"})
+        await stream.publish({"type": "done"})
+        await stream.finish()
+        return await asyncio.wait_for(reader, 1)
+
+    events = asyncio.run(scenario())
+    assert [event["type"] for _, event in events] == ["delta", "done"]
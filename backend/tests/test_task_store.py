@@ -0,0 +1,19 @@
+import asyncio
+
+from services.task_store import InMemoryTaskStore, TaskManager
+
+
+def test_flush_tasks_are_held_until_done():
+    async def scenario():
+        manager = TaskManager(store=InMemoryTaskStore())
+        manager.create_task("t1", "hola")
+        assert len(manager._flush_tasks) == 1
+        manager.complete_task("t1", "ok")
+        await asyncio.gather(*manager._flush_tasks)
+        await asyncio.sleep(0)
+        assert not manager._flush_tasks
+        stored = await manager.store.load("t1")
+        assert stored["status"] == "complete"
+        assert "t1" not in manager._live
+
+    asyncio.run(scenario())
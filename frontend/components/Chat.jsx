@@ -4,12 +4,15 @@ import ReasoningSteps from './ReasoningSteps';
 import ResponseCard from './ResponseCard';
 import { apiFetch } from '../lib/api';
 
+const MAX_RESUME_ATTEMPTS = 3;
+
 export default function Chat({ onOpenMenu, onNavigate, userId = 'default' }) {
     const [messages, setMessages] = useState([]);
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     const [currentSteps, setCurrentSteps] = useState([]);
     const [isStreaming, setIsStreaming] = useState(false);
+    const [streamingText, setStreamingText] = useState('');
     const [conversationId, setConversationId] = useState(null);
     const messagesEndRef = useRef(null);
     const inputRef = useRef(null);
@@ -20,7 +23,7 @@ export default function Chat({ onOpenMenu, onNavigate, userId = 'default' }) {
 
     useEffect(() => {
         scrollToBottom();
-    }, [messages, currentSteps]);
+    }, [messages, currentSteps, streamingText]);
 
     const sendMessageWithStreaming = async () => {
         if (!input.trim() || isLoading) return;
@@ -35,6 +38,7 @@ export default function Chat({ onOpenMenu, onNavigate, userId = 'default' }) {
         setInput('');
         setIsLoading(true);
         setIsStreaming(true);
+        setStreamingText('');
         setCurrentSteps([
             { number: 1, description: 'Analizando mensaje', status: 'pending' },
             { number: 2, description: 'Procesando contexto', status: 'pending' },
@@ -42,76 +46,120 @@ export default function Chat({ onOpenMenu, onNavigate, userId = 'default' }) {
         ]);
 
         try {
-            const response = await apiFetch('/api/v1/chat/stream', {
-                method: 'POST',
-                body: JSON.stringify({
-                    message: input,
-                    channel: 'pwa',
-                    sender_id: userId,
-                    conversation_id: conversationId
-                })
+            const body = JSON.stringify({
+                message: input,
+                channel: 'pwa',
+                sender_id: userId,
+                conversation_id: conversationId
             });
+            // Events carry `id: <task_id>:<seq>`; after a dropped connection we
+            // resend with Last-Event-ID and the server replays what we missed.
+            let lastEventId = null;
+            let finished = false;
+            let resumeAttempts = 0;
 
-            if (!response.ok) {
-                const errText = await response.text();
-                throw new Error(errText || 'Error de autenticación');
-            }
+            const handleEvent = (data) => {
+                if (data.type === 'step') {
+                    setCurrentSteps(prev => prev.map(step =>
+                        step.number === data.step
+                            ? { ...step, status: data.status, result: data.result }
+                            : step
+                    ));
+                } else if (data.type === 'delta') {
+                    setStreamingText(prev => prev + data.content);
+                } else if (data.type === 'resync') {
+                    setStreamingText(data.content);
+                } else if (data.type === 'complete') {
+                    finished = true;
+                    setIsStreaming(false);
+                    setStreamingText('');
+                    setCurrentSteps([]);
+                    if (data.conversation_id) {
+                        setConversationId(data.conversation_id);
+                    }
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
-
-            while (true) {
-                const { done, value } = await reader.read();
-                if (done) break;
-
-                const text = decoder.decode(value);
-                const lines = text.split('\n').filter(line => line.startsWith('data: '));
-
-                for (const line of lines) {
-                    try {
-                        const data = JSON.parse(line.slice(6));
-
-                        if (data.type === 'step') {
-                            setCurrentSteps(prev => prev.map(step =>
-                                step.number === data.step
-                                    ? { ...step, status: data.status, result: data.result }
-                                    : step
-                            ));
-                        } else if (data.type === 'complete') {
-                            setIsStreaming(false);
-                            setCurrentSteps([]);
-                            if (data.conversation_id) {
-                                setConversationId(data.conversation_id);
-                            }
+                    // Create response message with card support
+                    const assistantMessage = {
+                        role: 'assistant',
+                        content: data.response,
+                        timestamp: new Date(),
+                        card: data.card,
+                        processingTime: data.processing_time_ms,
+                        citations: data.citations || []
+                    };
+
+                    setMessages(prev => [...prev, assistantMessage]);
+                } else if (data.type === 'error') {
+                    finished = true;
+                    setIsStreaming(false);
+                    setStreamingText('');
+                    setCurrentSteps([]);
+                    setMessages(prev => [...prev, {
+                        role: 'assistant',
+                        content: `⚠️ Error: ${data.message}`,
+                        timestamp: new Date(),
+                        error: true,
+                    }]);
+                }
+            };
+
+            while (!finished) {
+                try {
+                    const response = await apiFetch('/api/v1/chat/stream', {
+                        method: 'POST',
+                        headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+                        body,
+                    });
+
+                    if (!response.ok) {
+                        const errText = await response.text();
+                        const err = new Error(errText || 'Error de autenticación');
+                        err.fatal = true;
+                        throw err;
+                    }
+
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
 
-                            // Create response message with card support
-                            const assistantMessage = {
-                                role: 'assistant',
-                                content: data.response,
-                                timestamp: new Date(),
-                                card: data.card,
-                                processingTime: data.processing_time_ms,
-                                citations: data.citations || []
-                            };
-
-                            setMessages(prev => [...prev, assistantMessage]);
-                        } else if (data.type === 'error') {
-                            setIsStreaming(false);
-                            setCurrentSteps([]);
-                            setMessages(prev => [...prev, {
-                                role: 'assistant',
-                                content: `⚠️ Error: ${data.message}`,
-                                timestamp: new Date(),
-                                error: true,
-                            }]);
+                    while (true) {
+                        const { done, value } = await reader.read();
+                        if (done) break;
+
+                        // Events can be split across chunks: keep the trailing partial event
+                        buffer += decoder.decode(value, { stream: true });
+                        const rawEvents = buffer.split('\n\n');
+                        buffer = rawEvents.pop();
+
+                        for (const rawEvent of rawEvents) {
+                            let eventId = null;
+                            let payload = null;
+                            for (const line of rawEvent.split('\n')) {
+                                if (line.startsWith('id: ')) eventId = line.slice(4);
+                                else if (line.startsWith('data: ')) payload = line.slice(6);
+                            }
+                            if (!payload) continue;
+                            try {
+                                handleEvent(JSON.parse(payload));
+                                if (eventId) lastEventId = eventId;
+                            } catch (e) {
+                                console.error('Parse error:', e);
+                            }
                         }
-                    } catch (e) {
-                        console.error('Parse error:', e);
                     }
+                    if (!finished) throw new Error('Stream closed early');
+                } catch (streamError) {
+                    // Nothing to resume yet (or a real error): give up
+                    if (streamError.fatal || !lastEventId || resumeAttempts >= MAX_RESUME_ATTEMPTS) {
+                        throw streamError;
+                    }
+                    resumeAttempts += 1;
+                    await new Promise(resolve => setTimeout(resolve, 1000 * resumeAttempts));
                 }
             }
         } catch (error) {
             setIsStreaming(false);
+            setStreamingText('');
             setCurrentSteps([]);
             setMessages(prev => [...prev, {
                 role: 'assistant',
@@ -213,6 +261,15 @@ export default function Chat({ onOpenMenu, onNavigate, userId = 'default' }) {
                         </div>
                     )}
 
+                    {/* Live token stream */}
+                    {isStreaming && streamingText && (
+                        <div className="zap-message assistant">
+                            <div className="zap-message-content">
+                                {streamingText}
+                            </div>
+                        </div>
+                    )}
+
                     <div ref={messagesEndRef} />
                 </div>
             </div>